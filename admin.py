@@ -1,9 +1,12 @@
 # admin.py
+import hashlib
 import json
 from functools import wraps
 import os
+import re
 from flask import Blueprint, jsonify, render_template, request, flash, redirect, url_for, current_app, abort
 from flask_login import login_required, current_user
+from werkzeug.exceptions import HTTPException
 # Dans auth.py
 from main_routes import secure_filename
 from utils import (
@@ -11,12 +14,18 @@ from utils import (
     update_user, 
     get_all_users, 
     delete_user,
+    sync_users,
+    patch_user,
+    get_users_revisions,
+    get_users_changed_since,
     get_protected_admins,
     generate_recovery_code,
     load_guides_data,
-    supabase
+    cache_utilisateurs,
+    supabase_stockage
 )
 from decorators import check_ip_whitelist
+from registre import registre, TYPES_TRANSACTION
 
 # On crée le Blueprint pour les routes d'administration
 admin = Blueprint('admin', __name__)
@@ -49,6 +58,9 @@ def admin_required(f):
 # =======================================================
 
 
+# Colonnes d'un compte modifiables une à une (PATCH /admin/api/comptes/<email>).
+COLONNES_MODIFIABLES = {'nom', 'role', 'actif'}
+
 # Le nom du bucket que vous avez créé sur Supabase.
 BUCKET_NAME = 'documentation' 
 
@@ -110,14 +122,20 @@ def update_documentation_pdf():
         # (c) Lire le contenu du fichier téléversé en mémoire.
         file_content = file.read()
         
-        # (d) Téléverser le fichier sur Supabase Storage.
+        # (d) Téléverser le fichier sur Supabase Storage (indisponible en mode SQLite local).
+        if supabase_stockage is None:
+            flash("Le stockage de la documentation n'est pas configuré : le document ne peut pas être mis à jour.", "error")
+            return redirect(redirect_url)
         # `upsert: true` est la clé : il remplace le fichier s'il existe déjà.
-        supabase.storage.from_(BUCKET_NAME).upload(
+        supabase_stockage.storage.from_(BUCKET_NAME).upload(
             path=path_in_bucket,
             file=file_content,
             file_options={"content-type": "application/pdf", "upsert": "true"}
         )
 
+        # La documentation a changé : le registre relira guides.json à la prochaine lecture.
+        registre.invalider()
+
         # --- Étape 5 : Afficher un message de succès ---
         title = guides_data[category_slug]['sub_items'][sub_item_slug]['title']
         flash(f'Le document pour "{title}" a été mis à jour avec succès.', "success")
@@ -213,82 +231,182 @@ def delete_user_route(email):
 # ROUTES API POUR LA GESTION DES COMPTES
 # =======================================================
 
+def _masquer_codes(utilisateurs: list) -> list:
+    """On cache les codes de récupération des autres admins protégés."""
+    admin_actuel_email = current_user.get_id()
+    for user in utilisateurs:
+        if user.get('is_protected') and user['email'] != admin_actuel_email:
+            user.pop('recovery_code', None)
+    return utilisateurs
+
+
+def _version_comptes() -> tuple:
+    """
+    Lecture légère (e-mail + révision de chaque compte) qui donne :
+    - l'ETag de la liste, qui change à chaque ajout, modification ou suppression ;
+    - la révision courante (la plus récente), point de départ des synchronisations incrémentales ;
+    - la liste des e-mails existants, qui permet au client de retirer les comptes supprimés.
+    """
+    versions = sorted((u['email'], u.get('updated_at') or '') for u in get_users_revisions())
+    # Les codes visibles dépendent de l'administrateur connecté : il fait partie de l'ETag.
+    empreinte = hashlib.sha1(json.dumps([current_user.get_id(), versions]).encode('utf-8')).hexdigest()
+    revision = max((updated_at for _, updated_at in versions), default='')
+    return empreinte, revision, [email for email, _ in versions]
+
+
 @admin.route('/api/comptes', methods=['GET'])
 @admin_required
 def get_comptes():
     """
     Retourne la liste complète de tous les utilisateurs depuis la base de données.
+    La réponse porte un ETag (If-None-Match -> 304 si rien n'a changé) et la révision courante (X-Revision).
+    Avec ?since=<révision>, seuls les changements depuis cette révision sont retournés :
+    {revision, modifies: [comptes ajoutés ou modifiés], emails: [tous les e-mails existants]}.
     """
     try:
-        tous_les_utilisateurs = get_all_users()
-        admin_actuel_email = current_user.get_id()
-
-        # On cache les codes de récupération des autres admins protégés
-        for user in tous_les_utilisateurs:
-            if user['is_protected'] and user['email'] != admin_actuel_email:
-                user.pop('recovery_code', None)
-        
-        return jsonify(tous_les_utilisateurs)
+        empreinte, revision, emails = _version_comptes()
+
+        depuis = request.args.get('since')
+        if depuis is not None:
+            modifies = _masquer_codes(get_users_changed_since(depuis)) if depuis != revision else []
+            return jsonify({"revision": revision, "modifies": modifies, "emails": emails})
+
+        if request.if_none_match.contains(empreinte):
+            reponse = current_app.response_class(status=304)
+        else:
+            reponse = jsonify(_masquer_codes(get_all_users()))
+        reponse.set_etag(empreinte)
+        reponse.headers['X-Revision'] = revision
+        # Le navigateur doit toujours revalider (et donc envoyer If-None-Match) avant de réutiliser la liste.
+        reponse.headers['Cache-Control'] = 'private, no-cache'
+        return reponse
         
     except Exception as e:
         current_app.logger.error(f"Erreur lors de la lecture des comptes : {e}")
         return jsonify({"erreur": "Impossible de charger les données des utilisateurs."}), 500
 
 
+@admin.route('/api/comptes/<string:user_email>', methods=['PATCH'])
+@admin_required
+def patch_compte(user_email):
+    """
+    Modifie un seul compte : seules les colonnes envoyées parmi 'nom', 'role' et 'actif' sont réécrites.
+    Mêmes règles que la sauvegarde complète (admins protégés, au moins un administrateur actif).
+    Retourne {succes, utilisateur, revision}.
+    """
+    try:
+        champs = request.get_json()
+        if not isinstance(champs, dict) or not champs or not set(champs) <= COLONNES_MODIFIABLES:
+            return jsonify({"succes": False, "erreur": f"Colonnes modifiables : {', '.join(sorted(COLONNES_MODIFIABLES))}."}), 400
+        if 'role' in champs and champs['role'] not in ('admin', 'user'):
+            return jsonify({"succes": False, "erreur": "Rôle invalide."}), 400
+
+        utilisateur = find_user_by_email(user_email)
+        if not utilisateur:
+            return jsonify({"succes": False, "erreur": "Utilisateur non trouvé."}), 404
+
+        apres = {**utilisateur, **champs}
+        if utilisateur.get('is_protected') and (not apres.get('actif') or apres.get('role') != 'admin'):
+            return jsonify({"succes": False, "erreur": f"Modification refusée. L'utilisateur {user_email} est protégé."}), 403
+        etait_admin_actif = utilisateur.get('role') == 'admin' and utilisateur.get('actif')
+        if etait_admin_actif and not (apres.get('role') == 'admin' and apres.get('actif')):
+            autres_admins = [u for u in get_all_users()
+                             if u['email'] != user_email and u.get('role') == 'admin' and u.get('actif')]
+            if not autres_admins:
+                return jsonify({"succes": False, "erreur": "Opération refusée. Il doit rester au moins un administrateur actif."}), 400
+
+        patch_user(user_email, champs)
+        utilisateur = _masquer_codes([find_user_by_email(user_email)])[0]
+        return jsonify({"succes": True, "utilisateur": utilisateur, "revision": utilisateur.get('updated_at')})
+
+    except Exception as e:
+        current_app.logger.error(f"Erreur lors de la modification du compte {user_email} : {e}", exc_info=True)
+        return jsonify({"succes": False, "erreur": "Une erreur interne est survenue lors de la modification."}), 500
+
+
+@admin.route('/api/comptes/<string:user_email>', methods=['DELETE'])
+@admin_required
+def supprimer_compte(user_email):
+    """Supprime un seul compte (refusé pour un administrateur protégé)."""
+    try:
+        utilisateur = find_user_by_email(user_email)
+        if not utilisateur:
+            return jsonify({"succes": False, "erreur": "Utilisateur non trouvé."}), 404
+        if utilisateur.get('is_protected'):
+            return jsonify({"succes": False, "erreur": f"Suppression refusée. L'utilisateur {user_email} est protégé."}), 403
+        delete_user(user_email)
+        return jsonify({"succes": True})
+
+    except Exception as e:
+        current_app.logger.error(f"Erreur lors de la suppression du compte {user_email} : {e}", exc_info=True)
+        return jsonify({"succes": False, "erreur": "Une erreur interne est survenue lors de la suppression."}), 500
+
+
 @admin.route('/api/comptes', methods=['POST'])
 @admin_required
 def save_comptes():
     """
     Sauvegarde une liste d'utilisateurs dans la base de données.
     Gère l'ajout, la modification et la suppression.
+    La liste reçue est comparée en une passe à la base : seuls les comptes ajoutés ou modifiés
+    sont réécrits (un upsert groupé) et les comptes absents sont supprimés (une suppression groupée).
+    La réponse détaille les changements : {ajoutes, modifies, supprimes, inchanges}.
     """
     try:
         comptes_recus = request.get_json()
-        if not isinstance(comptes_recus, list):
+        if not isinstance(comptes_recus, list) or not all(isinstance(c, dict) for c in comptes_recus):
             abort(400, "Données invalides : une liste est attendue.")
 
-        utilisateurs_actuels_db = get_all_users()
-        emails_actuels_db = {u['email'] for u in utilisateurs_actuels_db}
-        emails_recus = {c['email'] for c in comptes_recus}
-        protected_admins = get_protected_admins()
-
-        nouvel_utilisateur_info = None
+        # Une seule lecture : la table complète donne aussi les administrateurs protégés.
+        utilisateurs_db = {u['email']: u for u in get_all_users()}
+        comptes_recus = {c['email']: c for c in comptes_recus if c.get('email')}
 
-        # --- Gérer les suppressions ---
-        emails_a_supprimer = emails_actuels_db - emails_recus
+        # --- Valider les règles une seule fois, avant toute écriture ---
+        emails_a_supprimer = [email for email in utilisateurs_db if email not in comptes_recus]
         for email in emails_a_supprimer:
-            if email in protected_admins:
+            if utilisateurs_db[email].get('is_protected'):
                 return jsonify({"succes": False, "erreur": f"Suppression refusée. L'utilisateur {email} est protégé."}), 403
-            delete_user(email)
 
-        # --- Gérer les ajouts et modifications ---
-        for compte in comptes_recus:
-            email = compte.get('email')
-            if not email:
-                continue
+        if comptes_recus:
+            # Valider qu'il reste au moins un admin actif
+            if not any(c.get('role') == 'admin' and c.get('actif') for c in comptes_recus.values()):
+                return jsonify({"succes": False, "erreur": "Opération refusée. Il doit rester au moins un administrateur actif."}), 400
+
+        # --- Comparer la liste reçue à la base (une passe) ---
+        a_enregistrer, ajoutes, modifies = [], [], []
+        nouvel_utilisateur_info = None
+        for email, compte in comptes_recus.items():
+            actuel = utilisateurs_db.get(email)
+
+            # Valider les admins protégés
+            if actuel and actuel.get('is_protected') and (not compte.get('actif') or compte.get('role') != 'admin'):
+                return jsonify({"succes": False, "erreur": f"Modification refusée. L'utilisateur {email} est protégé."}), 403
 
-            # Logique pour la génération de code pour un nouvel utilisateur
-            if email not in emails_actuels_db:
+            if actuel is None:
+                # Logique pour la génération de code pour un nouvel utilisateur
                 compte['recovery_code'] = generate_recovery_code()
                 compte['password_hash'] = '' # Un nouvel utilisateur n'a pas de mot de passe
                 compte['confirmed'] = False # Doit confirmer son compte
                 nouvel_utilisateur_info = compte
-            
-            # Valider les admins protégés
-            if email in protected_admins and (not compte.get('actif') or compte.get('role') != 'admin'):
-                return jsonify({"succes": False, "erreur": f"Modification refusée. L'utilisateur {email} est protégé."}), 403
-            
-            # Valider qu'il reste au moins un admin actif
-            admins_actifs = sum(1 for c in comptes_recus if c.get('role') == 'admin' and c.get('actif'))
-            if admins_actifs < 1:
-                return jsonify({"succes": False, "erreur": "Opération refusée. Il doit rester au moins un administrateur actif."}), 400
+                a_enregistrer.append(compte)
+                ajoutes.append(email)
+            elif any(actuel.get(colonne) != valeur for colonne, valeur in compte.items() if colonne != 'updated_at'):
+                # La ligne complète est renvoyée : les colonnes non transmises (ex : codes masqués) sont conservées.
+                a_enregistrer.append({**actuel, **compte})
+                modifies.append(email)
 
-            update_user(compte) # Met à jour ou insère l'utilisateur dans la DB
+        sync_users(a_enregistrer, emails_a_supprimer)
 
         # --- Réponse au frontend ---
         response_data = {
             "succes": True,
-            "message": "Comptes mis à jour avec succès."
+            "message": "Comptes mis à jour avec succès." if a_enregistrer or emails_a_supprimer else "Aucune modification.",
+            "changements": {
+                "ajoutes": ajoutes,
+                "modifies": modifies,
+                "supprimes": emails_a_supprimer,
+                "inchanges": len(comptes_recus) - len(a_enregistrer),
+            },
         }
         if nouvel_utilisateur_info:
             response_data["message"] = "Compte ajouté avec succès."
@@ -297,6 +415,8 @@ def save_comptes():
         
         return jsonify(response_data)
 
+    except HTTPException:
+        raise
     except Exception as e:
         current_app.logger.error(f"Erreur lors de la sauvegarde des comptes : {e}", exc_info=True)
         return jsonify({"succes": False, "erreur": "Une erreur interne est survenue lors de la sauvegarde."}), 500
@@ -323,4 +443,98 @@ def regenerate_recovery_code(user_email):
         })
     except Exception as e:
         current_app.logger.error(f"Erreur lors de la régénération du code pour {user_email}: {e}")
-        return jsonify({"succes": False, "erreur": "Une erreur interne est survenue."}), 500
\ No newline at end of file
+        return jsonify({"succes": False, "erreur": "Une erreur interne est survenue."}), 500
+
+
+# =======================================================
+# ROUTES API POUR LES CACHES
+# =======================================================
+
+@admin.route('/api/cache-utilisateurs', methods=['GET'])
+@admin_required
+def stats_cache_utilisateurs():
+    """Retourne les statistiques du cache des utilisateurs (utile pour ajuster son TTL)."""
+    return jsonify(cache_utilisateurs.stats())
+
+
+@admin.route('/api/cache-rpc', methods=['GET'])
+@admin_required
+def stats_cache_rpc():
+    """Retourne les statistiques du cache des RPC (succès, échecs, taille occupée)."""
+    return jsonify(current_app.cache_rpc.stats())
+
+
+@admin.route('/api/coalescence', methods=['GET'])
+@admin_required
+def stats_coalescence():
+    """Retourne les compteurs du regroupement des appels RPC identiques (appels exécutés, regroupés, délais dépassés)."""
+    return jsonify(current_app.coalescence.stats())
+
+
+@admin.route('/api/cache-rpc', methods=['DELETE'])
+@admin_required
+def vider_cache_rpc():
+    """Vide le cache des RPC, par exemple après une correction de données historiques."""
+    current_app.cache_rpc.vider()
+    return jsonify({"succes": True, "message": "Le cache des requêtes a été vidé."})
+
+
+@admin.route('/api/segments', methods=['GET'])
+@admin_required
+def stats_segments():
+    """Retourne l'état du cache des segments mensuels (nombre de segments et taille par type)."""
+    if current_app.segments is None:
+        return jsonify({"actif": False})
+    return jsonify(current_app.segments.stats())
+
+
+@admin.route('/api/segments', methods=['DELETE'])
+@admin_required
+def invalider_segments():
+    """
+    Supprime des segments mensuels après une correction rétroactive des données.
+    Paramètres (facultatifs) : type (ventes / achats), erp, mois (AAAA-MM) ou depuis (AAAA-MM).
+    Sans paramètre, tous les segments sont supprimés.
+    """
+    if current_app.segments is None:
+        return jsonify({"erreur": "Le cache des segments mensuels n'est pas actif."}), 404
+    type_transaction = request.args.get('type') or None
+    mois, depuis = request.args.get('mois') or None, request.args.get('depuis') or None
+    if type_transaction and type_transaction not in TYPES_TRANSACTION:
+        return jsonify({"erreur": f"Type de transaction inconnu : '{type_transaction}'."}), 400
+    if any(valeur and not re.fullmatch(r'\d{4}-\d{2}', valeur) for valeur in (mois, depuis)):
+        return jsonify({"erreur": "Les mois doivent être au format AAAA-MM."}), 400
+    supprimes = current_app.segments.invalider(type_transaction, request.args.get('erp') or None, mois, depuis)
+    current_app.logger.info(f"Segments mensuels invalidés par {current_user.get_id()} : {supprimes} supprimé(s).")
+    return jsonify({"message": f"{supprimes} segment(s) supprimé(s).", "supprimes": supprimes})
+
+
+@admin.route('/api/admission', methods=['GET'])
+@admin_required
+def etat_admission():
+    """État du contrôle d'admission du processus : unités en cours, file d'attente, refus par motif."""
+    return jsonify(current_app.admission.etat())
+
+
+@admin.route('/api/cumuls', methods=['GET'])
+@admin_required
+def etat_cumuls():
+    """Retourne la fraîcheur des cumuls mensuels des requêtes avancées (date du calcul, âge, mois couverts)."""
+    if current_app.cumuls is None:
+        return jsonify({"actifs": False, "cumuls": {}})
+    return jsonify({"actifs": True, "age_max_s": current_app.cumuls.age_max, "cumuls": current_app.cumuls.metadonnees()})
+
+
+@admin.route('/api/metriques', methods=['GET'])
+@admin_required
+def metriques_performance():
+    """Retourne les histogrammes de durée par route (total et par segment : RPC, rendu, export...)."""
+    return jsonify(current_app.instrumentation.etat())
+
+
+@admin.route('/api/metriques', methods=['DELETE'])
+@admin_required
+def reinitialiser_metriques_performance():
+    """Remet à zéro les histogrammes de performance (ex : avant une campagne de mesures)."""
+    current_app.instrumentation.reinitialiser()
+    return jsonify({"succes": True, "message": "Les métriques de performance ont été réinitialisées."})
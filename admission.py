@@ -0,0 +1,211 @@
+# admission.py
+"""
+Ce fichier contient le contrôle d'admission des routes coûteuses (recherches, exports, requêtes avancées).
+Chaque requête appartient à une classe de coût ('page', 'agregat', 'export') qui consomme des unités
+d'une capacité globale (ADMISSION_CAPACITE) :
+- quand la capacité est atteinte, la requête attend dans une file bornée (ADMISSION_FILE_MAX),
+  au plus ADMISSION_ATTENTE_MAX secondes ;
+- un même utilisateur ne peut pas dépasser ADMISSION_PAR_UTILISATEUR unités en cours : au-delà,
+  sa requête est refusée sans attendre, pour qu'il ne puisse pas occuper la file à lui seul ;
+- une requête refusée reçoit une réponse 429 avec l'en-tête Retry-After.
+Pour une réponse en flux (export, JSON en flux), les unités ne sont rendues qu'à la fin de l'envoi.
+Les compteurs sont propres à chaque processus : la capacité s'entend par worker.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from flask_login import current_user
+
+from instrumentation import mesurer
+
+# Unités de capacité consommées par chaque classe de coût.
+COUTS_CLASSES = {
+    'page': 1,      # Une page de résultats (pagination par curseur)
+    'agregat': 2,   # Une requête avancée (fonction d'agrégation)
+    'export': 4,    # Un résultat complet : téléchargement, JSON ou Arrow en flux
+}
+
+
+class AdmissionRefusee(Exception):
+    """Requête non admise ; 'retry_after' est le délai conseillé (en secondes) avant de réessayer."""
+
+    def __init__(self, message: str, motif: str, retry_after: int):
+        super().__init__(message)
+        self.motif = motif
+        self.retry_after = retry_after
+
+
+class ControleAdmission:
+    """Capacité partagée par les requêtes coûteuses du processus, avec limite par utilisateur et file d'attente."""
+
+    def __init__(self, capacite: int, par_utilisateur: int, file_max: int, attente_max: float, retry_after: int):
+        # Une capacité nulle désactive le contrôle (toutes les requêtes sont admises).
+        self.capacite = capacite
+        self.par_utilisateur = par_utilisateur
+        self.file_max = file_max
+        self.attente_max = attente_max
+        self.retry_after = retry_after
+        self._condition = threading.Condition()
+        self._en_cours = 0
+        self._en_cours_utilisateurs = {}
+        # File d'attente (premier arrivé, premier admis) : un jeton par requête en attente.
+        self._file = deque()
+        self._admises = 0
+        self._refus = {'utilisateur': 0, 'file_pleine': 0, 'delai': 0}
+        self._attente_cumulee = 0.0
+
+    @classmethod
+    def depuis_config(cls, config) -> 'ControleAdmission':
+        return cls(
+            capacite=config.get('ADMISSION_CAPACITE'),
+            par_utilisateur=config.get('ADMISSION_PAR_UTILISATEUR'),
+            file_max=config.get('ADMISSION_FILE_MAX'),
+            attente_max=config.get('ADMISSION_ATTENTE_MAX'),
+            retry_after=config.get('ADMISSION_RETRY_AFTER'),
+        )
+
+    @property
+    def actif(self) -> bool:
+        return self.capacite > 0
+
+    def cout(self, classe: str) -> int:
+        # Une classe plus coûteuse que la capacité entière passerait sinon jamais.
+        return min(COUTS_CLASSES[classe], self.capacite)
+
+    def _refuser(self, motif: str, message: str):
+        self._refus[motif] += 1
+        raise AdmissionRefusee(message, motif, self.retry_after)
+
+    def entrer(self, utilisateur: str, classe: str) -> int:
+        """
+        Réserve les unités de la classe pour l'utilisateur, en attendant si nécessaire.
+        Retourne le nombre d'unités réservées (à rendre avec sortir). Lève AdmissionRefusee.
+        """
+        if not self.actif:
+            return 0
+        cout = self.cout(classe)
+        debut = time.perf_counter()
+        with self._condition:
+            utilise = self._en_cours_utilisateurs.get(utilisateur, 0)
+            # Une première requête est toujours acceptée pour l'utilisateur, même si son coût dépasse sa limite.
+            if utilise and utilise + cout > self.par_utilisateur:
+                self._refuser('utilisateur', "Trop de requêtes en cours pour votre compte : "
+                                             "attendez la fin des précédentes.")
+            # S'il y a déjà une file, on s'y place : une nouvelle requête ne double pas celles qui attendent.
+            if self._file or self._en_cours + cout > self.capacite:
+                if len(self._file) >= self.file_max:
+                    self._refuser('file_pleine', "Le serveur est très sollicité : réessayez dans quelques instants.")
+                jeton = object()
+                self._file.append(jeton)
+                try:
+                    echeance = debut + self.attente_max
+                    while self._file[0] is not jeton or self._en_cours + cout > self.capacite:
+                        restant = echeance - time.perf_counter()
+                        if restant <= 0:
+                            self._refuser('delai', "Le serveur est très sollicité : réessayez dans quelques instants.")
+                        self._condition.wait(restant)
+                finally:
+                    self._file.remove(jeton)
+                    # La tête de file a changé : la suivante vérifie si elle peut passer.
+                    self._condition.notify_all()
+            self._en_cours += cout
+            self._en_cours_utilisateurs[utilisateur] = self._en_cours_utilisateurs.get(utilisateur, 0) + cout
+            self._admises += 1
+            self._attente_cumulee += time.perf_counter() - debut
+        return cout
+
+    def sortir(self, utilisateur: str, cout: int):
+        """Rend les unités réservées par entrer() et réveille les requêtes en attente."""
+        if not cout:
+            return
+        with self._condition:
+            self._en_cours -= cout
+            reste = self._en_cours_utilisateurs.get(utilisateur, 0) - cout
+            if reste > 0:
+                self._en_cours_utilisateurs[utilisateur] = reste
+            else:
+                self._en_cours_utilisateurs.pop(utilisateur, None)
+            self._condition.notify_all()
+
+    @contextmanager
+    def admettre(self, classe: str, utilisateur: str = None):
+        """Bloc exécuté sous contrôle d'admission (réponse non streamée). Lève AdmissionRefusee."""
+        utilisateur = utilisateur or utilisateur_courant()
+        with mesurer('admission'):
+            cout = self.entrer(utilisateur, classe)
+        try:
+            yield
+        finally:
+            self.sortir(utilisateur, cout)
+
+    def etat(self) -> dict:
+        with self._condition:
+            return {
+                "actif": self.actif,
+                "capacite": self.capacite,
+                "par_utilisateur": self.par_utilisateur,
+                "file_max": self.file_max,
+                "en_cours": self._en_cours,
+                "utilisateurs_actifs": len(self._en_cours_utilisateurs),
+                "en_attente": len(self._file),
+                "admises": self._admises,
+                "refusees": dict(self._refus),
+                "attente_moyenne_ms": round(1000 * self._attente_cumulee / self._admises, 1) if self._admises else None,
+                "couts": COUTS_CLASSES,
+            }
+
+
+def utilisateur_courant() -> str:
+    """Identifiant utilisé pour la limite par utilisateur : l'e-mail du compte, sinon l'adresse IP."""
+    if current_user and current_user.is_authenticated:
+        return current_user.get_id()
+    return request.remote_addr or 'anonyme'
+
+
+def reponse_refus(erreur: AdmissionRefusee):
+    reponse = jsonify({"erreur": str(erreur)})
+    reponse.status_code = 429
+    reponse.headers['Retry-After'] = str(erreur.retry_after)
+    return reponse
+
+
+def admission(classe):
+    """
+    Décorateur de route : la vue n'est exécutée qu'une fois admise, sinon la réponse est un 429.
+    'classe' est une classe de coût, ou une fonction sans argument qui la choisit (ex : selon le corps JSON).
+    À placer sous @login_required. Pour une réponse en flux, les unités sont rendues à la fermeture de la réponse.
+    """
+    def decorateur(vue):
+        @wraps(vue)
+        def vue_admise(*args, **kwargs):
+            controle = current_app.admission
+            utilisateur = utilisateur_courant()
+            try:
+                with mesurer('admission'):
+                    cout = controle.entrer(utilisateur, classe() if callable(classe) else classe)
+            except AdmissionRefusee as e:
+                return reponse_refus(e)
+
+            rendu = []
+
+            def liberer():
+                if not rendu:
+                    rendu.append(True)
+                    controle.sortir(utilisateur, cout)
+
+            try:
+                reponse = current_app.make_response(vue(*args, **kwargs))
+            except BaseException:
+                liberer()
+                raise
+            if reponse.is_streamed:
+                reponse.call_on_close(liberer)
+            else:
+                liberer()
+            return reponse
+        return vue_admise
+    return decorateur
@@ -0,0 +1,405 @@
+# agregats.py
+"""
+Ce fichier contient les agrégats précalculés (« cumuls ») des requêtes avancées.
+Les RPC d'agrégation (top_clients_ca, ca_par_periode, ...) relisent tout l'historique à chaque appel.
+Un cumul mensuel regroupe une fois pour toutes les transactions par mois et par dimensions
+(client × famille d'articles, client × article, fournisseur × article...) : une requête du catalogue
+qui déclare un cumul ("cumul" dans <type>_requetes_avancees.json) lit alors quelques milliers
+de lignes pré-agrégées au lieu de toute la table.
+
+Les cumuls sont stockés dans une base SQLite (CUMULS_CHEMIN), reconstruite par la commande :
+    python agregats.py [--cumul NOM]
+Chaque cumul garde ses métadonnées de fraîcheur (date du calcul, durée, lignes lues, mois couverts).
+Un recalcul n'est installé que si toutes les transactions ont été lues (nombre de lignes lues égal
+au nombre de lignes de la source, au début comme à la fin de la lecture).
+Les RPC d'agrégation sont réécrites en SQL sur le cumul (sources.RPC_AGREGATION) : à chaque recalcul,
+chaque requête du catalogue servie par le cumul est comparée à la vraie RPC de la source (période complète,
+douze derniers mois, puis chaque filtre avec une valeur du cumul). Seules les requêtes vérifiées sont servies.
+Un cumul n'est utilisé que s'il est plus récent que CUMULS_AGE_MAX et que la période demandée
+commence et finit sur des débuts de mois ; sinon la RPC est appelée normalement.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from datetime import date, datetime, timezone
+
+from registre import registre, TYPES_TRANSACTION
+from sources import (COLONNES_TRI, RPC_AGREGATION, RPC_RECHERCHE, SourceSQLite, _identifiant,
+                     sql_agregation)
+
+COLONNE_MOIS = 'Mois'
+TABLE_METADONNEES = 'cumuls_metadonnees'
+
+# Nombre de lignes lues par appel lors du recalcul d'un cumul (au plus RPC_LIGNES_MAX_REPONSE).
+TAILLE_LOT_RAFRAICHISSEMENT = 1000
+
+# Écart absolu toléré entre une somme du cumul (REAL) et celle de la RPC (numeric).
+TOLERANCE_MESURE = 0.01
+
+# Définition des cumuls : type de transaction, dimensions (en plus du mois) et mesures
+# (nom de la mesure -> colonne additionnée). Les noms des mesures sont ceux des colonnes renvoyées par les RPC.
+CUMULS = {
+    'ventes_client_famille_mois': {
+        'type': 'ventes',
+        'dimensions': ('Code client', 'Raison sociale', 'Famille article'),
+        'mesures': {'CA HT': 'Tot HT', 'Quantité': 'Qté fact'},
+    },
+    'ventes_client_article_mois': {
+        'type': 'ventes',
+        'dimensions': ('Code client', 'Raison sociale', 'Famille article', 'code article', 'Désignation'),
+        'mesures': {'CA HT': 'Tot HT', 'Quantité': 'Qté fact'},
+    },
+    'achats_fournisseur_article_mois': {
+        'type': 'achats',
+        'dimensions': ('Code fournisseur', 'Raison sociale', 'Famille article', 'code article', 'Désignation'),
+        'mesures': {'Montant HT': 'Total HT', 'Quantité': 'Qté fact'},
+    },
+}
+
+RPC_PAR_TYPE = {type_transaction: nom_rpc for nom_rpc, type_transaction in RPC_RECHERCHE.items()}
+
+
+def definition_sur_cumul(nom_rpc: str, nom_cumul: str) -> dict:
+    """
+    Réécrit la définition SQL d'une RPC d'agrégation (sources.RPC_AGREGATION) pour la table d'un cumul :
+    le mois devient la colonne "Mois" et chaque SUM(colonne) devient la somme de la mesure pré-agrégée.
+    Lève ValueError si le cumul ne contient pas une colonne utilisée par la RPC.
+    """
+    definition = dict(RPC_AGREGATION[nom_rpc])
+    cumul = CUMULS[nom_cumul]
+    colonne_date = COLONNES_TRI[cumul['type']][0]
+    selection = definition['selection'].replace(f'substr({_identifiant(colonne_date)}, 1, 7)', _identifiant(COLONNE_MOIS))
+    for mesure, colonne in cumul['mesures'].items():
+        selection = selection.replace(f'SUM({_identifiant(colonne)})', f'SUM({_identifiant(mesure)})')
+
+    colonnes_cumul = {COLONNE_MOIS, *cumul['dimensions'], *cumul['mesures']}
+    colonnes_requises = {colonne for colonne, _ in definition['filtres'].values()}
+    colonnes_requises.update(c.strip().strip('"') for c in definition['groupe'].split(','))
+    if definition['table'] != cumul['type'] or not colonnes_requises <= colonnes_cumul or 'substr(' in selection:
+        raise ValueError(f"Le cumul '{nom_cumul}' ne peut pas servir la requête '{nom_rpc}'.")
+
+    definition['table'] = nom_cumul
+    definition['selection'] = selection
+    return definition
+
+
+def _normaliser(lignes: list) -> list:
+    """Lignes d'un résultat dans un ordre canonique (valeurs non numériques, puis mesures arrondies)."""
+    def cle(ligne):
+        return ([str(v) for _, v in sorted(ligne.items()) if not isinstance(v, (int, float))],
+                [round(v, 1) for _, v in sorted(ligne.items()) if isinstance(v, (int, float))])
+    return sorted(lignes, key=cle)
+
+
+def resultats_identiques(attendu: list, obtenu: list) -> bool:
+    """Compare deux résultats de RPC sans tenir compte de l'ordre des lignes, mesures à TOLERANCE_MESURE près."""
+    if len(attendu) != len(obtenu):
+        return False
+    for ligne_attendue, ligne_obtenue in zip(_normaliser(attendu), _normaliser(obtenu)):
+        if set(ligne_attendue) != set(ligne_obtenue):
+            return False
+        for colonne, valeur in ligne_attendue.items():
+            autre = ligne_obtenue[colonne]
+            if isinstance(valeur, (int, float)) and isinstance(autre, (int, float)):
+                if not math.isclose(valeur, autre, abs_tol=TOLERANCE_MESURE):
+                    return False
+            elif valeur != autre:
+                return False
+    return True
+
+
+def _mois(date: str):
+    """'2024-03-01' -> '2024-03' ; None si la date n'est pas un début de mois (le cumul ne peut pas servir)."""
+    if not date:
+        return ''
+    date = str(date)
+    return date[:7] if date[8:10] in ('', '01') and date[11:].strip('0:T ') == '' else None
+
+
+class Cumuls(SourceSQLite):
+    """
+    Base SQLite des cumuls mensuels. Elle se comporte comme une source de données pour les seules
+    RPC d'agrégation servies par un cumul : mêmes paramètres, mêmes colonnes renvoyées.
+    """
+
+    def __init__(self, chemin: str, age_max: int = 0):
+        self.age_max = age_max
+        self._metadonnees = None  # Relues au plus une fois par minute
+        self._lu_le = 0.0
+        super().__init__(chemin)
+
+    def initialiser(self):
+        with self._connexion() as connexion:
+            connexion.execute("PRAGMA journal_mode=WAL")
+            connexion.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLE_METADONNEES} ("
+                " nom TEXT PRIMARY KEY, type_transaction TEXT, rafraichi_le TEXT, duree_s REAL,"
+                " nb_lignes_source INTEGER, nb_lignes INTEGER, premier_mois TEXT, dernier_mois TEXT,"
+                " rpc_verifiees TEXT, ecarts TEXT)"
+            )
+            # Bases créées avant la vérification des cumuls contre les RPC
+            colonnes = {ligne['name'] for ligne in connexion.execute(f'PRAGMA table_info({TABLE_METADONNEES})')}
+            for colonne in ('rpc_verifiees', 'ecarts'):
+                if colonne not in colonnes:
+                    connexion.execute(f'ALTER TABLE {TABLE_METADONNEES} ADD COLUMN {colonne} TEXT')
+
+    # --- Lecture ---
+
+    def metadonnees(self) -> dict:
+        """Métadonnées de fraîcheur de chaque cumul calculé, avec son âge en secondes."""
+        if self._metadonnees is None or time.monotonic() - self._lu_le > 60:
+            with self._connexion() as connexion:
+                lignes = connexion.execute(f'SELECT * FROM {TABLE_METADONNEES}').fetchall()
+            self._metadonnees = {ligne['nom']: {**dict(ligne),
+                                                'rpc_verifiees': json.loads(ligne['rpc_verifiees'] or '[]'),
+                                                'ecarts': json.loads(ligne['ecarts'] or '{}')}
+                                 for ligne in lignes}
+            self._lu_le = time.monotonic()
+        maintenant = datetime.now(timezone.utc)
+        etat = {}
+        for nom, meta in self._metadonnees.items():
+            age = (maintenant - datetime.fromisoformat(meta['rafraichi_le'])).total_seconds()
+            etat[nom] = {**meta, "age_s": round(age), "perime": bool(self.age_max) and age > self.age_max}
+        return etat
+
+    @staticmethod
+    def cumuls_du_catalogue() -> dict:
+        """nom_fonction -> cumul déclaré par les requêtes du catalogue."""
+        declares = {}
+        for type_transaction in TYPES_TRANSACTION:
+            for requete in registre.requetes_avancees(type_transaction):
+                if requete.get('cumul'):
+                    declares[requete['nom_fonction']] = requete['cumul']
+        return declares
+
+    def cumul_pour(self, nom_rpc: str, params: dict):
+        """Retourne le nom du cumul qui peut servir cet appel, ou None (appel à la RPC)."""
+        nom_cumul = self.cumuls_du_catalogue().get(nom_rpc)
+        if nom_cumul is None or nom_rpc not in RPC_AGREGATION:
+            return None
+        meta = self.metadonnees().get(nom_cumul)
+        if meta is None or meta['perime'] or nom_rpc not in meta['rpc_verifiees']:
+            return None
+        if _mois(params.get('p_date_debut')) is None or _mois(params.get('p_date_fin')) is None:
+            return None
+        return nom_cumul
+
+    def _sql_rpc(self, nom_rpc, params):
+        nom_cumul = self.cumul_pour(nom_rpc, params)
+        if nom_cumul is None:
+            raise ValueError(f"Aucun cumul à jour ne peut servir la requête '{nom_rpc}'.")
+        params = {**params}
+        for parametre in ('p_date_debut', 'p_date_fin'):
+            if params.get(parametre):
+                params[parametre] = _mois(params[parametre])
+        return sql_agregation(nom_rpc, definition_sur_cumul(nom_rpc, nom_cumul), params, COLONNE_MOIS)
+
+    def appeler_rpc(self, nom_rpc, params, tri=None, apres=None, limite=None, decalage=0, compter=False):
+        resultat = super().appeler_rpc(nom_rpc, params, tri, apres, limite, decalage, compter)
+        resultat["fraicheur"] = self.metadonnees()[self.cumul_pour(nom_rpc, params)]['rafraichi_le']
+        return resultat
+
+    # --- Recalcul ---
+
+    def rafraichir(self, source, noms: list = None, taille_lot: int = TAILLE_LOT_RAFRAICHISSEMENT) -> list:
+        """
+        Recalcule les cumuls demandés (tous par défaut) à partir de la source de données.
+        Les transactions d'un type sont lues une seule fois pour tous les cumuls de ce type ; si la lecture
+        est incomplète, les cumuls de ce type ne sont pas remplacés (leur rapport porte "erreur").
+        Chaque table est remplacée en une transaction : les lectures voient l'ancien ou le nouveau cumul.
+        """
+        noms = list(noms or CUMULS)
+        rapports = []
+        for type_transaction in TYPES_TRANSACTION:
+            noms_type = [nom for nom in noms if CUMULS[nom]['type'] == type_transaction]
+            if not noms_type:
+                continue
+            debut = time.perf_counter()
+            groupes = {nom: {} for nom in noms_type}
+            colonne_date = COLONNES_TRI[type_transaction][0]
+            nb_lignes_source = 0
+            try:
+                for lot in self._lots_transactions(source, type_transaction, taille_lot):
+                    nb_lignes_source += len(lot)
+                    for ligne in lot:
+                        mois = str(ligne.get(colonne_date) or '')[:7]
+                        if not mois:
+                            continue
+                        for nom in noms_type:
+                            cumul = CUMULS[nom]
+                            cle = (mois, *(ligne.get(dimension) for dimension in cumul['dimensions']))
+                            sommes = groupes[nom].setdefault(cle, [0.0] * len(cumul['mesures']))
+                            for i, colonne in enumerate(cumul['mesures'].values()):
+                                sommes[i] += float(ligne.get(colonne) or 0)
+            except ValueError as e:
+                rapports.extend({"nom": nom, "erreur": str(e)} for nom in noms_type)
+                continue
+            duree = time.perf_counter() - debut
+            for nom in noms_type:
+                rapports.append(self._ecrire(nom, groupes[nom], nb_lignes_source, duree, source, taille_lot))
+        self._metadonnees = None
+        return rapports
+
+    @staticmethod
+    def _lots_transactions(source, type_transaction: str, taille_lot: int):
+        """
+        Parcours complet des transactions par offset sur un ordre stable, jusqu'au premier lot vide
+        (un lot plus court que demandé peut avoir été coupé par la source). Lève ValueError si le nombre
+        de lignes lues diffère du nombre de lignes de la source, compté au début et à la fin de la lecture.
+        """
+        nom_rpc = RPC_PAR_TYPE[type_transaction]
+        params = {'p_date_debut': '1900-01-01', 'p_date_fin': '9999-01-01'}
+        tri = [(colonne, False) for colonne in COLONNES_TRI[type_transaction]]
+        decalage = 0
+        attendu = None
+        while True:
+            reponse = source.appeler_rpc(nom_rpc, params, tri=tri, limite=taille_lot, decalage=decalage,
+                                         compter=attendu is None)
+            if attendu is None:
+                attendu = reponse["count"]
+            lot = reponse["data"] or []
+            if not lot:
+                break
+            yield lot
+            decalage += len(lot)
+        final = source.appeler_rpc(nom_rpc, params, limite=1, compter=True)["count"]
+        if attendu is None or decalage != attendu or final != attendu:
+            raise ValueError(f"Lecture incomplète des {type_transaction} : {decalage} ligne(s) lue(s), "
+                             f"{attendu} attendue(s) au début et {final} à la fin de la lecture.")
+
+    @staticmethod
+    def _lire_rpc(source, nom_rpc: str, params: dict, taille_lot: int) -> list:
+        """Lit tout le résultat d'une RPC par lots de 'taille_lot' lignes, jusqu'au premier lot vide."""
+        lignes = []
+        while True:
+            lot = source.appeler_rpc(nom_rpc, params, limite=taille_lot, decalage=len(lignes))["data"] or []
+            if not lot:
+                return lignes
+            lignes.extend(lot)
+
+    def _parametres_verification(self, plan, definition: dict, table: str) -> list:
+        """
+        Jeux de paramètres sur lesquels une requête servie par un cumul est comparée à la vraie RPC :
+        période complète, douze derniers mois, puis chaque filtre avec la valeur la plus fréquente du cumul.
+        """
+        aujourdhui = date.today()
+        fin = date(aujourdhui.year + aujourdhui.month // 12, aujourdhui.month % 12 + 1, 1)
+        periode = {'p_date_debut': '1900-01-01', 'p_date_fin': fin.isoformat()}
+        jeux = [periode, {**periode, 'p_date_debut': date(fin.year - 1, fin.month, 1).isoformat()}]
+        with self._connexion() as connexion:
+            for parametre in plan.parametres:
+                if parametre not in definition['filtres']:
+                    continue
+                colonne = _identifiant(definition['filtres'][parametre][0])
+                ligne = connexion.execute(
+                    f'SELECT {colonne} AS valeur FROM {table} WHERE {colonne} IS NOT NULL'
+                    f' GROUP BY {colonne} ORDER BY COUNT(*) DESC LIMIT 1'
+                ).fetchone()
+                if ligne is not None:
+                    jeux.append({**periode, parametre: ligne['valeur']})
+        return [plan.valider(params) for params in jeux]
+
+    def _verifier(self, source, nom: str, table: str, taille_lot: int) -> tuple:
+        """
+        Compare chaque requête du catalogue déclarant le cumul 'nom' (calculé dans 'table') à la vraie RPC.
+        Retourne (RPC vérifiées, {RPC: description de l'écart}).
+        """
+        verifiees, ecarts = [], {}
+        for nom_rpc, nom_cumul in sorted(self.cumuls_du_catalogue().items()):
+            if nom_cumul != nom:
+                continue
+            try:
+                definition = {**definition_sur_cumul(nom_rpc, nom), 'table': table}
+                plan = registre.plan_requete(nom_rpc)
+                for params in self._parametres_verification(plan, definition, table):
+                    attendu = self._lire_rpc(source, nom_rpc, params, taille_lot)
+                    dates = {cle: _mois(valeur) for cle, valeur in params.items() if cle in ('p_date_debut', 'p_date_fin')}
+                    sql, valeurs = sql_agregation(nom_rpc, definition, {**params, **dates}, COLONNE_MOIS)
+                    with self._connexion() as connexion:
+                        obtenu = [dict(ligne) for ligne in connexion.execute(sql, valeurs).fetchall()]
+                    if not resultats_identiques(attendu, obtenu):
+                        raise ValueError(f"résultat différent de la RPC pour {json.dumps(params, default=str)}")
+                verifiees.append(nom_rpc)
+            except Exception as e:
+                ecarts[nom_rpc] = str(e)
+        return verifiees, ecarts
+
+    def _ecrire(self, nom: str, groupes: dict, nb_lignes_source: int, duree: float, source, taille_lot: int) -> dict:
+        cumul = CUMULS[nom]
+        colonnes = [COLONNE_MOIS, *cumul['dimensions'], *cumul['mesures']]
+        definition = ', '.join(f'{_identifiant(c)} {"REAL" if c in cumul["mesures"] else "TEXT"}' for c in colonnes)
+        temporaire = f'{nom}__nouveau'
+        mois = sorted(cle[0] for cle in groupes)
+        with self._connexion() as connexion:
+            connexion.execute(f'DROP TABLE IF EXISTS {_identifiant(temporaire)}')
+            connexion.execute(f'CREATE TABLE {_identifiant(temporaire)} ({definition})')
+            connexion.executemany(f'INSERT INTO {_identifiant(temporaire)} VALUES ({", ".join("?" for _ in colonnes)})',
+                                  (list(cle) + sommes for cle, sommes in groupes.items()))
+
+        # Vérification sur la nouvelle table, avant son installation.
+        verifiees, ecarts = self._verifier(source, nom, _identifiant(temporaire), taille_lot)
+        meta = {
+            "nom": nom,
+            "type_transaction": cumul['type'],
+            "rafraichi_le": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "duree_s": round(duree, 3),
+            "nb_lignes_source": nb_lignes_source,
+            "nb_lignes": len(groupes),
+            "premier_mois": mois[0] if mois else None,
+            "dernier_mois": mois[-1] if mois else None,
+            "rpc_verifiees": json.dumps(verifiees),
+            "ecarts": json.dumps(ecarts, ensure_ascii=False),
+        }
+        with self._connexion() as connexion:
+            connexion.execute(f'DROP TABLE IF EXISTS {_identifiant(nom)}')
+            connexion.execute(f'ALTER TABLE {_identifiant(temporaire)} RENAME TO {_identifiant(nom)}')
+            connexion.execute(f'CREATE INDEX {_identifiant(f"idx_{nom}_mois")} ON {_identifiant(nom)} ({_identifiant(COLONNE_MOIS)})')
+            connexion.execute(
+                f'INSERT OR REPLACE INTO {TABLE_METADONNEES} ({", ".join(meta)}) VALUES ({", ".join("?" for _ in meta)})',
+                list(meta.values()),
+            )
+        return {**meta, "rpc_verifiees": verifiees, "ecarts": ecarts}
+
+
+def creer_cumuls(config):
+    """Ouvre la base des cumuls si elle a été calculée (commande 'python agregats.py'), sinon None."""
+    chemin = config['CUMULS_CHEMIN']
+    if not chemin or not os.path.exists(chemin):
+        return None
+    return Cumuls(chemin, config['CUMULS_AGE_MAX'])
+
+
+if __name__ == '__main__':
+    from clients_http import pool_http
+    from config import BaseConfig
+    from sources import creer_source_donnees
+
+    analyseur = argparse.ArgumentParser(description="Recalcule les cumuls mensuels des requêtes avancées.")
+    analyseur.add_argument('--cumul', action='append', choices=sorted(CUMULS),
+                           help="Cumul à recalculer (répétable ; tous par défaut).")
+    analyseur.add_argument('--chemin', default=BaseConfig.CUMULS_CHEMIN, help="Base SQLite des cumuls.")
+    arguments = analyseur.parse_args()
+
+    url, key = os.environ.get('SUPABASE_URL'), os.environ.get('SUPABASE_KEY')
+    source = creer_source_donnees(BaseConfig.SOURCE_DONNEES,
+                                  client_rpc=pool_http.supabase(url, key) if url and key else None,
+                                  chemin_sqlite=BaseConfig.SOURCE_SQLITE_CHEMIN)
+    os.makedirs(os.path.dirname(os.path.abspath(arguments.chemin)), exist_ok=True)
+    taille_lot = TAILLE_LOT_RAFRAICHISSEMENT
+    if BaseConfig.RPC_LIGNES_MAX_REPONSE > 0:
+        taille_lot = min(taille_lot, BaseConfig.RPC_LIGNES_MAX_REPONSE)
+    echecs = 0
+    for rapport in Cumuls(arguments.chemin).rafraichir(source, arguments.cumul, taille_lot):
+        if rapport.get('erreur'):
+            echecs += 1
+            print(f"{rapport['nom']} : non recalculé ({rapport['erreur']})")
+            continue
+        print(f"{rapport['nom']} : {rapport['nb_lignes']} ligne(s) pour {rapport['nb_lignes_source']} transaction(s)"
+              f" ({rapport['premier_mois']} -> {rapport['dernier_mois']}, {rapport['duree_s']} s)")
+        print(f"  requêtes vérifiées : {', '.join(rapport['rpc_verifiees']) or 'aucune'}")
+        for nom_rpc, ecart in rapport['ecarts'].items():
+            print(f"  {nom_rpc} non servie par le cumul : {ecart}")
+    sys.exit(1 if echecs else 0)
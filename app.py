@@ -4,21 +4,32 @@ import os
 from flask import Flask, current_app
 from flask_login import UserMixin
 from itsdangerous import URLSafeTimedSerializer
-from supabase import create_client, Client
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from config import DevelopmentConfig, ProductionConfig
+from cache import creer_cache_rpc
+from admission import ControleAdmission
+from coalescence import Coalescence
+from agregats import creer_cumuls
+from segments import creer_segments
+from taches_export import GestionnaireExports
+from demo import MoteurDemo
+from sources import creer_source_donnees
+from clients_http import pool_http
 # On importe nos instances d'extensions depuis le nouveau fichier
-from extensions import login_manager, oauth
+from extensions import instrumentation, login_manager, oauth
+from instrumentation import mesurer
 # Dans auth.py
 from utils import (
     find_user_by_email, 
+    find_user_by_email_cached,
     update_user, 
     get_all_users, 
     delete_user,
     get_protected_admins,
     generate_recovery_code,
-    load_guides_data
+    load_guides_data,
+    supabase as client_supabase_utilisateurs
 )
 
 
@@ -88,11 +99,13 @@ class Utilisateur(UserMixin):
 @login_manager.user_loader
 def load_user(user_id):
     """
-    Charge les données de l'utilisateur depuis la base de données SQLite,
+    Charge les données de l'utilisateur depuis la base de données,
     puis crée et retourne un objet Utilisateur complet.
+    Appelée à chaque requête authentifiée : on passe donc par le cache des utilisateurs.
     """
-    # Étape 1: Trouver les données de l'utilisateur dans la base de données.
-    user_data = find_user_by_email(user_id)
+    # Étape 1: Trouver les données de l'utilisateur (cache, sinon base de données).
+    with mesurer('utilisateur'):
+        user_data = find_user_by_email_cached(user_id)
 
     if not user_data:
         return None
@@ -133,6 +146,7 @@ def create_app():
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     oauth.init_app(app)
+    instrumentation.init_app(app)
     
     # --- 3. CONFIGURATION DES SERVICES (OAuth, Supabase, etc.) ---
     # Ceci est fait après que la configuration et les extensions sont prêtes.
@@ -161,9 +175,46 @@ def create_app():
     # Client Supabase
     url, key = app.config.get('SUPABASE_URL'), app.config.get('SUPABASE_KEY')
     if url and key:
-        app.supabase = create_client(url, key)
+        # Vue sur le pool HTTP partagé du processus (connexions persistantes, nouvelles tentatives)
+        app.supabase = pool_http.supabase(url, key)
     else:
         app.supabase = None
+
+    # Source des données (RPC de recherche et d'agrégation) : Supabase ou base SQLite locale
+    app.source_donnees = creer_source_donnees(
+        app.config['SOURCE_DONNEES'],
+        client_rpc=app.supabase,
+        client_utilisateurs=client_supabase_utilisateurs,
+        chemin_sqlite=app.config['SOURCE_SQLITE_CHEMIN']
+    )
+
+    # Cache des résultats des RPC (backend choisi par la configuration)
+    app.cache_rpc = creer_cache_rpc(app.config)
+
+    # Segments mensuels de l'historique (lecture partitionnée ; None si désactivés ou sans pyarrow)
+    app.segments = creer_segments(app.config)
+
+    # Regroupement des appels RPC identiques en cours (un seul appel à la source pour des requêtes simultanées)
+    app.coalescence = Coalescence(app.config['COALESCENCE_ATTENTE_MAX'])
+
+    # Cumuls mensuels précalculés des requêtes avancées (None tant qu'ils n'ont pas été calculés)
+    app.cumuls = creer_cumuls(app.config)
+
+    # Contrôle d'admission des recherches, exports et requêtes avancées (capacité, limite par utilisateur, file)
+    app.admission = ControleAdmission.depuis_config(app.config)
+
+    # Gestionnaire des exports asynchrones (pool de threads + fichiers temporaires)
+    app.exports = GestionnaireExports(
+        app.config['EXPORTS_DOSSIER'],
+        app.config['EXPORTS_NB_WORKERS'],
+        app.config['EXPORTS_DUREE_CONSERVATION'],
+        app.config['EXPORTS_PAR_UTILISATEUR'],
+        app.config['EXPORTS_FILE_MAX'],
+        app.config['EXPORTS_RETRY_AFTER']
+    )
+
+    # Moteur de requêtes local du mode démonstration (données indexées côté serveur)
+    app.demo = MoteurDemo(os.path.join(basedir, 'static', 'data_demo'), app.config['DEMO_LIGNES_SYNTHETIQUES'])
         
     # --- 4. ENREGISTREMENT DES BLUEPRINTS ---
     # On importe et on enregistre les blueprints À L'INTÉRIEUR de la fonction, à la fin.
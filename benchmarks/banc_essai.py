@@ -0,0 +1,327 @@
+# benchmarks/banc_essai.py
+"""
+Banc d'essai des chemins critiques de l'application (requêtes, sérialisation, exports, rendu).
+
+Les données sont synthétiques (mêmes colonnes que static/data_demo) et servies par une base
+SQLite locale (SOURCE_DONNEES=sqlite) : aucune connexion à Supabase n'est nécessaire et les
+mesures sont reproductibles d'une machine / d'un commit à l'autre. Les routes sont appelées
+via le client de test de Flask, avec un utilisateur connecté.
+
+Chaque couple (scénario, taille) est exécuté dans un processus séparé, ce qui permet de mesurer
+son pic de mémoire (RSS) sans être influencé par les scénarios précédents.
+
+Utilisation (depuis la racine du projet) :
+    python benchmarks/banc_essai.py                                  # tailles 1k, 10k, 100k
+    python benchmarks/banc_essai.py --tailles 1000,1000000 --repetitions 3
+    python benchmarks/banc_essai.py --scenarios export_csv,export_xlsx
+    python benchmarks/banc_essai.py --comparer benchmarks/resultats/ancien.json
+
+Les résultats sont écrits en JSON dans benchmarks/resultats/ (un fichier par exécution,
+nommé d'après le commit courant) ; --comparer affiche l'écart avec un résultat précédent.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+RACINE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DOSSIER_RESULTATS = os.path.join(RACINE, 'benchmarks', 'resultats')
+DOSSIER_BASES = os.path.join(tempfile.gettempdir(), 'amco_benchmarks')
+
+# Les modules de l'application sont à la racine du projet.
+sys.path.insert(0, RACINE)
+
+EMAIL_BANC = 'banc-essai@amco.local'
+IP_BANC = '127.0.0.1'
+GRAINE = 42
+
+# Filtres couvrant toute la période : toutes les lignes générées sont retournées.
+FILTRES_TOUT = {'start_year': '1900', 'start_month': '1'}
+
+
+# =======================================================
+# Scénarios
+# =======================================================
+
+def _scenario_api_query(client, type_transaction):
+    reponse = client.post('/api/query', json={'type_transaction': type_transaction, 'filtres': FILTRES_TOUT})
+    return reponse, None
+
+
+def _scenario_api_query_colonnes(client, type_transaction):
+    reponse = client.post('/api/query', json={'type_transaction': type_transaction, 'filtres': FILTRES_TOUT,
+                                              'format': 'colonnes'})
+    return reponse, None
+
+
+def _scenario_api_query_page(client, type_transaction):
+    reponse = client.post('/api/query', json={'type_transaction': type_transaction, 'filtres': FILTRES_TOUT,
+                                              'pagination': {'taille_page': 15, 'avec_total': True}})
+    return reponse, 15
+
+
+def _scenario_recuperer_donnees_rpc(client, type_transaction):
+    from main_routes import recuperer_donnees_rpc
+    with client.application.app_context():
+        df = recuperer_donnees_rpc(type_transaction, FILTRES_TOUT)
+    return None, len(df)
+
+
+def _scenario_export(format_demande):
+    def scenario(client, type_transaction):
+        reponse = client.post(f'/api/{type_transaction}/download',
+                              json={'format': format_demande, 'filtres': FILTRES_TOUT})
+        return reponse, None
+    return scenario
+
+
+def _scenario_rendu_avancee(client, type_transaction):
+    nom_fonction = 'top_articles_par_client' if type_transaction == 'ventes' else 'top_articles_par_client_achats'
+    reponse = client.post('/cartes-requete-avancee/filtres-requete-avancee',
+                          data={'nom_fonction': nom_fonction, 'start_year': '1900', 'start_month': '1'})
+    return reponse, None
+
+
+SCENARIOS = {
+    'recuperer_donnees_rpc': _scenario_recuperer_donnees_rpc,
+    'api_query_json': _scenario_api_query,
+    'api_query_colonnes': _scenario_api_query_colonnes,
+    'api_query_page': _scenario_api_query_page,
+    'export_csv': _scenario_export('csv'),
+    'export_xlsx': _scenario_export('xlsx'),
+    'rendu_requete_avancee': _scenario_rendu_avancee,
+}
+
+
+# =======================================================
+# Préparation des données et de l'application
+# =======================================================
+
+def chemin_base(taille: int) -> str:
+    return os.path.join(DOSSIER_BASES, f'donnees_{taille}_{GRAINE}.sqlite3')
+
+
+def preparer_base(taille: int) -> str:
+    """Crée (une seule fois par taille) la base SQLite de données synthétiques."""
+    from demo import generer_lignes_synthetiques
+    from sources import SourceSQLite
+
+    chemin = chemin_base(taille)
+    if os.path.exists(chemin):
+        return chemin
+    os.makedirs(DOSSIER_BASES, exist_ok=True)
+    chemin_temporaire = chemin + '.partiel'
+    if os.path.exists(chemin_temporaire):
+        os.remove(chemin_temporaire)
+    source = SourceSQLite(chemin_temporaire)
+    for type_transaction in ('ventes', 'achats'):
+        source.charger_transactions(type_transaction, generer_lignes_synthetiques(type_transaction, taille, GRAINE))
+    source.enregistrer_utilisateur({'email': EMAIL_BANC, 'nom': 'Banc essai', 'role': 'admin',
+                                    'actif': True, 'confirmed': True})
+    for suffixe in ('', '-wal', '-shm'):
+        if os.path.exists(chemin_temporaire + suffixe):
+            os.replace(chemin_temporaire + suffixe, chemin + suffixe)
+    return chemin
+
+
+def creer_client(chemin: str, avec_cache: bool):
+    """Importe l'application configurée sur la base locale et retourne un client de test connecté."""
+    os.environ['SOURCE_DONNEES'] = 'sqlite'
+    os.environ['SOURCE_SQLITE_CHEMIN'] = chemin
+    os.environ['CACHE_RPC_BACKEND'] = 'memoire' if avec_cache else 'aucun'
+    os.environ['ALLOWED_IPS'] = IP_BANC
+    os.environ['INSTRUMENTATION_LOGS'] = 'false'  # Une ligne de log par requête fausserait les mesures
+    os.environ.setdefault('AZURE_TENANT_ID', 'banc-essai')
+    os.environ.setdefault('FLASK_SECRET_KEY', 'banc-essai')
+    os.chdir(RACINE)
+
+    from app import app
+
+    app.config['TESTING'] = True
+    client = app.test_client()
+    client.environ_base['HTTP_X_FORWARDED_FOR'] = IP_BANC
+    with client.session_transaction() as session:
+        session['_user_id'] = EMAIL_BANC
+        session['_fresh'] = True
+    return client
+
+
+# =======================================================
+# Mesure
+# =======================================================
+
+def percentile(valeurs: list, rang: float) -> float:
+    """Percentile par interpolation linéaire (valeurs triées)."""
+    valeurs = sorted(valeurs)
+    if len(valeurs) == 1:
+        return valeurs[0]
+    position = (len(valeurs) - 1) * rang / 100
+    bas = int(position)
+    haut = min(bas + 1, len(valeurs) - 1)
+    return valeurs[bas] + (valeurs[haut] - valeurs[bas]) * (position - bas)
+
+
+def mesurer(nom_scenario: str, taille: int, repetitions: int, type_transaction: str, avec_cache: bool) -> dict:
+    """Exécute un scénario 'repetitions' fois (après un appel de chauffe) et retourne ses mesures."""
+    scenario = SCENARIOS[nom_scenario]
+
+    # Les routes affichent des traces de débogage : on les envoie sur stderr pour garder stdout au JSON.
+    with contextlib.redirect_stdout(sys.stderr):
+        client = creer_client(preparer_base(taille), avec_cache)
+        # Chauffe (imports, compilation des templates...)
+        reponse, _ = scenario(client, type_transaction)
+        if reponse is not None:
+            reponse.close()
+        durees, octets, lignes = [], 0, taille
+        for _ in range(repetitions):
+            debut = time.perf_counter()
+            reponse, lignes_traitees = scenario(client, type_transaction)
+            if reponse is not None:
+                # La réponse est fermée après lecture : sa fermeture rend les unités du contrôle d'admission.
+                with reponse:
+                    corps = reponse.get_data()  # Consomme entièrement une éventuelle réponse en flux
+                if reponse.status_code >= 400:
+                    raise RuntimeError(f"{nom_scenario} : statut HTTP {reponse.status_code} ({corps[:200]!r})")
+                octets = len(corps)
+            durees.append(time.perf_counter() - debut)
+            if lignes_traitees is not None:
+                lignes = lignes_traitees
+
+    moyenne = statistics.mean(durees)
+    return {
+        "scenario": nom_scenario,
+        "lignes": taille,
+        "type_transaction": type_transaction,
+        "repetitions": repetitions,
+        "latence_ms": {
+            "min": round(min(durees) * 1000, 3),
+            "p50": round(percentile(durees, 50) * 1000, 3),
+            "p90": round(percentile(durees, 90) * 1000, 3),
+            "p99": round(percentile(durees, 99) * 1000, 3),
+            "max": round(max(durees) * 1000, 3),
+            "moyenne": round(moyenne * 1000, 3),
+        },
+        "debit_lignes_s": round(lignes / moyenne, 1) if moyenne else None,
+        "octets_reponse": octets,
+        # ru_maxrss est en kilo-octets sous Linux (en octets sous macOS).
+        "rss_max_mo": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                            / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+    }
+
+
+def executer_isole(nom_scenario: str, taille: int, arguments) -> dict:
+    """Lance la mesure d'un scénario dans un sous-processus et retourne son résultat."""
+    commande = [sys.executable, os.path.abspath(__file__), '--executer-un', nom_scenario, str(taille),
+                '--repetitions', str(arguments.repetitions), '--type', arguments.type]
+    if arguments.avec_cache:
+        commande.append('--avec-cache')
+    sortie = subprocess.run(commande, cwd=RACINE, capture_output=True, text=True)
+    if sortie.returncode != 0:
+        return {"scenario": nom_scenario, "lignes": taille, "erreur": sortie.stderr.strip().splitlines()[-1:]}
+    return json.loads(sortie.stdout)
+
+
+# =======================================================
+# Résultats
+# =======================================================
+
+def commit_courant() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RACINE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'inconnu'
+
+
+def comparer(resultats: list, chemin_reference: str):
+    """Affiche, pour chaque mesure, l'évolution de la latence p50 par rapport à un fichier de référence."""
+    with open(chemin_reference, encoding='utf-8') as f:
+        reference = json.load(f)
+    index = {(r['scenario'], r['lignes']): r for r in reference['resultats'] if 'latence_ms' in r}
+    print(f"\nComparaison avec {chemin_reference} (commit {reference.get('commit')}) :")
+    for resultat in resultats:
+        ancien = index.get((resultat['scenario'], resultat['lignes']))
+        if not ancien or 'latence_ms' not in resultat:
+            continue
+        avant, apres = ancien['latence_ms']['p50'], resultat['latence_ms']['p50']
+        ecart = (apres - avant) / avant * 100 if avant else 0.0
+        print(f"  {resultat['scenario']:<24} {resultat['lignes']:>9} lignes : "
+              f"p50 {avant:>10.1f} ms -> {apres:>10.1f} ms ({ecart:+.1f} %)")
+
+
+def afficher(resultat: dict):
+    if 'erreur' in resultat:
+        print(f"  {resultat['scenario']:<24} {resultat['lignes']:>9} lignes : ERREUR {resultat['erreur']}")
+        return
+    latence = resultat['latence_ms']
+    print(f"  {resultat['scenario']:<24} {resultat['lignes']:>9} lignes : p50 {latence['p50']:>10.1f} ms"
+          f"  p90 {latence['p90']:>10.1f} ms  {resultat['debit_lignes_s'] or 0:>12.0f} lignes/s"
+          f"  RSS max {resultat['rss_max_mo']:>7.1f} Mo")
+
+
+def main():
+    analyseur = argparse.ArgumentParser(description="Banc d'essai des chemins critiques de l'application.")
+    analyseur.add_argument('--tailles', default='1000,10000,100000',
+                           help="Nombres de lignes synthétiques, séparés par des virgules.")
+    analyseur.add_argument('--scenarios', default=','.join(SCENARIOS),
+                           help=f"Scénarios à exécuter parmi : {', '.join(SCENARIOS)}.")
+    analyseur.add_argument('--repetitions', type=int, default=5)
+    analyseur.add_argument('--type', default='ventes', choices=['ventes', 'achats'])
+    analyseur.add_argument('--avec-cache', action='store_true', help="Active le cache des RPC (désactivé par défaut).")
+    analyseur.add_argument('--sortie', help="Fichier JSON de résultats (par défaut dans benchmarks/resultats/).")
+    analyseur.add_argument('--comparer', help="Fichier JSON d'une exécution précédente à comparer.")
+    analyseur.add_argument('--executer-un', nargs=2, metavar=('SCENARIO', 'TAILLE'), help=argparse.SUPPRESS)
+    arguments = analyseur.parse_args()
+
+    if arguments.executer_un:
+        nom_scenario, taille = arguments.executer_un
+        resultat = mesurer(nom_scenario, int(taille), arguments.repetitions, arguments.type, arguments.avec_cache)
+        print(json.dumps(resultat))
+        return
+
+    tailles = [int(t) for t in arguments.tailles.split(',') if t.strip()]
+    scenarios = [s.strip() for s in arguments.scenarios.split(',') if s.strip()]
+    inconnus = [s for s in scenarios if s not in SCENARIOS]
+    if inconnus:
+        analyseur.error(f"Scénario(s) inconnu(s) : {', '.join(inconnus)}")
+
+    resultats = []
+    for taille in tailles:
+        print(f"Préparation des données ({taille} lignes)...")
+        preparer_base(taille)
+        for nom_scenario in scenarios:
+            resultat = executer_isole(nom_scenario, taille, arguments)
+            afficher(resultat)
+            resultats.append(resultat)
+
+    commit = commit_courant()
+    rapport = {
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "plateforme": platform.platform(),
+        "parametres": {"repetitions": arguments.repetitions, "type_transaction": arguments.type,
+                       "avec_cache": arguments.avec_cache, "graine": GRAINE},
+        "resultats": resultats,
+    }
+    sortie = arguments.sortie or os.path.join(
+        DOSSIER_RESULTATS, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(sortie)), exist_ok=True)
+    with open(sortie, 'w', encoding='utf-8') as f:
+        json.dump(rapport, f, ensure_ascii=False, indent=2)
+    print(f"\nRésultats enregistrés dans {sortie}")
+
+    if arguments.comparer:
+        comparer(resultats, arguments.comparer)
+
+
+if __name__ == '__main__':
+    main()
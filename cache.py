@@ -0,0 +1,242 @@
+# cache.py
+"""
+Ce fichier contient le cache des résultats des RPC Supabase.
+Les données historiques changent rarement : un même jeu de filtres renvoie le même résultat,
+on peut donc le conserver quelques temps au lieu de ré-exécuter la RPC.
+
+Deux backends sont disponibles :
+- BackendMemoire : dictionnaire LRU propre au processus (le plus rapide) ;
+- BackendSQLite  : fichier SQLite local, partagé entre les workers d'une même machine.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class BackendMemoire:
+    """Cache LRU en mémoire, borné par la taille totale (en octets) des valeurs stockées."""
+
+    def __init__(self, taille_max_octets: int):
+        self.taille_max_octets = taille_max_octets
+        self._entrees = OrderedDict()  # cle -> (valeur, expiration)
+        self._taille_octets = 0
+        self._verrou = threading.Lock()
+
+    def lire(self, cle: str):
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is None:
+                return None
+            valeur, expiration = entree
+            if expiration < time.time():
+                self._retirer(cle)
+                return None
+            self._entrees.move_to_end(cle)
+            return valeur
+
+    def ecrire(self, cle: str, valeur: bytes, ttl: int):
+        with self._verrou:
+            if cle in self._entrees:
+                self._retirer(cle)
+            self._entrees[cle] = (valeur, time.time() + ttl)
+            self._taille_octets += len(valeur)
+            # Éviction des entrées les moins récemment utilisées jusqu'à respecter la limite.
+            while self._taille_octets > self.taille_max_octets and self._entrees:
+                self._retirer(next(iter(self._entrees)))
+
+    def supprimer(self, cle: str):
+        with self._verrou:
+            if cle in self._entrees:
+                self._retirer(cle)
+
+    def vider(self):
+        with self._verrou:
+            self._entrees.clear()
+            self._taille_octets = 0
+
+    def etat(self) -> dict:
+        with self._verrou:
+            return {"entrees": len(self._entrees), "octets": self._taille_octets}
+
+    def _retirer(self, cle: str):
+        valeur, _ = self._entrees.pop(cle)
+        self._taille_octets -= len(valeur)
+
+
+class BackendSQLite:
+    """
+    Cache stocké dans un fichier SQLite local. Plusieurs processus (workers) peuvent le partager.
+    L'éviction LRU se base sur la date du dernier accès de chaque entrée.
+    """
+
+    def __init__(self, chemin: str, taille_max_octets: int):
+        self.chemin = chemin
+        self.taille_max_octets = taille_max_octets
+        with self._connexion() as connexion:
+            connexion.execute("PRAGMA journal_mode=WAL")
+            connexion.execute(
+                "CREATE TABLE IF NOT EXISTS cache_rpc ("
+                " cle TEXT PRIMARY KEY, valeur BLOB NOT NULL, taille INTEGER NOT NULL,"
+                " expiration REAL NOT NULL, dernier_acces REAL NOT NULL)"
+            )
+            connexion.execute("CREATE INDEX IF NOT EXISTS idx_cache_rpc_acces ON cache_rpc (dernier_acces)")
+
+    @contextmanager
+    def _connexion(self):
+        # Une connexion par opération : simple et sûr entre threads et processus.
+        connexion = sqlite3.connect(self.chemin, timeout=5)
+        try:
+            with connexion:
+                yield connexion
+        finally:
+            connexion.close()
+
+    def lire(self, cle: str):
+        maintenant = time.time()
+        with self._connexion() as connexion:
+            ligne = connexion.execute(
+                "SELECT valeur, expiration FROM cache_rpc WHERE cle = ?", (cle,)
+            ).fetchone()
+            if ligne is None:
+                return None
+            valeur, expiration = ligne
+            if expiration < maintenant:
+                connexion.execute("DELETE FROM cache_rpc WHERE cle = ?", (cle,))
+                return None
+            connexion.execute("UPDATE cache_rpc SET dernier_acces = ? WHERE cle = ?", (maintenant, cle))
+            return bytes(valeur)
+
+    def ecrire(self, cle: str, valeur: bytes, ttl: int):
+        maintenant = time.time()
+        with self._connexion() as connexion:
+            connexion.execute(
+                "INSERT OR REPLACE INTO cache_rpc (cle, valeur, taille, expiration, dernier_acces)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (cle, valeur, len(valeur), maintenant + ttl, maintenant),
+            )
+            connexion.execute("DELETE FROM cache_rpc WHERE expiration < ?", (maintenant,))
+            # Éviction LRU : on supprime les entrées les plus anciennes tant que la limite est dépassée.
+            total = connexion.execute("SELECT COALESCE(SUM(taille), 0) FROM cache_rpc").fetchone()[0]
+            if total > self.taille_max_octets:
+                anciennes = connexion.execute(
+                    "SELECT cle, taille FROM cache_rpc ORDER BY dernier_acces ASC"
+                ).fetchall()
+                for ancienne_cle, taille in anciennes:
+                    if total <= self.taille_max_octets:
+                        break
+                    connexion.execute("DELETE FROM cache_rpc WHERE cle = ?", (ancienne_cle,))
+                    total -= taille
+
+    def supprimer(self, cle: str):
+        with self._connexion() as connexion:
+            connexion.execute("DELETE FROM cache_rpc WHERE cle = ?", (cle,))
+
+    def vider(self):
+        with self._connexion() as connexion:
+            connexion.execute("DELETE FROM cache_rpc")
+
+    def etat(self) -> dict:
+        with self._connexion() as connexion:
+            entrees, octets = connexion.execute(
+                "SELECT COUNT(*), COALESCE(SUM(taille), 0) FROM cache_rpc"
+            ).fetchone()
+        return {"entrees": entrees, "octets": octets}
+
+
+class CacheResultats:
+    """
+    Cache des résultats RPC, indexé par le couple (nom_rpc, params) mis sous forme canonique.
+    Les valeurs sont sérialisées en JSON, ce qui permet de mesurer leur taille en octets.
+    Les compteurs de succès/échecs sont propres à chaque processus.
+    """
+
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.succes = 0
+        self.echecs = 0
+        self._verrou = threading.Lock()
+
+    @staticmethod
+    def cle(nom_rpc: str, params: dict, variante=None) -> str:
+        """Clé canonique : l'ordre des paramètres n'a pas d'importance."""
+        canonique = json.dumps([nom_rpc, params, variante], sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonique.encode('utf-8')).hexdigest()
+
+    def obtenir(self, nom_rpc: str, params: dict, producteur, variante=None):
+        """
+        Retourne la valeur en cache pour (nom_rpc, params, variante), ou appelle 'producteur()'
+        pour la calculer puis la stocker. 'variante' distingue les différentes lectures d'une même
+        RPC (page, tri, plage de lignes...). Les exceptions du producteur ne sont pas mises en cache.
+        """
+        cle = self.cle(nom_rpc, params, variante)
+        valeur = self.backend.lire(cle)
+        if valeur is not None:
+            with self._verrou:
+                self.succes += 1
+            return json.loads(valeur)
+
+        with self._verrou:
+            self.echecs += 1
+        resultat = producteur()
+        donnees = json.dumps(resultat, separators=(',', ':'), default=str).encode('utf-8')
+        # Une entrée plus grosse que le quart du cache en chasserait tout le reste : on ne la garde pas.
+        if len(donnees) <= self.backend.taille_max_octets // 4:
+            self.backend.ecrire(cle, donnees, self.ttl)
+        return resultat
+
+    def invalider(self, nom_rpc: str, params: dict, variante=None):
+        """Supprime du cache l'entrée correspondant à (nom_rpc, params, variante)."""
+        self.backend.supprimer(self.cle(nom_rpc, params, variante))
+
+    def vider(self):
+        self.backend.vider()
+
+    def stats(self) -> dict:
+        with self._verrou:
+            succes, echecs = self.succes, self.echecs
+        total = succes + echecs
+        return {
+            "succes": succes,
+            "echecs": echecs,
+            "taux_succes": round(succes / total, 4) if total else None,
+            "ttl": self.ttl,
+            "taille_max_octets": self.backend.taille_max_octets,
+            **self.backend.etat(),
+        }
+
+
+class CacheInactif(CacheResultats):
+    """Remplaçant sans stockage, utilisé quand le cache est désactivé par la configuration."""
+
+    def __init__(self):
+        super().__init__(backend=None, ttl=0)
+
+    def obtenir(self, nom_rpc, params, producteur, variante=None):
+        with self._verrou:
+            self.echecs += 1
+        return producteur()
+
+    def invalider(self, nom_rpc, params, variante=None):
+        pass
+
+    def vider(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"succes": 0, "echecs": self.echecs, "taux_succes": None, "ttl": 0, "actif": False}
+
+
+def creer_cache_rpc(config) -> CacheResultats:
+    """Construit le cache des RPC à partir de la configuration de l'application."""
+    backend = (config.get('CACHE_RPC_BACKEND') or 'memoire').lower()
+    taille_max = config.get('CACHE_RPC_TAILLE_MAX')
+    if backend == 'memoire':
+        return CacheResultats(BackendMemoire(taille_max), config.get('CACHE_RPC_TTL'))
+    if backend == 'sqlite':
+        return CacheResultats(BackendSQLite(config.get('CACHE_RPC_CHEMIN'), taille_max), config.get('CACHE_RPC_TTL'))
+    return CacheInactif()
@@ -0,0 +1,203 @@
+# clients_http.py
+"""
+Ce fichier regroupe la couche HTTP partagée par tout le trafic sortant de l'application :
+- un seul pool de connexions httpx (HTTP/2, connexions persistantes) pour Supabase,
+  quel que soit le schéma (public, auth_users) ou le service (PostgREST, Storage) ;
+- un pool requests pour les sessions OAuth (Google / Microsoft) d'authlib ;
+- des délais (connexion / lecture) et un nombre de connexions configurables ;
+- de nouvelles tentatives, avec attente exponentielle, sur les erreurs de connexion
+  et les erreurs 5xx transitoires (502, 503, 504).
+
+Le pool est porté par le transport httpx, pas par le client : supabase-py modifie le client
+qu'on lui confie (URL de base, en-têtes du schéma). Chaque « vue » Supabase a donc son propre
+client httpx, léger, mais tous les clients partagent le même transport et donc les mêmes connexions.
+Une vue ne doit servir qu'à un seul service (PostgREST OU Storage).
+"""
+import logging
+import random
+import threading
+import time
+
+import httpx
+from authlib.integrations.flask_client import FlaskOAuth2App, OAuth
+from authlib.integrations.requests_client import OAuth2Session
+from requests.adapters import HTTPAdapter
+from supabase import Client, create_client
+from supabase.lib.client_options import ClientOptions
+from urllib3.util.retry import Retry
+
+from config import BaseConfig
+
+journal = logging.getLogger(__name__)
+
+# Réponses considérées comme transitoires (passerelle / service momentanément indisponible).
+STATUTS_TRANSITOIRES = (502, 503, 504)
+# Méthodes sans effet de bord, qu'on peut toujours rejouer.
+METHODES_REJOUABLES = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _rejouable(requete: httpx.Request) -> bool:
+    """
+    Indique si la requête peut être renvoyée sans risque après une réponse ou une coupure.
+    Les RPC appelées par l'application sont des lectures (POST /rest/v1/rpc/...) : on les rejoue aussi.
+    """
+    return requete.method in METHODES_REJOUABLES or (requete.method == 'POST' and '/rpc/' in requete.url.path)
+
+
+class TransportReessai(httpx.HTTPTransport):
+    """
+    Transport httpx (pool de connexions) qui retente les requêtes en échec transitoire.
+    Une erreur d'établissement de connexion est toujours retentée (la requête n'est pas partie) ;
+    une coupure en cours d'échange ou un statut 502/503/504 ne l'est que pour une requête rejouable.
+    """
+
+    def __init__(self, tentatives: int = 2, delai_initial: float = 0.2, **kwargs):
+        super().__init__(**kwargs)
+        self.tentatives = tentatives
+        self.delai_initial = delai_initial
+
+    def _attendre(self, tentative: int):
+        # Attente exponentielle avec une part aléatoire, pour ne pas relancer tous les workers en même temps.
+        time.sleep(self.delai_initial * (2 ** tentative) + random.uniform(0, self.delai_initial))
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        for tentative in range(self.tentatives + 1):
+            derniere = tentative == self.tentatives
+            try:
+                reponse = super().handle_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as erreur:
+                if derniere:
+                    raise
+                journal.warning("Connexion impossible à %s (%s), nouvelle tentative.", request.url.host, erreur)
+            except (httpx.ReadError, httpx.WriteError, httpx.RemoteProtocolError) as erreur:
+                if derniere or not _rejouable(request):
+                    raise
+                journal.warning("Échange interrompu avec %s (%s), nouvelle tentative.", request.url.host, erreur)
+            else:
+                if derniere or reponse.status_code not in STATUTS_TRANSITOIRES or not _rejouable(request):
+                    return reponse
+                journal.warning("Réponse %s de %s, nouvelle tentative.", reponse.status_code, request.url.path)
+                reponse.close()
+            self._attendre(tentative)
+
+    def close(self):
+        # Les clients httpx ferment leur transport à leur fermeture : le pool partagé doit leur survivre.
+        # Il n'est fermé que par PoolHttp.fermer().
+        pass
+
+    def fermer(self):
+        super().close()
+
+
+class AdaptateurPartage(HTTPAdapter):
+    """Adaptateur requests monté sur plusieurs sessions : leur fermeture ne vide pas le pool commun."""
+
+    def close(self):
+        pass
+
+
+class PoolHttp:
+    """Pool de connexions partagé par les clients HTTP de l'application (un par processus)."""
+
+    def __init__(self, taille_pool: int = 20, connexions_persistantes: int = 10,
+                 duree_keepalive: float = 30.0, delai_connexion: float = 5.0, delai_lecture: float = 30.0,
+                 tentatives: int = 2, delai_reessai: float = 0.2, http2: bool = True):
+        self.taille_pool = taille_pool
+        self.tentatives = tentatives
+        self.delai_reessai = delai_reessai
+        self.timeout = httpx.Timeout(delai_lecture, connect=delai_connexion)
+        self.transport = TransportReessai(
+            tentatives=tentatives,
+            delai_initial=delai_reessai,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=taille_pool,
+                max_keepalive_connections=connexions_persistantes,
+                keepalive_expiry=duree_keepalive,
+            ),
+        )
+        self._adaptateur_requests = None
+        self._verrou = threading.Lock()
+
+    @classmethod
+    def depuis_config(cls, config) -> 'PoolHttp':
+        return cls(
+            taille_pool=config.HTTP_POOL_TAILLE,
+            connexions_persistantes=config.HTTP_POOL_CONNEXIONS_PERSISTANTES,
+            duree_keepalive=config.HTTP_POOL_DUREE_KEEPALIVE,
+            delai_connexion=config.HTTP_DELAI_CONNEXION,
+            delai_lecture=config.HTTP_DELAI_LECTURE,
+            tentatives=config.HTTP_TENTATIVES,
+            delai_reessai=config.HTTP_DELAI_REESSAI,
+            http2=config.HTTP2,
+        )
+
+    def client_httpx(self) -> httpx.Client:
+        """Nouveau client httpx (URL de base, en-têtes propres) au-dessus du pool partagé."""
+        return httpx.Client(transport=self.transport, timeout=self.timeout, follow_redirects=True)
+
+    def supabase(self, url: str, key: str, schema: str = 'public') -> Client:
+        """
+        Vue Supabase sur le pool partagé, pour un schéma donné.
+        À n'utiliser que pour un seul service (tables / RPC, ou bien Storage) : voir l'en-tête du module.
+        """
+        return create_client(url, key, ClientOptions(schema=schema, httpx_client=self.client_httpx()))
+
+    def adaptateur_requests(self) -> AdaptateurPartage:
+        """Adaptateur requests partagé (sessions OAuth), créé au premier appel."""
+        with self._verrou:
+            if self._adaptateur_requests is None:
+                self._adaptateur_requests = AdaptateurPartage(
+                    pool_connections=4,  # Un pool par hôte : Google, Microsoft (login + Graph)...
+                    pool_maxsize=self.taille_pool,
+                    max_retries=Retry(
+                        total=self.tentatives,
+                        backoff_factor=self.delai_reessai,
+                        status_forcelist=STATUTS_TRANSITOIRES,
+                        allowed_methods=METHODES_REJOUABLES,
+                        raise_on_status=False,
+                    ),
+                )
+            return self._adaptateur_requests
+
+    def monter(self, session):
+        """Fait passer une session requests par le pool partagé."""
+        adaptateur = self.adaptateur_requests()
+        session.mount('https://', adaptateur)
+        session.mount('http://', adaptateur)
+        return session
+
+    def fermer(self):
+        self.transport.fermer()
+        if self._adaptateur_requests is not None:
+            HTTPAdapter.close(self._adaptateur_requests)
+
+
+# =======================================================
+# Sessions OAuth (authlib) sur le pool partagé
+# =======================================================
+
+class SessionOAuth2Partagee(OAuth2Session):
+    """
+    Session OAuth 2 d'authlib qui passe par le pool partagé.
+    authlib crée une session par appel (métadonnées, échange du code, userinfo, Graph...) :
+    sans cela, chaque appel ouvrait une nouvelle connexion TLS.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('default_timeout', (pool_http.timeout.connect, pool_http.timeout.read))
+        super().__init__(*args, **kwargs)
+        pool_http.monter(self)
+
+
+class ApplicationOAuth2(FlaskOAuth2App):
+    client_cls = SessionOAuth2Partagee
+
+
+class OAuthPoolPartage(OAuth):
+    """Registre OAuth de Flask dont les clients OAuth 2 utilisent SessionOAuth2Partagee."""
+    oauth2_client_cls = ApplicationOAuth2
+
+
+# Pool unique du processus : utils.py (comptes, stockage) et l'application (RPC, OAuth) l'utilisent.
+pool_http = PoolHttp.depuis_config(BaseConfig)
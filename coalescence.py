@@ -0,0 +1,106 @@
+# coalescence.py
+"""
+Ce fichier contient le regroupement des appels RPC identiques et simultanés (« single-flight »).
+Quand une équipe ouvre le même rapport au même moment, les requêtes arrivent ensemble, avant que
+le premier résultat ne soit en cache : sans regroupement, chacune lance sa propre RPC.
+
+Le premier appel d'une clé (nom_rpc, params, options mis sous forme canonique) est exécuté ;
+les appels identiques qui arrivent pendant son exécution l'attendent et reçoivent son résultat
+(ou son exception). Un appel qui attend plus de COALESCENCE_ATTENTE_MAX secondes renonce et
+exécute sa propre RPC. Le résultat est partagé entre les appels regroupés : il ne doit pas être modifié.
+Le regroupement est propre à chaque processus, comme le cache en mémoire.
+"""
+import threading
+
+from cache import CacheResultats
+from instrumentation import mesurer
+
+
+class _AppelEnVol:
+    """Appel en cours d'exécution pour une clé, attendu par 'abonnes' autres appels."""
+    __slots__ = ('termine', 'resultat', 'erreur', 'abonnes')
+
+    def __init__(self):
+        self.termine = threading.Event()
+        self.resultat = None
+        self.erreur = None
+        self.abonnes = 0
+
+
+class Coalescence:
+    """Regroupement des appels identiques en cours dans le processus, avec compteurs."""
+
+    def __init__(self, attente_max: float):
+        # Une attente maximale nulle désactive le regroupement (chaque appel est exécuté).
+        self.attente_max = attente_max
+        self._verrou = threading.Lock()
+        self._en_vol = {}
+        self._executes = 0
+        self._regroupes = 0
+        self._delais = 0
+        self._erreurs_partagees = 0
+        self._abonnes_max = 0
+
+    @property
+    def actif(self) -> bool:
+        return self.attente_max > 0
+
+    def executer(self, nom_rpc: str, params: dict, producteur, variante=None):
+        """
+        Retourne le résultat de 'producteur()' pour (nom_rpc, params, variante). Si un appel identique
+        est déjà en cours, attend son résultat au lieu d'appeler 'producteur'.
+        """
+        if not self.actif:
+            return producteur()
+        cle = CacheResultats.cle(nom_rpc, params, variante)
+        with self._verrou:
+            appel = self._en_vol.get(cle)
+            meneur = appel is None
+            if meneur:
+                appel = self._en_vol[cle] = _AppelEnVol()
+                self._executes += 1
+            else:
+                appel.abonnes += 1
+                self._abonnes_max = max(self._abonnes_max, appel.abonnes)
+
+        if meneur:
+            try:
+                appel.resultat = producteur()
+            except BaseException as e:
+                appel.erreur = e
+                raise
+            finally:
+                # La clé est libérée avant le réveil : un appel arrivé après la fin en lance un nouveau.
+                with self._verrou:
+                    del self._en_vol[cle]
+                appel.termine.set()
+            return appel.resultat
+
+        with mesurer('coalescence'):
+            termine = appel.termine.wait(self.attente_max)
+        if not termine:
+            with self._verrou:
+                self._delais += 1
+            return producteur()
+        with self._verrou:
+            self._regroupes += 1
+            if appel.erreur is not None:
+                self._erreurs_partagees += 1
+        if appel.erreur is not None:
+            raise appel.erreur
+        return appel.resultat
+
+    def stats(self) -> dict:
+        with self._verrou:
+            total = self._executes + self._regroupes + self._delais
+            return {
+                "actif": self.actif,
+                "attente_max": self.attente_max,
+                "en_cours": len(self._en_vol),
+                "executes": self._executes,
+                "regroupes": self._regroupes,
+                "delais_depasses": self._delais,
+                "erreurs_partagees": self._erreurs_partagees,
+                "abonnes_max": self._abonnes_max,
+                "taux_regroupement": round(self._regroupes / total, 4) if total else None,
+            }
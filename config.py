@@ -1,11 +1,14 @@
 # config.py
 import os
+import tempfile
 from dotenv import load_dotenv
 
 
 # Charger les variables d'environnement depuis le fichier .env
 load_dotenv()
 
+basedir = os.path.abspath(os.path.dirname(__file__))
+
 class BaseConfig:
     """Configurations de base qui s'appliquent à tous les environnements."""
     # Clé secrète pour Flask, essentielle pour la sécurité (sessions, tokens, etc.)
@@ -33,6 +36,87 @@ class BaseConfig:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
 
+    # Source des données : 'supabase' (par défaut) ou 'sqlite' (base locale, voir sources.py).
+    SOURCE_DONNEES = os.environ.get('SOURCE_DONNEES', 'supabase')
+    SOURCE_SQLITE_CHEMIN = os.environ.get('SOURCE_SQLITE_CHEMIN', os.path.join(basedir, 'data', 'donnees_locales.sqlite3'))
+
+    # Pool HTTP partagé (Supabase, OAuth) : connexions, délais (en secondes) et nouvelles tentatives.
+    HTTP_POOL_TAILLE = int(os.environ.get('HTTP_POOL_TAILLE', 20))
+    HTTP_POOL_CONNEXIONS_PERSISTANTES = int(os.environ.get('HTTP_POOL_CONNEXIONS_PERSISTANTES', 10))
+    HTTP_POOL_DUREE_KEEPALIVE = float(os.environ.get('HTTP_POOL_DUREE_KEEPALIVE', 30))
+    HTTP_DELAI_CONNEXION = float(os.environ.get('HTTP_DELAI_CONNEXION', 5))
+    HTTP_DELAI_LECTURE = float(os.environ.get('HTTP_DELAI_LECTURE', 30))
+    HTTP_TENTATIVES = int(os.environ.get('HTTP_TENTATIVES', 2))
+    HTTP_DELAI_REESSAI = float(os.environ.get('HTTP_DELAI_REESSAI', 0.2))
+    HTTP2 = os.environ.get('HTTP2', 'True').lower() in ['true', '1', 't']
+
+    # Contrôle d'admission des routes coûteuses (admission.py), par processus : capacité globale en unités
+    # (page = 1, requête avancée = 2, export = 4 ; 0 = désactivé), unités par utilisateur, file d'attente
+    # (nombre de requêtes, attente maximale en secondes) et délai conseillé dans Retry-After (en secondes).
+    # Les unités par utilisateur doivent dépasser le coût d'un export : avec 6, un téléchargement en cours
+    # laisse encore passer les pages (ou une requête avancée) du même utilisateur.
+    ADMISSION_CAPACITE = int(os.environ.get('ADMISSION_CAPACITE', 8))
+    ADMISSION_PAR_UTILISATEUR = int(os.environ.get('ADMISSION_PAR_UTILISATEUR', 6))
+    ADMISSION_FILE_MAX = int(os.environ.get('ADMISSION_FILE_MAX', 16))
+    ADMISSION_ATTENTE_MAX = float(os.environ.get('ADMISSION_ATTENTE_MAX', 10))
+    ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 5))
+
+    # Regroupement des appels RPC identiques et simultanés (coalescence.py) : attente maximale (en secondes)
+    # d'un appel sur l'appel identique déjà en cours avant d'exécuter le sien (0 = regroupement désactivé).
+    COALESCENCE_ATTENTE_MAX = float(os.environ.get('COALESCENCE_ATTENTE_MAX', 30))
+
+    # Nombre maximal de lignes d'une réponse de la source (paramètre max-rows de PostgREST, 1000 sur Supabase ;
+    # 0 = aucun plafond) : les lectures ne demandent jamais plus de lignes par appel, donc une réponse plus courte
+    # que demandé termine le résultat. Il doit être au plus égal au max-rows réel de la source ; avec 0, seule
+    # une réponse vide termine le résultat.
+    RPC_LIGNES_MAX_REPONSE = int(os.environ.get('RPC_LIGNES_MAX_REPONSE', 1000))
+
+    # Nombre maximal d'appels à la source de données exécutés en parallèle par une requête (execution.py).
+    EXECUTION_CONCURRENCE_MAX = int(os.environ.get('EXECUTION_CONCURRENCE_MAX', 4))
+
+    # Lecture partitionnée des recherches (pages, flux et exports) : la période, réduite aux mois qui contiennent
+    # des lignes, est découpée en tranches de RPC_PARTITION_MOIS mois (0 = désactivé, par défaut), lues dans
+    # l'ordre du tri et paginées chacune par curseur ; ce qui précède RPC_PARTITION_DEBUT forme une seule tranche.
+    # Chaque tranche coûte au moins un appel : à activer pour les segments mensuels ou une source lente sur les
+    # longues périodes.
+    RPC_PARTITION_MOIS = int(os.environ.get('RPC_PARTITION_MOIS', 0))
+    RPC_PARTITION_DEBUT = os.environ.get('RPC_PARTITION_DEBUT', '2010-01-01')
+
+    # Segments mensuels de l'historique (segments.py) : dossier des fichiers Parquet (vide = désactivé, par défaut),
+    # nombre de derniers mois encore ouverts (mois en cours compris), durée de validité de leurs segments
+    # (en secondes) et taille maximale du dossier (en octets, 0 = sans limite ; les moins récemment lus sont supprimés).
+    SEGMENTS_DOSSIER = os.environ.get('SEGMENTS_DOSSIER', '')
+    SEGMENTS_MOIS_OUVERTS = int(os.environ.get('SEGMENTS_MOIS_OUVERTS', 1))
+    SEGMENTS_TTL_MOIS_OUVERT = int(os.environ.get('SEGMENTS_TTL_MOIS_OUVERT', 300))
+    SEGMENTS_TAILLE_MAX = int(os.environ.get('SEGMENTS_TAILLE_MAX', 512 * 1024 * 1024))
+
+    # Cumuls mensuels précalculés des requêtes avancées (voir agregats.py) : base SQLite produite par
+    # 'python agregats.py', et âge maximal (en secondes, 0 = sans limite) au-delà duquel la RPC est rappelée.
+    CUMULS_CHEMIN = os.environ.get('CUMULS_CHEMIN', os.path.join(basedir, 'data', 'cumuls.sqlite3'))
+    CUMULS_AGE_MAX = int(os.environ.get('CUMULS_AGE_MAX', 2 * 24 * 3600))
+
+    # Cache des résultats des RPC : 'memoire' (par processus), 'sqlite' (partagé entre workers) ou 'aucun'.
+    CACHE_RPC_BACKEND = os.environ.get('CACHE_RPC_BACKEND', 'memoire')
+    CACHE_RPC_TTL = int(os.environ.get('CACHE_RPC_TTL', 3600))  # en secondes
+    CACHE_RPC_TAILLE_MAX = int(os.environ.get('CACHE_RPC_TAILLE_MAX', 64 * 1024 * 1024))  # en octets
+    CACHE_RPC_CHEMIN = os.environ.get('CACHE_RPC_CHEMIN', os.path.join(tempfile.gettempdir(), 'amco_cache_rpc.sqlite3'))
+
+    # Exports asynchrones : dossier des fichiers produits, nombre de threads et durée de conservation.
+    EXPORTS_DOSSIER = os.environ.get('EXPORTS_DOSSIER', os.path.join(tempfile.gettempdir(), 'amco_exports'))
+    EXPORTS_NB_WORKERS = int(os.environ.get('EXPORTS_NB_WORKERS', 2))
+    EXPORTS_DUREE_CONSERVATION = int(os.environ.get('EXPORTS_DUREE_CONSERVATION', 3600))  # en secondes
+    # Tâches d'export en attente ou en cours par utilisateur et au total (0 = sans limite), et délai
+    # conseillé dans Retry-After (en secondes) quand une nouvelle tâche est refusée.
+    EXPORTS_PAR_UTILISATEUR = int(os.environ.get('EXPORTS_PAR_UTILISATEUR', 2))
+    EXPORTS_FILE_MAX = int(os.environ.get('EXPORTS_FILE_MAX', 20))
+    EXPORTS_RETRY_AFTER = int(os.environ.get('EXPORTS_RETRY_AFTER', 30))
+
+    # Instrumentation : une ligne de log JSON par requête (logger 'amco.performance').
+    INSTRUMENTATION_LOGS = os.environ.get('INSTRUMENTATION_LOGS', 'True').lower() in ['true', '1', 't']
+
+    # Mode démonstration : 0 = fichiers static/data_demo/data_<type>.json, sinon taille du jeu synthétique généré.
+    DEMO_LIGNES_SYNTHETIQUES = int(os.environ.get('DEMO_LIGNES_SYNTHETIQUES', 0))
+
     
 
 class DevelopmentConfig(BaseConfig):
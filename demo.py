@@ -0,0 +1,222 @@
+# demo.py
+"""
+Ce fichier contient le moteur de requêtes local du mode démonstration.
+Il remplace Supabase quand celui-ci n'est pas joignable (ou pas configuré, en développement) :
+les données de static/data_demo/data_<type>.json, ou un jeu synthétique de taille paramétrable,
+sont indexées côté serveur puis filtrées avec la même sémantique que les RPC
+rechercher_ventes / rechercher_achats :
+- p_date_debut (inclus) / p_date_fin (exclu) sur la date de la transaction ;
+- valeur texte -> la colonne contient la valeur (insensible à la casse, comme un ILIKE '%valeur%') ;
+- préfixe 'egal:' -> la colonne est égale à la valeur (insensible à la casse) ;
+- p_qte_fact -> égalité numérique sur la quantité facturée.
+Tous les filtres se cumulent (ET logique).
+"""
+import bisect
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+
+from registre import FichierJson, TYPES_TRANSACTION
+
+# Paramètre SQL -> colonne filtrée, pour chaque type de transaction.
+COLONNES_PARAMETRES = {
+    'ventes': {
+        'p_code_article': 'code article',
+        'p_designation': 'Désignation',
+        'p_code_client': 'Code client',
+        'p_raison_sociale': 'Raison sociale',
+        'p_qte_fact': 'Qté fact',
+        'p_erp': 'ERP',
+    },
+    'achats': {
+        'p_code_fournisseur': 'Code fournisseur',
+        'p_raison_sociale': 'Raison sociale',
+        'p_reference_achat': 'Reference achat',
+        'p_bon_de_commande': 'Bon de commande',
+        'p_code_article': 'code article',
+        'p_qte_fact': 'Qté fact',
+        'p_erp': 'ERP',
+    },
+}
+
+# Ordre de tri des lignes (date, document, article) : le même que celui de la pagination par curseur.
+COLONNES_TRI = {
+    'ventes': ('Date BL', 'N° BL', 'code article'),
+    'achats': ('date achat', 'Reference achat', 'code article'),
+}
+
+PREFIXE_EGALITE = 'egal:'
+PARAMETRES_DATE = ('p_date_debut', 'p_date_fin')
+PARAMETRE_QUANTITE = 'p_qte_fact'
+
+
+def _texte(valeur) -> str:
+    return '' if valeur is None else str(valeur).lower()
+
+
+def _nombre(valeur):
+    try:
+        return float(valeur)
+    except (TypeError, ValueError):
+        return None
+
+
+class IndexTransactions:
+    """
+    Lignes d'un type de transaction triées par date, avec :
+    - la liste des dates (recherche dichotomique des bornes de période) ;
+    - pour chaque colonne filtrable, les valeurs normalisées et un index inversé valeur -> positions
+      (utilisé pour les filtres d'égalité).
+    """
+
+    def __init__(self, lignes: list, type_transaction: str):
+        colonne_date = COLONNES_TRI[type_transaction][0]
+        self.colonnes_parametres = COLONNES_PARAMETRES[type_transaction]
+        colonnes_tri = COLONNES_TRI[type_transaction]
+        self.lignes = sorted(lignes, key=lambda ligne: tuple(str(ligne.get(c) or '') for c in colonnes_tri))
+        self.dates = [str(ligne.get(colonne_date) or '') for ligne in self.lignes]
+
+        self.valeurs = {}
+        self.positions = {}
+        for parametre, colonne in self.colonnes_parametres.items():
+            normaliser = _nombre if parametre == PARAMETRE_QUANTITE else _texte
+            valeurs = [normaliser(ligne.get(colonne)) for ligne in self.lignes]
+            positions = {}
+            for position, valeur in enumerate(valeurs):
+                positions.setdefault(valeur, []).append(position)
+            self.valeurs[colonne] = valeurs
+            self.positions[colonne] = positions
+
+    def rechercher(self, params: dict) -> list:
+        """Retourne les positions (croissantes) des lignes correspondant aux paramètres de la RPC."""
+        debut = bisect.bisect_left(self.dates, params.get('p_date_debut') or '0000')
+        fin = bisect.bisect_left(self.dates, params['p_date_fin']) if params.get('p_date_fin') else len(self.dates)
+        if debut >= fin:
+            return []
+
+        egalites, contenus = [], []
+        for parametre, valeur in params.items():
+            if parametre in PARAMETRES_DATE:
+                continue
+            colonne = self.colonnes_parametres.get(parametre)
+            if colonne is None:
+                raise ValueError(f"Paramètre de recherche inconnu : '{parametre}'.")
+            if parametre == PARAMETRE_QUANTITE:
+                egalites.append((colonne, _nombre(valeur)))
+            elif isinstance(valeur, str) and valeur.startswith(PREFIXE_EGALITE):
+                egalites.append((colonne, valeur[len(PREFIXE_EGALITE):].lower()))
+            else:
+                contenus.append((colonne, _texte(valeur)))
+
+        if egalites:
+            # On part de la liste de positions la plus courte, restreinte à la période demandée.
+            listes = []
+            for colonne, valeur in egalites:
+                positions = self.positions[colonne].get(valeur, [])
+                listes.append(positions[bisect.bisect_left(positions, debut):bisect.bisect_left(positions, fin)])
+            listes.sort(key=len)
+            candidats = listes[0]
+            for autre in listes[1:]:
+                autre = set(autre)
+                candidats = [position for position in candidats if position in autre]
+        else:
+            candidats = range(debut, fin)
+
+        for colonne, terme in contenus:
+            valeurs = self.valeurs[colonne]
+            candidats = [position for position in candidats if terme in valeurs[position]]
+        return list(candidats)
+
+
+def generer_lignes_synthetiques(type_transaction: str, nb_lignes: int, graine: int = 0) -> list:
+    """
+    Génère un jeu de données synthétique (déterministe pour une graine donnée) avec les mêmes
+    colonnes que les fichiers de démonstration, réparti sur les dix dernières années.
+    """
+    aleatoire = random.Random(graine)
+    nb_articles = max(10, nb_lignes // 50)
+    nb_tiers = max(5, nb_lignes // 500)
+    origine = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=3650)
+    lignes = []
+    for i in range(nb_lignes):
+        if i % 4 == 0:  # Un document (BL / référence d'achat) regroupe 4 lignes à la même date
+            date = (origine + timedelta(days=aleatoire.randrange(3650))).strftime('%Y-%m-%dT%H:%M:%S')
+        article = aleatoire.randrange(nb_articles)
+        tiers = aleatoire.randrange(nb_tiers)
+        quantite = aleatoire.randint(1, 200)
+        prix = round(aleatoire.uniform(0.5, 500), 2)
+        total_ht = round(quantite * prix, 2)
+        if type_transaction == 'achats':
+            lignes.append({
+                'Code fournisseur': f'F{tiers:05d}',
+                'Raison sociale': f'Fournisseur {tiers}',
+                'Reference achat': f'ACH-{i // 4:08d}',
+                'Bon de commande': f'BC-{i // 8:07d}',
+                'date achat': date,
+                'Qté fact': quantite,
+                'Total HT': total_ht,
+                'Total TTC': round(total_ht * 1.2, 2),
+                'code article': f'ART-{article:06d}',
+                'Désignation': f'Article {article}',
+            })
+        else:
+            lignes.append({
+                'code article': f'P{article:06d}',
+                'Désignation': f'Article {article}',
+                'Qté fact': quantite,
+                'Prix Unitaire': prix,
+                'Tot HT': total_ht,
+                'Code client': f'C{tiers:05d}',
+                'Raison sociale': f'Client {tiers}',
+                'Date BL': date,
+                'N° BL': f'BL-{i // 4:08d}',
+                'N° Cde': i // 8,
+            })
+    return lignes
+
+
+class MoteurDemo:
+    """
+    Point d'accès aux données de démonstration indexées.
+    Avec nb_lignes_synthetiques = 0, les fichiers JSON de démonstration sont utilisés (et relus
+    s'ils changent sur le disque) ; sinon un jeu synthétique de cette taille est généré au premier appel.
+    """
+
+    def __init__(self, dossier_donnees: str, nb_lignes_synthetiques: int = 0):
+        self.nb_lignes_synthetiques = nb_lignes_synthetiques
+        self._fichiers = {
+            type_transaction: FichierJson(
+                os.path.join(dossier_donnees, f'data_{type_transaction}.json'),
+                indexeur=lambda lignes, t=type_transaction: IndexTransactions(lignes, t),
+            )
+            for type_transaction in TYPES_TRANSACTION
+        }
+        self._index_synthetiques = {}
+        self._verrou = threading.Lock()
+
+    def index(self, type_transaction: str) -> IndexTransactions:
+        if type_transaction not in TYPES_TRANSACTION:
+            raise ValueError(f"Type de transaction inconnu : '{type_transaction}'.")
+        if not self.nb_lignes_synthetiques:
+            return self._fichiers[type_transaction].index()
+        with self._verrou:
+            if type_transaction not in self._index_synthetiques:
+                lignes = generer_lignes_synthetiques(type_transaction, self.nb_lignes_synthetiques)
+                self._index_synthetiques[type_transaction] = IndexTransactions(lignes, type_transaction)
+            return self._index_synthetiques[type_transaction]
+
+    def rechercher(self, type_transaction: str, params: dict) -> list:
+        """Retourne toutes les lignes correspondant aux paramètres (triées par date croissante)."""
+        index = self.index(type_transaction)
+        return [index.lignes[position] for position in index.rechercher(params)]
+
+    def iterer_lots(self, type_transaction: str, params: dict, taille_lot: int):
+        """
+        Retourne un générateur de lots de lignes, pour les réponses en flux et les exports.
+        La recherche est faite immédiatement : ses erreurs sont levées par cet appel, pas pendant le flux.
+        """
+        index = self.index(type_transaction)
+        positions = index.rechercher(params)
+        return ([index.lignes[position] for position in positions[debut:debut + taille_lot]]
+                for debut in range(0, len(positions), taille_lot))
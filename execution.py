@@ -0,0 +1,48 @@
+# execution.py
+"""
+Ce fichier contient la couche d'exécution concurrente des appels à la source de données.
+Les appels indépendants d'une même requête (RPC ventes + achats, lecture des comptes +
+des administrateurs protégés, écritures des comptes...) sont lancés ensemble au lieu d'être
+enchaînés : la durée de la requête devient celle de l'appel le plus lent, et non leur somme.
+
+Les clients (supabase-py, sqlite3) sont synchrones : chaque appel est exécuté dans un thread
+par asyncio (asyncio.to_thread), un sémaphore bornant le nombre d'appels simultanés.
+Le contexte Flask (current_app, g) est recopié dans ces threads.
+Les segments d'instrumentation ouverts dans ces threads sont ignorés : le temps de l'ensemble
+est compté dans le segment 'parallele'.
+"""
+import asyncio
+
+from flask import current_app
+
+from instrumentation import mesurer
+
+# Nombre maximal d'appels simultanés quand l'application ne le précise pas (EXECUTION_CONCURRENCE_MAX).
+CONCURRENCE_DEFAUT = 4
+
+
+async def _executer(appels, limite: int) -> list:
+    semaphore = asyncio.Semaphore(limite)
+
+    async def executer_un(appel):
+        async with semaphore:
+            return await asyncio.to_thread(appel)
+
+    return await asyncio.gather(*(executer_un(appel) for appel in appels))
+
+
+def executer_en_parallele(appels, limite: int = None) -> list:
+    """
+    Exécute les appels (fonctions sans argument) concurremment, au plus 'limite' à la fois.
+    Retourne leurs résultats dans l'ordre des appels ; si un appel échoue, son exception est levée
+    (les autres appels sont menés à terme).
+    """
+    appels = list(appels)
+    if not appels:
+        return []
+    if limite is None:
+        limite = current_app.config.get('EXECUTION_CONCURRENCE_MAX', CONCURRENCE_DEFAUT)
+    if len(appels) == 1 or limite <= 1:
+        return [appel() for appel in appels]
+    with mesurer('parallele'):
+        return asyncio.run(_executer(appels, limite))
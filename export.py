@@ -0,0 +1,317 @@
+# export.py
+"""
+Ce fichier regroupe la génération des fichiers d'export (CSV / XLSX / Arrow / Parquet) en flux.
+Les lignes arrivent par lots depuis la RPC et sont écrites au fur et à mesure :
+la mémoire utilisée dépend de la taille d'un lot, et non du nombre total de lignes.
+"""
+import csv
+import io
+import itertools
+import logging
+import os
+import re
+import tempfile
+from datetime import datetime, timezone
+
+from flask import Response, stream_with_context
+from openpyxl import Workbook
+
+from instrumentation import mesurer_flux
+
+# pyarrow n'est nécessaire que pour les formats colonnes (Arrow / Parquet).
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pq = None
+
+journal = logging.getLogger(__name__)
+
+# Heure suivie d'un décalage horaire en fin de date ISO (colonnes timestamptz) : 'Z', '+02', '+0200' ou '+02:00'.
+DECALAGE_HORAIRE = re.compile(r'[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}(:?\d{2})?)$')
+
+# Taille des blocs envoyés au client lors de la lecture d'un fichier temporaire.
+TAILLE_BLOC_FICHIER = 64 * 1024
+
+# Werkzeug ajoute lui-même '; charset=utf-8' aux types text/* : il ne doit pas figurer ici.
+MIMETYPES_EXPORT = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+FORMATS_COLONNES = ('arrow', 'parquet')
+
+
+def normaliser_format(format_demande: str) -> str:
+    """Retourne un format d'export connu ('csv' par défaut)."""
+    format_demande = (format_demande or 'csv').lower()
+    return format_demande if format_demande in MIMETYPES_EXPORT else 'csv'
+
+
+def flux_csv(lots):
+    """
+    Générateur qui transforme des lots de lignes (listes de dictionnaires) en octets CSV.
+    Même format que l'ancien export pandas : séparateur ';' et encodage UTF-8 avec BOM.
+    """
+    tampon = io.StringIO()
+    ecrivain = None
+    yield '\ufeff'.encode('utf-8')
+    for lot in lots:
+        for ligne in lot:
+            if ecrivain is None:
+                # Les colonnes sont déterminées par la première ligne reçue.
+                ecrivain = csv.DictWriter(tampon, fieldnames=list(ligne.keys()), delimiter=';',
+                                         lineterminator='\n', extrasaction='ignore')
+                ecrivain.writeheader()
+            ecrivain.writerow(ligne)
+        yield tampon.getvalue().encode('utf-8')
+        tampon.seek(0)
+        tampon.truncate(0)
+
+
+def _valeur_cellule(valeur):
+    """Convertit une valeur JSON en une valeur acceptée par openpyxl."""
+    if valeur is None or isinstance(valeur, (str, int, float, bool)):
+        return valeur
+    return str(valeur)
+
+
+def ecrire_xlsx(lots, chemin_fichier: str) -> int:
+    """
+    Écrit les lots de lignes dans un classeur XLSX en mode 'write-only' (streaming) d'openpyxl.
+    Les lignes ne sont jamais toutes gardées en mémoire. Retourne le nombre de lignes écrites.
+    """
+    classeur = Workbook(write_only=True)
+    feuille = classeur.create_sheet('Résultats')
+    colonnes = None
+    nb_lignes = 0
+    for lot in lots:
+        for ligne in lot:
+            if colonnes is None:
+                colonnes = list(ligne.keys())
+                feuille.append(colonnes)
+            feuille.append([_valeur_cellule(ligne.get(colonne)) for colonne in colonnes])
+            nb_lignes += 1
+    classeur.save(chemin_fichier)
+    return nb_lignes
+
+
+def flux_xlsx(lots):
+    """
+    Générateur d'octets XLSX. Le format ZIP impose d'écrire le classeur complet avant
+    de l'envoyer : on l'écrit donc dans un fichier temporaire, lu ensuite par blocs.
+    """
+    return _flux_fichier_temporaire(ecrire_xlsx, lots, '.xlsx')
+
+
+def flux_parquet(lots):
+    """Générateur d'octets Parquet (le pied de fichier n'est connu qu'à la fin, d'où le fichier temporaire)."""
+    _verifier_pyarrow()
+    return _flux_fichier_temporaire(ecrire_parquet, lots, '.parquet')
+
+
+# =======================================================
+# Formats colonnes : Arrow IPC (stream) et Parquet
+# =======================================================
+
+def _verifier_pyarrow():
+    if pa is None:
+        raise RuntimeError("Les formats Arrow/Parquet nécessitent le paquet 'pyarrow'.")
+
+
+def schema_arrow(lot: list):
+    """
+    Déduit un schéma typé à partir d'un lot de lignes :
+    - colonnes dont le nom contient 'date' -> timestamp, en UTC si les valeurs portent un décalage horaire
+      (timestamptz) ; une colonne dont les valeurs du lot ne s'analysent pas comme des dates reste en texte ;
+    - nombres -> float64 (PostgREST renvoie indifféremment 50 ou 7.45 pour une colonne numeric) ;
+    - booléens -> bool ; tout le reste (ou une colonne entièrement vide) -> texte.
+    """
+    champs = []
+    for colonne in lot[0].keys():
+        exemple = next((ligne.get(colonne) for ligne in lot if ligne.get(colonne) is not None), None)
+        if isinstance(exemple, bool):
+            type_arrow = pa.bool_()
+        elif isinstance(exemple, (int, float)):
+            type_arrow = pa.float64()
+        elif isinstance(exemple, str) and 'date' in colonne.lower():
+            type_arrow = _type_dates([ligne.get(colonne) for ligne in lot])
+        else:
+            type_arrow = pa.string()
+        champs.append(pa.field(colonne, type_arrow))
+    return pa.schema(champs)
+
+
+def _type_dates(valeurs: list):
+    """Type timestamp des valeurs (avec fuseau UTC si l'une d'elles a un décalage horaire), ou texte si elles ne s'analysent pas."""
+    avec_decalage = any(isinstance(v, str) and DECALAGE_HORAIRE.search(v) for v in valeurs)
+    type_arrow = pa.timestamp('us', tz='UTC') if avec_decalage else pa.timestamp('us')
+    try:
+        dates_arrow(valeurs, type_arrow, strict=True)
+    except (ValueError, pa.ArrowInvalid):
+        return pa.string()
+    return type_arrow
+
+
+def _analyser_date(valeur, type_arrow):
+    date_heure = datetime.fromisoformat(str(valeur))
+    if type_arrow.tz is not None:
+        # Une date sans décalage dans une colonne timestamptz est considérée comme UTC.
+        return date_heure.replace(tzinfo=timezone.utc) if date_heure.tzinfo is None else date_heure
+    return date_heure if date_heure.tzinfo is None else date_heure.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def dates_arrow(valeurs: list, type_arrow, strict: bool = False):
+    """
+    Convertit des dates texte ISO en tableau timestamp. Si le lot mélange des dates avec et sans décalage
+    horaire, elles sont analysées une à une. Hors mode strict, une valeur illisible devient NULL :
+    le schéma est déjà envoyé, une exception interromprait le fichier en cours de route.
+    """
+    textes = pa.array([None if v is None else str(v) for v in valeurs], pa.string())
+    try:
+        return pc.cast(textes, type_arrow)
+    except pa.ArrowInvalid:
+        pass
+    dates = []
+    for valeur in valeurs:
+        try:
+            dates.append(None if valeur is None else _analyser_date(valeur, type_arrow))
+        except ValueError:
+            if strict:
+                raise
+            journal.warning("Date illisible exportée comme vide : %r", valeur)
+            dates.append(None)
+    return pa.array(dates, type_arrow)
+
+
+def table_arrow(lot: list, schema):
+    """Convertit un lot de lignes en table Arrow conforme au schéma (les dates texte sont analysées)."""
+    colonnes = []
+    for champ in schema:
+        valeurs = [ligne.get(champ.name) for ligne in lot]
+        if pa.types.is_timestamp(champ.type):
+            colonnes.append(dates_arrow(valeurs, champ.type))
+        elif pa.types.is_string(champ.type):
+            colonnes.append(pa.array([None if v is None else str(v) for v in valeurs], pa.string()))
+        else:
+            colonnes.append(pa.array(valeurs, champ.type))
+    return pa.Table.from_arrays(colonnes, schema=schema)
+
+
+def _tables_arrow(lots):
+    """Générateur de tables Arrow ; le schéma est fixé par le premier lot non vide."""
+    schema = None
+    for lot in lots:
+        if not lot:
+            continue
+        if schema is None:
+            schema = schema_arrow(lot)
+        yield table_arrow(lot, schema)
+
+
+def flux_arrow(lots):
+    """Générateur d'octets au format Arrow IPC (stream) : chaque lot devient un record batch."""
+    _verifier_pyarrow()
+    tampon = io.BytesIO()
+    ecrivain = None
+    for table in _tables_arrow(lots):
+        if ecrivain is None:
+            ecrivain = pa.ipc.new_stream(tampon, table.schema)
+        ecrivain.write_table(table)
+        yield tampon.getvalue()
+        tampon.seek(0)
+        tampon.truncate(0)
+    if ecrivain is None:
+        # Aucun résultat : on envoie un flux valide avec un schéma vide.
+        ecrivain = pa.ipc.new_stream(tampon, pa.schema([]))
+    ecrivain.close()
+    yield tampon.getvalue()
+
+
+def ecrire_parquet(lots, chemin_fichier: str) -> int:
+    """Écrit les lots dans un fichier Parquet (un row group par lot). Retourne le nombre de lignes écrites."""
+    _verifier_pyarrow()
+    ecrivain = None
+    nb_lignes = 0
+    try:
+        for table in _tables_arrow(lots):
+            if ecrivain is None:
+                ecrivain = pq.ParquetWriter(chemin_fichier, table.schema, compression='zstd')
+            ecrivain.write_table(table)
+            nb_lignes += table.num_rows
+        if ecrivain is None:
+            pq.write_table(pa.table({}), chemin_fichier)
+    finally:
+        if ecrivain is not None:
+            ecrivain.close()
+    return nb_lignes
+
+
+def ecrire_fichier(lots, format_demande: str, chemin_fichier: str):
+    """Écrit les lots dans un fichier du format demandé (utilisé par les exports asynchrones)."""
+    if format_demande == 'xlsx':
+        ecrire_xlsx(lots, chemin_fichier)
+    elif format_demande == 'parquet':
+        ecrire_parquet(lots, chemin_fichier)
+    else:
+        generateur = flux_arrow(lots) if format_demande == 'arrow' else flux_csv(lots)
+        with open(chemin_fichier, 'wb') as fichier:
+            for bloc in generateur:
+                fichier.write(bloc)
+
+
+def _flux_fichier_temporaire(ecrire, lots, suffixe: str):
+    """Écrit le fichier complet dans un fichier temporaire, puis le renvoie par blocs."""
+    descripteur, chemin_fichier = tempfile.mkstemp(suffix=suffixe)
+    os.close(descripteur)
+    try:
+        ecrire(lots, chemin_fichier)
+        with open(chemin_fichier, 'rb') as fichier:
+            while True:
+                bloc = fichier.read(TAILLE_BLOC_FICHIER)
+                if not bloc:
+                    break
+                yield bloc
+    finally:
+        os.remove(chemin_fichier)
+
+
+def amorcer_lots(lots):
+    """
+    Récupère immédiatement le premier lot d'un générateur, puis retourne un itérable équivalent.
+    Les erreurs du premier appel RPC sont ainsi levées avant l'envoi des en-têtes de la réponse.
+    """
+    lots = iter(lots)
+    premier_lot = next(lots, None)
+    return itertools.chain([premier_lot] if premier_lot else [], lots)
+
+
+def reponse_export(lots, format_demande: str, en_piece_jointe: bool = True) -> Response:
+    """
+    Construit une réponse HTTP en flux (chunked) pour télécharger les lots de lignes.
+    Le premier lot est récupéré avant d'envoyer les en-têtes : une erreur de la RPC
+    remonte ainsi à la route (et donc au client) au lieu d'interrompre un fichier à moitié envoyé.
+    Avec en_piece_jointe=False, la réponse est servie directement (ex : /api/query en Arrow).
+    """
+    format_demande = normaliser_format(format_demande)
+    if format_demande in FORMATS_COLONNES:
+        _verifier_pyarrow()
+
+    lots = amorcer_lots(lots)
+
+    generateurs = {'xlsx': flux_xlsx, 'arrow': flux_arrow, 'parquet': flux_parquet, 'csv': flux_csv}
+    generateur = mesurer_flux(generateurs[format_demande](lots), 'export')
+
+    horodatage = datetime.now().strftime("%Y%m%d_%H%M%S")
+    en_tetes = {}
+    if en_piece_jointe:
+        en_tetes["Content-Disposition"] = f"attachment; filename=export_{horodatage}.{format_demande}"
+
+    return Response(
+        stream_with_context(generateur),
+        mimetype=MIMETYPES_EXPORT[format_demande],
+        headers=en_tetes,
+    )
@@ -5,12 +5,14 @@ Cela évite les importations circulaires et garantit que tous les blueprints
 utilisent les mêmes instances d'extensions.
 """
 from flask_login import LoginManager
-from authlib.integrations.flask_client import OAuth
 from itsdangerous import URLSafeTimedSerializer
+from instrumentation import Instrumentation
+from clients_http import OAuthPoolPartage
 
 # On crée les instances ici, SANS les lier à une application.
 # Elles seront liées à l'application dans la fabrique (create_app).
 login_manager = LoginManager()
-oauth = OAuth()
+oauth = OAuthPoolPartage()  # Les sessions OAuth passent par le pool HTTP partagé
+instrumentation = Instrumentation()
 # On ne peut pas initialiser le serializer ici car il a besoin de la SECRET_KEY.
 # On le laissera dans la fabrique d'application.
\ No newline at end of file
@@ -0,0 +1,243 @@
+# instrumentation.py
+"""
+Ce fichier contient l'instrumentation des performances de l'application.
+Chaque requête est découpée en segments de temps ("spans") nommés : contrôle de l'IP,
+chargement de l'utilisateur, appel RPC, construction du DataFrame, sérialisation / export,
+rendu du template...
+
+Les segments peuvent s'imbriquer : le temps attribué à un segment est son temps propre,
+c'est-à-dire sa durée moins celle des segments ouverts à l'intérieur. La somme des segments
+ne dépasse donc jamais la durée totale de la requête.
+
+Pour chaque requête :
+- l'en-tête Server-Timing expose les segments mesurés (visibles dans les outils du navigateur) ;
+- une ligne de log JSON est écrite sur le logger 'amco.performance' ;
+- la durée totale et celle des segments alimentent des histogrammes par route,
+  consultables par les administrateurs (/admin/api/metriques).
+Pour une réponse en flux, le log et les histogrammes sont mis à jour à la fin de l'envoi.
+"""
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+
+# Bornes supérieures (en millisecondes) des classes des histogrammes.
+BORNES_HISTOGRAMME_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+journal_performance = logging.getLogger('amco.performance')
+
+
+# =======================================================
+# Segments de temps (spans) de la requête courante
+# =======================================================
+
+class _Segment:
+    __slots__ = ('nom', 'debut', 'enfants')
+
+    def __init__(self, nom: str):
+        self.nom = nom
+        self.debut = time.perf_counter()
+        self.enfants = 0.0  # Durée cumulée des segments imbriqués
+
+
+def _etat_requete():
+    """
+    Retourne (pile des segments ouverts, durées cumulées par nom) de la requête, ou None hors requête.
+    Seul le thread de la requête mesure : les appels lancés en parallèle (execution.py) recopient
+    le contexte Flask mais sont comptés globalement par le thread qui les attend.
+    """
+    if (not has_request_context() or 'instrumentation_durees' not in g
+            or g.instrumentation_fil != threading.get_ident()):
+        return None
+    return g.instrumentation_pile, g.instrumentation_durees
+
+
+def ouvrir_segment(nom: str):
+    etat = _etat_requete()
+    if etat is not None:
+        etat[0].append(_Segment(nom))
+
+
+def fermer_segment(nom: str):
+    etat = _etat_requete()
+    if etat is None:
+        return
+    pile, durees = etat
+    # On dépile jusqu'au segment demandé (protège contre un segment resté ouvert après une exception).
+    while pile:
+        segment = pile.pop()
+        duree = time.perf_counter() - segment.debut
+        if pile:
+            pile[-1].enfants += duree
+        if segment.nom == nom:
+            cumul = durees.setdefault(nom, [0.0, 0])
+            cumul[0] += duree - segment.enfants
+            cumul[1] += 1
+            return
+
+
+@contextmanager
+def mesurer(nom: str):
+    """Mesure le bloc comme un segment 'nom' de la requête courante (sans effet hors requête)."""
+    ouvrir_segment(nom)
+    try:
+        yield
+    finally:
+        fermer_segment(nom)
+
+
+def mesurer_flux(generateur, nom: str):
+    """Générateur qui mesure le temps passé à produire chaque élément de 'generateur' (réponses en flux)."""
+    iterateur = iter(generateur)
+    while True:
+        with mesurer(nom):
+            try:
+                element = next(iterateur)
+            except StopIteration:
+                return
+        yield element
+
+
+# =======================================================
+# Histogrammes par route
+# =======================================================
+
+class Histogramme:
+    """Histogramme de durées à classes fixes (millisecondes)."""
+
+    def __init__(self):
+        self.classes = [0] * (len(BORNES_HISTOGRAMME_MS) + 1)  # La dernière classe : au-delà de la plus grande borne
+        self.nombre = 0
+        self.somme_ms = 0.0
+        self.max_ms = 0.0
+
+    def ajouter(self, duree_ms: float):
+        self.classes[bisect_left(BORNES_HISTOGRAMME_MS, duree_ms)] += 1
+        self.nombre += 1
+        self.somme_ms += duree_ms
+        self.max_ms = max(self.max_ms, duree_ms)
+
+    def quantile(self, rang: float):
+        """Estimation d'un quantile : borne supérieure de la classe qui le contient."""
+        if not self.nombre:
+            return None
+        seuil = rang * self.nombre
+        cumul = 0
+        for indice, effectif in enumerate(self.classes):
+            cumul += effectif
+            if cumul >= seuil:
+                return BORNES_HISTOGRAMME_MS[indice] if indice < len(BORNES_HISTOGRAMME_MS) else self.max_ms
+        return self.max_ms
+
+    def en_dict(self) -> dict:
+        return {
+            "nombre": self.nombre,
+            "moyenne_ms": round(self.somme_ms / self.nombre, 3) if self.nombre else None,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.quantile(0.5),
+            "p90_ms": self.quantile(0.9),
+            "p99_ms": self.quantile(0.99),
+            "classes": {
+                (f"<={borne}" if indice < len(BORNES_HISTOGRAMME_MS) else f">{BORNES_HISTOGRAMME_MS[-1]}"): effectif
+                for indice, (borne, effectif) in enumerate(zip(BORNES_HISTOGRAMME_MS + (None,), self.classes))
+            },
+        }
+
+
+class Instrumentation:
+    """Extension Flask qui installe la mesure des requêtes sur une application (init_app)."""
+
+    def __init__(self, app=None):
+        self._routes = {}  # "MÉTHODE /route" -> {"total": Histogramme, "segments": {nom: Histogramme}, "statuts": {...}}
+        self._verrou = threading.Lock()
+        self.logs_actifs = True
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.logs_actifs = app.config.get('INSTRUMENTATION_LOGS', True)
+        if not journal_performance.handlers:
+            journal_performance.addHandler(logging.StreamHandler())
+        journal_performance.setLevel(logging.INFO)
+        journal_performance.propagate = False
+
+        # Le début de la requête doit précéder tous les autres before_request (contrôle d'IP compris).
+        app.before_request_funcs.setdefault(None, []).insert(0, self._debut_requete)
+        app.after_request(self._fin_requete)
+        before_render_template.connect(self._debut_rendu, app)
+        template_rendered.connect(self._fin_rendu, app)
+        app.instrumentation = self
+
+    @staticmethod
+    def _debut_requete():
+        g.instrumentation_debut = time.perf_counter()
+        g.instrumentation_fil = threading.get_ident()
+        g.instrumentation_pile = []
+        g.instrumentation_durees = {}
+
+    @staticmethod
+    def _debut_rendu(sender, template, context, **extra):
+        ouvrir_segment('rendu')
+
+    @staticmethod
+    def _fin_rendu(sender, template, context, **extra):
+        fermer_segment('rendu')
+
+    def _fin_requete(self, response):
+        if 'instrumentation_debut' not in g:
+            return response
+        debut, durees = g.instrumentation_debut, g.instrumentation_durees
+        route = f"{request.method} {request.url_rule.rule if request.url_rule else '<inconnue>'}"
+        statut = response.status_code
+
+        # En-tête Server-Timing : segments connus à ce stade, plus la durée de traitement avant envoi.
+        parties = [f"{nom};dur={cumul[0] * 1000:.1f}" for nom, cumul in durees.items()]
+        parties.append(f"app;dur={(time.perf_counter() - debut) * 1000:.1f}")
+        response.headers['Server-Timing'] = ', '.join(parties)
+
+        if response.is_streamed:
+            # Les lots d'une réponse en flux sont produits après ce point : on enregistre à la fermeture.
+            response.call_on_close(lambda: self._enregistrer(route, statut, debut, durees, en_flux=True))
+        else:
+            self._enregistrer(route, statut, debut, durees, en_flux=False)
+        return response
+
+    def _enregistrer(self, route: str, statut: int, debut: float, durees: dict, en_flux: bool):
+        total_ms = (time.perf_counter() - debut) * 1000
+        segments_ms = {nom: cumul[0] * 1000 for nom, cumul in durees.items()}
+        with self._verrou:
+            metriques = self._routes.setdefault(route, {"total": Histogramme(), "segments": {}, "statuts": {}})
+            metriques["total"].ajouter(total_ms)
+            for nom, duree_ms in segments_ms.items():
+                metriques["segments"].setdefault(nom, Histogramme()).ajouter(duree_ms)
+            metriques["statuts"][str(statut)] = metriques["statuts"].get(str(statut), 0) + 1
+
+        if self.logs_actifs:
+            journal_performance.info(json.dumps({
+                "route": route,
+                "statut": statut,
+                "duree_ms": round(total_ms, 1),
+                "en_flux": en_flux,
+                "segments_ms": {nom: round(duree, 1) for nom, duree in segments_ms.items()},
+                "appels": {nom: cumul[1] for nom, cumul in durees.items()},
+            }, ensure_ascii=False))
+
+    def etat(self) -> dict:
+        """Histogrammes par route (durée totale et par segment)."""
+        with self._verrou:
+            return {
+                route: {
+                    "total": metriques["total"].en_dict(),
+                    "segments": {nom: h.en_dict() for nom, h in metriques["segments"].items()},
+                    "statuts": dict(metriques["statuts"]),
+                }
+                for route, metriques in self._routes.items()
+            }
+
+    def reinitialiser(self):
+        with self._verrou:
+            self._routes.clear()
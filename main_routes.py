@@ -1,8 +1,9 @@
 # main_routes.py
 import os
 import json
-import io
-from datetime import datetime
+import base64
+import binascii
+from datetime import date, datetime
 from functools import wraps
 import pandas as pd
 from flask import (Blueprint, Response, abort, current_app, flash, jsonify, redirect, render_template, request,
@@ -17,9 +18,17 @@ from utils import (
     get_protected_admins,
     generate_recovery_code,
     load_guides_data,
-    supabase
+    supabase_stockage
 )
 from decorators import check_ip_whitelist
+from export import FORMATS_COLONNES, amorcer_lots, reponse_export
+from serialisation import en_colonnes, flux_json_colonnes, flux_json_lignes, reponse_json
+from registre import ErreurParametres, registre, TYPES_TRANSACTION
+from execution import executer_en_parallele
+from admission import AdmissionRefusee, admission, reponse_refus
+from instrumentation import mesurer
+from taches_export import TERMINEE
+from segments import LIGNES_MAX_PERIODE, lignes_apres, ordonner
 
 BUCKET_NAME = 'documentation'
 
@@ -69,14 +78,34 @@ MAPPAGE_ACHATS = {
     "erp":              "p_erp",
 }
 
-def recuperer_donnees_rpc(type_transaction: str, filtres: dict) -> pd.DataFrame:
+# Colonnes servant de curseur (keyset) pour la pagination côté serveur :
+# la date de la transaction, puis le numéro de document pour départager les égalités.
+COLONNES_CURSEUR = {
+    'ventes': ('Date BL', 'N° BL'),
+    'achats': ('date achat', 'Reference achat'),
+}
+# Colonne de tri supplémentaire pour un ordre stable à l'intérieur d'un même document.
+COLONNE_DEPARTAGE = 'code article'
+
+TAILLE_PAGE_DEFAUT = 15
+TAILLE_PAGE_MAX = 500
+
+# Plafond historique du mode "résultat complet" (sans pagination).
+LIMITE_LIGNES_RPC = 42000
+
+# Nombre de lignes lues par lot lors d'un export en flux (par appels d'au plus RPC_LIGNES_MAX_REPONSE lignes).
+TAILLE_LOT_EXPORT = 2000
+
+# Le résultat d'une requête avancée est lu (et mis en cache) par lots de TAILLE_LOT_EXPORT lignes au plus :
+# la page affichée, les pages suivantes et le téléchargement relisent les mêmes lots.
+TAILLE_PAGE_AVANCEE = 15
+
+
+def preparer_appel_rpc(type_transaction: str, filtres: dict) -> tuple:
     """
-    Prépare et exécute un appel RPC vers Supabase pour filtrer les données.
+    Traduit les filtres reçus du frontend en un nom de RPC et un dictionnaire de paramètres SQL.
     Utilise un dictionnaire de mappage spécifique au type de transaction.
     """
-    if not current_app.supabase:
-        raise ConnectionError("La connexion à Supabase n'est pas configurée.")
-        
     # --- ÉTAPE 1 : Sélectionner le nom de la RPC et le bon dictionnaire de mappage ---
     if type_transaction == 'achats':
         nom_rpc = 'rechercher_achats'
@@ -85,9 +114,8 @@ def recuperer_donnees_rpc(type_transaction: str, filtres: dict) -> pd.DataFrame:
         nom_rpc = 'rechercher_ventes'
         mappage_correct = MAPPAGE_VENTES
     
-    # --- ÉTAPE 2 : Préparation des paramètres de date (logique inchangée) ---
+    # --- ÉTAPE 2 : Préparation des paramètres de date ---
     params = {}
-    # ... (Le code pour les dates reste exactement le même qu'avant) ...
     annee_debut_str = filtres.get('start_year')
     mois_debut_str = filtres.get('start_month')
     annee_fin_str = filtres.get('end_year')
@@ -132,29 +160,455 @@ def recuperer_donnees_rpc(type_transaction: str, filtres: dict) -> pd.DataFrame:
                         params[nom_parametre] = 'egal:' + valeur
                     else:
                         params[nom_parametre] = valeur
-    
-    # --- ÉTAPE 4 : Appel à la RPC et retour des résultats (logique inchangée) ---
+
+    return nom_rpc, params
+
+
+def executer_rpc(nom_rpc: str, params: dict, cacheable: bool = True, **options) -> dict:
+    """
+    Exécute une RPC sur la source de données de l'application en passant par le cache des résultats
+    (sauf si 'cacheable' est faux : requête avancée déclarée "cache": false dans le catalogue).
+    'options' (tri, apres, limite, decalage, compter) sont transmises à SourceDonnees.appeler_rpc
+    et distinguent cette lecture d'une autre lecture de la même RPC dans le cache.
+    Une requête avancée servie par un cumul mensuel à jour (agregats.py) est lue dans le cumul :
+    le résultat porte alors aussi "fraicheur", la date du calcul du cumul.
+    Hors cache, les appels identiques simultanés sont regroupés en un seul (coalescence.py).
+    Retourne {"data": ..., "count": ...}.
+    """
+    def appeler():
+        cumuls = current_app.cumuls
+        if cumuls is not None and cumuls.cumul_pour(nom_rpc, params):
+            with mesurer('cumul'):
+                return cumuls.appeler_rpc(nom_rpc, params, **options)
+        with mesurer('rpc'):
+            return current_app.source_donnees.appeler_rpc(nom_rpc, params, **options)
+
+    def produire():
+        return current_app.coalescence.executer(nom_rpc, params, appeler, options or None)
+    if not cacheable:
+        return produire()
+    # Le segment 'cache_rpc' ne compte que le surcoût du cache (lecture, (dé)sérialisation) : l'appel est exclu.
+    with mesurer('cache_rpc'):
+        return current_app.cache_rpc.obtenir(nom_rpc, params, produire, options or None)
+
+
+def classe_api_query() -> str:
+    """Classe de coût de /api/query : une page si la charge utile demande la pagination, sinon un résultat complet."""
+    charge_utile = request.get_json(silent=True) or {}
+    return 'page' if isinstance(charge_utile.get('pagination'), dict) else 'export'
+
+
+def plan_depuis_charge(charge: dict):
+    """
+    Retourne (plan, paramètres validés) pour une requête avancée reçue en JSON ({nom_fonction, filtres}).
+    Lève ErreurParametres si la fonction est absente du catalogue ou si les filtres sont refusés.
+    """
+    nom_fonction = charge.get("nom_fonction")
+    if not nom_fonction:
+        raise ErreurParametres({"nom_fonction": "Le nom de la fonction est manquant."})
+    plan = registre.plan_requete(nom_fonction)
+    if plan is None:
+        raise ErreurParametres({"nom_fonction": f"La requête '{nom_fonction}' n'existe pas dans le catalogue."})
+    return plan, plan.valider(charge.get("filtres") or {})
+
+
+def decouper_periode(date_debut: str, date_fin: str, pas_mois: int, debut_donnees: str) -> list:
+    """
+    Découpe la période [date_debut, date_fin[ en tranches de 'pas_mois' mois alignées sur le calendrier
+    (mois, trimestres...). Tout ce qui précède 'debut_donnees' (historique quasi vide) forme une seule tranche.
+    Retourne la liste des couples (début, fin) au format AAAA-MM-JJ, dans l'ordre chronologique.
+    """
+    debut, fin = date.fromisoformat(date_debut), date.fromisoformat(date_fin)
+    tranches = []
+    borne = max(debut, date.fromisoformat(debut_donnees))
+    if debut < borne:
+        tranches.append((debut, min(borne, fin)))
+    # Première coupure : le début de la tranche calendaire qui suit 'borne'.
+    indice = (borne.year * 12 + borne.month - 1) // pas_mois * pas_mois + pas_mois
+    while borne < fin:
+        coupure = min(date(indice // 12, indice % 12 + 1, 1), fin)
+        tranches.append((borne, coupure))
+        borne, indice = coupure, indice + pas_mois
+    return [(d.isoformat(), f.isoformat()) for d, f in tranches]
+
+
+def recuperer_donnees_rpc(type_transaction: str, filtres: dict) -> pd.DataFrame:
+    """
+    Prépare et exécute un appel RPC sur la source de données pour filtrer les données.
+    Retourne l'intégralité du résultat (plafonné à LIMITE_LIGNES_RPC lignes), triée par date croissante.
+    Le résultat est lu par lots successifs (iterer_lots_rpc, partitionné par période si RPC_PARTITION_MOIS
+    est configuré) ; chaque lot est converti en DataFrame dès sa réception.
+    """
+    nom_rpc, params = preparer_appel_rpc(type_transaction, filtres)
+
+    # --- ÉTAPE 4 : Appel à la RPC par lots et retour des résultats ---
     try:
-        print(f"Appel RPC : {nom_rpc} avec les paramètres : {params}")
-        response = current_app.supabase.rpc(nom_rpc, params).limit(42000).execute()
-        print(f"Supabase a retourné {len(response.data)} ligne(s).")
-        return pd.DataFrame(response.data) if isinstance(response.data, list) else pd.DataFrame()
+        morceaux = []
+        tronque = []
+        current_app.logger.debug(f"Appel RPC par lots : {nom_rpc} avec les filtres : {filtres}")
+        lots = iterer_lots_rpc(type_transaction, filtres, lignes_max=LIMITE_LIGNES_RPC,
+                               sur_troncature=lambda: tronque.append(True))
+        for lot in lots:
+            with mesurer('dataframe'):
+                morceaux.append(pd.DataFrame(lot))
+        nb_lignes = sum(len(morceau) for morceau in morceaux)
+        current_app.logger.debug(f"La source a retourné {nb_lignes} ligne(s) en {len(morceaux)} lot(s).")
+        if tronque:
+            current_app.logger.warning(f"Résultat de '{nom_rpc}' tronqué à {LIMITE_LIGNES_RPC} lignes.")
+        if not morceaux:
+            return pd.DataFrame()
+        with mesurer('dataframe'):
+            return pd.concat(morceaux, ignore_index=True) if len(morceaux) > 1 else morceaux[0]
     except Exception as e:
-        print(f"🔥 ERREUR CRITIQUE lors de l'appel de la RPC '{nom_rpc}' : {e}")
-        return pd.DataFrame()    
-
-def generer_et_envoyer_fichier(df_filtre: pd.DataFrame, format_demande: str) -> Response:
-    horodatage = datetime.now().strftime("%Y%m%d_%H%M%S")
-    if format_demande == 'xlsx':
-        tampon = io.BytesIO()
-        df_filtre.to_excel(tampon, index=False, sheet_name='Résultats', engine='openpyxl')
-        tampon.seek(0)
-        return send_file(tampon, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', as_attachment=True, download_name=f"export_{horodatage}.xlsx")
-    else:
-        tampon_texte = io.StringIO()
-        df_filtre.to_csv(tampon_texte, index=False, sep=';', encoding='utf-8-sig')
-        tampon = io.BytesIO(tampon_texte.getvalue().encode('utf-8-sig'))
-        return send_file(tampon, mimetype='text/csv; charset=utf-8', as_attachment=True, download_name=f"export_{horodatage}.csv")
+        current_app.logger.error(f"🔥 ERREUR CRITIQUE lors de l'appel de la RPC '{nom_rpc}' : {e}")
+        return pd.DataFrame()
+
+
+def encoder_curseur(valeurs: list) -> str:
+    """Encode les valeurs de position d'une page (date, document, lignes déjà lues) en un curseur opaque."""
+    return base64.urlsafe_b64encode(json.dumps(valeurs, default=str).encode('utf-8')).decode('ascii')
+
+
+def decoder_curseur(curseur: str) -> list:
+    """
+    Décode un curseur produit par encoder_curseur. Lève ValueError s'il est invalide.
+    La date et le document peuvent être None : une page peut se terminer sur une ligne sans date.
+    """
+    try:
+        valeurs = json.loads(base64.urlsafe_b64decode(curseur.encode('ascii')))
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        raise ValueError("Curseur de pagination invalide.")
+    if not isinstance(valeurs, list) or len(valeurs) != 3 or not isinstance(valeurs[2], int) or valeurs[2] < 0:
+        raise ValueError("Curseur de pagination invalide.")
+    return valeurs
+
+
+def taille_morceau(taille: int) -> int:
+    """Nombre de lignes à demander par appel pour en obtenir 'taille' : jamais plus que RPC_LIGNES_MAX_REPONSE."""
+    plafond = current_app.config.get('RPC_LIGNES_MAX_REPONSE', 0)
+    return min(taille, plafond) if plafond > 0 else taille
+
+
+def fin_du_resultat(nb_lignes: int, limite: int) -> bool:
+    """
+    Indique si une réponse de 'nb_lignes' lignes pour 'limite' demandées termine le résultat.
+    Une réponse vide le termine toujours. Une réponse plus courte que demandé le termine aussi quand
+    RPC_LIGNES_MAX_REPONSE est configuré : la demande ne dépassant pas ce plafond, elle n'a pas pu être coupée.
+    Sans plafond configuré, seule une réponse vide fait foi.
+    """
+    return nb_lignes == 0 or (current_app.config.get('RPC_LIGNES_MAX_REPONSE', 0) > 0 and nb_lignes < limite)
+
+
+def tri_recherche(type_transaction: str, descendant: bool) -> tuple:
+    """Retourne (tri, (colonne date, colonne document)) de la pagination par curseur d'un type de transaction."""
+    colonne_date, colonne_document = COLONNES_CURSEUR.get(type_transaction, COLONNES_CURSEUR['ventes'])
+    tri = [(colonne_date, descendant), (colonne_document, descendant), (COLONNE_DEPARTAGE, descendant)]
+    return tri, (colonne_date, colonne_document)
+
+
+def position_apres(lignes: list, colonnes: tuple, position: list = None) -> list:
+    """
+    Position [date, document, lignes lues] qui suit la dernière des 'lignes', lues à partir de 'position'.
+    Un même document (ex : un BL) peut compter plusieurs lignes : la position mémorise donc aussi
+    combien de lignes du dernier couple (date, document) ont déjà été lues.
+    """
+    colonne_date, colonne_document = colonnes
+    cle = [lignes[-1].get(colonne_date), lignes[-1].get(colonne_document)]
+    lus = 0
+    for ligne in reversed(lignes):
+        if [ligne.get(colonne_date), ligne.get(colonne_document)] != cle:
+            break
+        lus += 1
+    if lus == len(lignes) and position is not None and list(position[:2]) == cle:
+        lus += position[2]
+    return [cle[0], cle[1], lus]
+
+
+def lire_morceau(nom_rpc: str, params: dict, tri: list, colonnes: tuple, limite: int, position: list = None,
+                 compter: bool = False) -> dict:
+    """
+    Lit au plus 'limite' lignes de la RPC de recherche situées après 'position' ([date, document, lignes lues],
+    None = depuis le début). Retourne {"data": [lignes], "count": ...}.
+    """
+    colonne_date, colonne_document = colonnes
+    apres = [[colonne_date, position[0]], [colonne_document, position[1]]] if position else None
+    reponse = executer_rpc(nom_rpc, params, tri=tri, apres=apres, limite=limite,
+                           decalage=position[2] if position else 0, compter=compter)
+    return {"data": reponse["data"] if isinstance(reponse["data"], list) else [], "count": reponse["count"]}
+
+
+def iterer_morceaux(nom_rpc: str, params: dict, tri: list, colonnes: tuple, taille: int, position: list = None,
+                    sur_total=None, premier: list = None):
+    """
+    Générateur qui lit la RPC de recherche par morceaux successifs à partir de 'position' (pagination par curseur),
+    chacun de taille_morceau(taille) lignes au plus. La lecture s'arrête sur la réponse qui termine le résultat
+    (fin_du_resultat). C'est à l'appelant de cesser de consommer le générateur quand il a assez de lignes.
+    Si 'sur_total' est fourni, il est appelé avec le nombre total de lignes dès la première réponse.
+    'premier' est le premier morceau lorsqu'il a déjà été lu (lecture anticipée des tranches).
+    """
+    limite = taille_morceau(taille)
+    lignes = premier
+    while True:
+        if lignes is None:
+            reponse = lire_morceau(nom_rpc, params, tri, colonnes, limite, position, compter=sur_total is not None)
+            if sur_total is not None:
+                sur_total(reponse["count"])
+                sur_total = None
+            lignes = reponse["data"]
+        if not lignes:
+            return
+        yield lignes
+        if fin_du_resultat(len(lignes), limite):
+            return
+        position = position_apres(lignes, colonnes, position)
+        lignes = None
+
+
+def bornes_donnees(nom_rpc: str, params: dict, tri: list, colonnes: tuple):
+    """
+    Mois couverts par le résultat de la RPC de recherche : (premier jour du premier mois, premier jour du mois
+    qui suit le dernier) au format AAAA-MM-JJ, lus avec deux appels d'une ligne (dates la plus ancienne
+    et la plus récente). Retourne None si le résultat ne contient aucune ligne datée.
+    """
+    dates = []
+    for descendant in (False, True):
+        lignes = lire_morceau(nom_rpc, params, [(colonne, descendant) for colonne, _ in tri], colonnes, 1)["data"]
+        if not lignes or lignes[0].get(colonnes[0]) is None:
+            return None
+        dates.append(date.fromisoformat(str(lignes[0][colonnes[0]])[:7] + '-01'))
+    fin = dates[1]
+    fin = date(fin.year + fin.month // 12, fin.month % 12 + 1, 1)
+    return dates[0].isoformat(), fin.isoformat()
+
+
+def tranches_recherche(params: dict, descendant: bool, position: list = None, lire_bornes=None):
+    """
+    Tranches de période (voir decouper_periode) d'une recherche partitionnée, dans l'ordre du tri :
+    liste de (début, fin, position de départ). La période est d'abord réduite aux mois qui contiennent
+    des lignes ('lire_bornes()', voir bornes_donnees) : aucune tranche vide avant la première ligne
+    ou après la dernière. Les tranches entièrement situées avant 'position' sont écartées
+    et la position ne s'applique qu'à la tranche qui la contient.
+    Retourne None si la lecture n'est pas partitionnée : RPC_PARTITION_MOIS nul, une seule tranche, ou position
+    sur une ligne sans date (ces lignes, placées en dernier, n'appartiennent à aucune tranche).
+    """
+    pas_mois = current_app.config.get('RPC_PARTITION_MOIS', 0)
+    if pas_mois <= 0 or (position is not None and position[0] is None):
+        return None
+    debut_donnees = current_app.config.get('RPC_PARTITION_DEBUT', '1900-01-01')
+    date_debut, date_fin = params['p_date_debut'], params['p_date_fin']
+    if len(decouper_periode(date_debut, date_fin, pas_mois, debut_donnees)) <= 1:
+        return None
+    if lire_bornes is not None:
+        bornes = lire_bornes()
+        if bornes is None:
+            return []
+        date_debut, date_fin = max(date_debut, bornes[0]), min(date_fin, bornes[1])
+        if date_debut >= date_fin:
+            return []
+    tranches = decouper_periode(date_debut, date_fin, pas_mois, debut_donnees)
+    # Une fenêtre étroite n'est pas partitionnée : un seul appel la couvre.
+    if len(tranches) <= 1:
+        return None
+    if descendant:
+        tranches.reverse()
+    if position is None:
+        return [(debut, fin, None) for debut, fin in tranches]
+    jour = str(position[0])[:10]
+    return [(debut, fin, position if debut <= jour < fin else None) for debut, fin in tranches
+            if (debut <= jour if descendant else fin > jour)]
+
+
+def iterer_recherche(type_transaction: str, nom_rpc: str, params: dict, tri: list, colonnes: tuple, descendant: bool,
+                     taille: int, position: list = None, sur_total=None):
+    """
+    Générateur qui lit le résultat de la RPC de recherche dans l'ordre du tri, à partir de 'position',
+    par morceaux (iterer_morceaux). Si RPC_PARTITION_MOIS est configuré, la période est découpée en tranches
+    (tranches_recherche) lues l'une après l'autre, chacune paginée par curseur : une page n'interroge que
+    les tranches nécessaires pour se remplir, et chaque appel ne porte que sur une tranche.
+    Le premier morceau des tranches suivantes est lu par anticipation, par vagues de EXECUTION_CONCURRENCE_MAX
+    appels simultanés (la première vague ne lit qu'une tranche : une page tient souvent dans la plus récente).
+    Si les segments mensuels sont actifs (segments.py), une tranche en segments est lue sur le disque,
+    et une tranche lue en entier depuis son début est enregistrée.
+    Si 'sur_total' est fourni, il est appelé avec le nombre total de lignes avant le premier morceau.
+    """
+    tranches = tranches_recherche(params, descendant, position,
+                                  lambda: bornes_donnees(nom_rpc, params, tri, colonnes))
+    if tranches is None:
+        yield from iterer_morceaux(nom_rpc, params, tri, colonnes, taille, position, sur_total)
+        return
+    if sur_total is not None:
+        sur_total(executer_rpc(nom_rpc, params, limite=1, compter=True)["count"])
+
+    limite = taille_morceau(taille)
+    concurrence = max(current_app.config.get('EXECUTION_CONCURRENCE_MAX', 4), 1)
+    segments = current_app.segments
+
+    def premier_morceau(parametres: dict, depart: list) -> tuple:
+        # Retourne (lignes, lues dans les segments) : une tranche en segments est lue en entier, sans appel RPC.
+        if segments is not None:
+            lignes = segments.lire(type_transaction, nom_rpc, parametres)
+            if lignes is not None:
+                return lignes_apres(ordonner(lignes, tri), colonnes, depart, descendant), True
+        return lire_morceau(nom_rpc, parametres, tri, colonnes, limite, depart)["data"], False
+
+    indice, taille_vague = 0, 1
+    while indice < len(tranches):
+        vague = [({**params, 'p_date_debut': debut, 'p_date_fin': fin}, depart)
+                 for debut, fin, depart in tranches[indice:indice + taille_vague]]
+        premiers = executer_en_parallele(
+            [lambda p=parametres, d=depart: premier_morceau(p, d) for parametres, depart in vague], concurrence)
+        for (parametres, depart), (premier, local) in zip(vague, premiers):
+            if local:
+                for debut in range(0, len(premier), limite):
+                    yield premier[debut:debut + limite]
+                continue
+            morceaux = iterer_morceaux(nom_rpc, parametres, tri, colonnes, taille, depart, premier=premier)
+            if segments is None or depart is not None:
+                yield from morceaux
+                continue
+            # Tranche lue depuis son début : enregistrée en segments si elle est lue jusqu'au bout
+            # (un lecteur qui s'arrête avant, comme une page remplie, ne l'enregistre pas).
+            lues = []
+            for morceau in morceaux:
+                if lues is not None:
+                    lues.extend(morceau)
+                    if len(lues) > LIGNES_MAX_PERIODE:
+                        lues = None
+                yield morceau
+            if lues is not None:
+                segments.enregistrer(type_transaction, nom_rpc, parametres, colonnes[0], lues)
+        indice += taille_vague
+        taille_vague = concurrence
+
+
+def recuperer_page_rpc(type_transaction: str, filtres: dict, taille_page: int = TAILLE_PAGE_DEFAUT,
+                       ordre: str = 'desc', curseur: str = None, avec_total: bool = False) -> dict:
+    """
+    Exécute la RPC de recherche et ne retourne qu'une page de résultats.
+    La pagination se fait par curseur (keyset) sur (date, numéro de document) :
+    la base ne renvoie que les lignes situées après la dernière ligne de la page précédente.
+    Comme un document peut compter plusieurs lignes, le curseur conserve aussi le nombre de
+    lignes déjà lues pour le dernier couple (date, document), qui sont sautées via un offset.
+    Les lignes sans date (ou sans document) sont placées en dernier, dans les deux sens de tri.
+    La page est remplie par morceaux (iterer_morceaux) jusqu'à obtenir une ligne de plus que nécessaire,
+    qui indique l'existence d'une page suivante.
+    Le nombre total de lignes n'est calculé que si 'avec_total' est demandé.
+    """
+    nom_rpc, params = preparer_appel_rpc(type_transaction, filtres)
+    descendant = ordre != 'asc'
+    tri, colonnes = tri_recherche(type_transaction, descendant)
+    position = decoder_curseur(curseur) if curseur else None
+
+    total = []
+    lignes = []
+    for morceau in iterer_recherche(type_transaction, nom_rpc, params, tri, colonnes, descendant, taille_page + 1,
+                                    position, sur_total=total.append if avec_total else None):
+        lignes.extend(morceau)
+        if len(lignes) > taille_page:
+            break
+    page_suivante = len(lignes) > taille_page
+    lignes = lignes[:taille_page]
+
+    return {
+        "lignes": lignes,
+        "taille_page": taille_page,
+        "ordre": 'desc' if descendant else 'asc',
+        "curseur_suivant": encoder_curseur(position_apres(lignes, colonnes, position)) if page_suivante else None,
+        "total": total[0] if total else None,
+    }
+
+def iterer_lots_rpc(type_transaction: str, filtres: dict, taille_lot: int = TAILLE_LOT_EXPORT, sur_total=None,
+                    lignes_max: int = None, sur_troncature=None):
+    """
+    Générateur qui parcourt tout le résultat de la RPC de recherche (par date croissante) par lots
+    d'au plus 'taille_lot' lignes, en s'appuyant sur la pagination par curseur (iterer_morceaux) :
+    chaque lot est traité par l'appelant avant la lecture du suivant.
+    Si 'sur_total' est fourni, il est appelé avec le nombre total de lignes dès le premier lot.
+    Sans 'lignes_max', aucun plafond de lignes ne s'applique ; sinon la lecture s'arrête après 'lignes_max'
+    lignes et 'sur_troncature' (facultatif) est appelé s'il en restait d'autres.
+    """
+    nom_rpc, params = preparer_appel_rpc(type_transaction, filtres)
+    tri, colonnes = tri_recherche(type_transaction, False)
+    restantes = lignes_max
+    for lot in iterer_recherche(type_transaction, nom_rpc, params, tri, colonnes, False, taille_lot,
+                                sur_total=sur_total):
+        if restantes is not None:
+            if restantes <= 0:
+                if sur_troncature is not None:
+                    sur_troncature()
+                return
+            lot = lot[:restantes]
+            restantes -= len(lot)
+        yield lot
+
+
+def lire_lot_avance(plan, params: dict, decalage: int) -> dict:
+    """
+    Lit le lot qui commence à la ligne 'decalage' (pagination par plage/offset) du résultat d'une RPC avancée,
+    ces fonctions d'agrégation ne possédant pas de colonnes de curseur communes. Un lot demande
+    taille_morceau(TAILLE_LOT_EXPORT) lignes ; un lot plus court termine le résultat (fin_du_resultat).
+    Le premier lot porte aussi le nombre total de lignes ("count").
+    'params' doit avoir été validé par plan.valider().
+    """
+    resultat = executer_rpc(plan.nom_fonction, params, plan.cacheable, limite=taille_morceau(TAILLE_LOT_EXPORT),
+                            decalage=decalage, compter=decalage == 0)
+    if not isinstance(resultat["data"], list):
+        raise ValueError("Le résultat de la requête n'est pas valide.")
+    return resultat
+
+
+def iterer_lots_rpc_avancee(plan, params: dict):
+    """
+    Générateur qui parcourt tout le résultat d'une RPC avancée, lot par lot, jusqu'au lot qui le termine
+    (fin_du_resultat).
+    Les lots déjà lus pour l'affichage des pages sont repris du cache. L'export n'est pas plafonné à plan.lignes_max.
+    """
+    decalage = 0
+    limite = taille_morceau(TAILLE_LOT_EXPORT)
+    while True:
+        donnees = lire_lot_avance(plan, params, decalage)["data"]
+        if not donnees:
+            return
+        yield donnees
+        if fin_du_resultat(len(donnees), limite):
+            return
+        decalage += len(donnees)
+
+
+def recuperer_page_avancee(plan, params: dict, page: int = 1, taille_page: int = TAILLE_PAGE_AVANCEE) -> dict:
+    """
+    Retourne une page du résultat d'une RPC avancée, découpée dans les lots mis en cache.
+    Les lots sont lus à partir du lot aligné qui contient le début de la page, jusqu'à ce que la page
+    soit remplie ou qu'un lot soit vide.
+    Seules les plan.lignes_max premières lignes peuvent être parcourues (le téléchargement reste complet).
+    """
+    premier_lot = lire_lot_avance(plan, params, 0)
+    total = premier_lot["count"] if premier_lot["count"] is not None else len(premier_lot["data"])
+    tronque = bool(plan.lignes_max) and total > plan.lignes_max
+    parcourables = plan.lignes_max if tronque else total
+
+    debut = (page - 1) * taille_page
+    fin = min(debut + taille_page, parcourables)
+    lignes = []
+    taille_lot = taille_morceau(TAILLE_LOT_EXPORT)
+    decalage = debut // taille_lot * taille_lot
+    while decalage < fin:
+        lot = (premier_lot if decalage == 0 else lire_lot_avance(plan, params, decalage))["data"]
+        if not lot:
+            break
+        lignes.extend(lot[max(debut - decalage, 0):fin - decalage])
+        decalage += len(lot)
+
+    return {
+        "lignes": lignes,
+        "colonnes": list(premier_lot["data"][0].keys()) if premier_lot["data"] else [],
+        "page": page,
+        "taille_page": taille_page,
+        "pages": max(-(-parcourables // taille_page), 1),
+        "total": total,
+        "lignes_max": plan.lignes_max if tronque else None,
+        "fraicheur": premier_lot.get("fraicheur"),
+    }
 
 
 # =======================================================
@@ -223,13 +677,10 @@ def resultat_requete_avancee():
             flash("Erreur : les paramètres de la requête sont manquants.", "error")
             return redirect(url_for('main.filtre_requete_avancee'))
         try:
-            chemin_fichier = f"static/data_demo/{type_transaction}_requetes_avancees.json"
-            with open(chemin_fichier, "r", encoding="utf-8") as f:
-                toutes_les_requetes = json.load(f)
+            requete = registre.requete_avancee(type_transaction, id_requete)
         except FileNotFoundError:
             flash(f"Erreur : le fichier de configuration pour '{type_transaction}' est introuvable.", "error")
             return redirect(url_for('main.filtre_requete_avancee'))
-        requete = next((r for r in toutes_les_requetes if r["id"] == id_requete), None)
         if not requete:
             flash(f"Erreur : la requête avec l'ID '{id_requete}' n'a pas été trouvée.", "error")
             return redirect(url_for('main.filtre_requete_avancee'))
@@ -237,29 +688,28 @@ def resultat_requete_avancee():
 
     if request.method == "POST":
         nom_fonction = request.form.get("nom_fonction")
-        filtres_rpc = {}
-        annee_debut = int(request.form.get('start_year') or 1900)
-        mois_debut = int(request.form.get('start_month') or 1)
-        filtres_rpc['p_date_debut'] = datetime(annee_debut, mois_debut, 1).strftime('%Y-%m-%d')
-        aujourdhui = datetime.now()
-        annee_fin = int(request.form.get('end_year') or aujourdhui.year)
-        mois_fin = int(request.form.get('end_month') or aujourdhui.month)
-        date_fin_obj = datetime(annee_fin, mois_fin + 1, 1) if mois_fin < 12 else datetime(annee_fin + 1, 1, 1)
-        filtres_rpc['p_date_fin'] = date_fin_obj.strftime('%Y-%m-%d')
-        noms_champs = request.form.getlist('field[]')
-        valeurs_champs = request.form.getlist('value[]')
-        for i in range(len(noms_champs)):
-            nom_parametre_rpc = noms_champs[i]
-            valeur = valeurs_champs[i]
-            if nom_parametre_rpc and valeur:
-                filtres_rpc[nom_parametre_rpc] = valeur
+        plan = registre.plan_requete(nom_fonction) if nom_fonction else None
+        if plan is None:
+            flash(f"Erreur : la requête '{nom_fonction}' n'existe pas dans le catalogue.", "error")
+            return redirect(url_for('main.filtre_requete_avancee'))
+        try:
+            filtres_rpc = plan.depuis_formulaire(request.form)
+        except ErreurParametres as e:
+            for message in e.erreurs.values():
+                flash(f"Erreur : {message}", "error")
+            return redirect(url_for('main.resultat_requete_avancee', type=plan.type_transaction, id=plan.id))
         try:
-            resultat = current_app.supabase.rpc(nom_fonction, filtres_rpc).execute()
-            if isinstance(resultat.data, list):
-                return render_template("resultat-requete-avancee.html", donnees=resultat.data, colonnes=list(resultat.data[0].keys()) if resultat.data else [], nom_fonction=nom_fonction, filtres=filtres_rpc)
-            else:
-                flash(f"Erreur : Le résultat de la requête '{nom_fonction}' n'est pas valide.", "error")
-                return redirect(url_for('main.filtre_requete_avancee'))
+            # Seule la première page est rendue : les suivantes sont lues via /api/requete-avancee/page.
+            with current_app.admission.admettre('agregat'):
+                page = recuperer_page_avancee(plan, filtres_rpc)
+            return render_template("resultat-requete-avancee.html", page=page, nom_fonction=nom_fonction,
+                                   filtres=filtres_rpc)
+        except AdmissionRefusee as e:
+            flash(f"{e} (réessayez dans {e.retry_after} s)", "error")
+            return redirect(url_for('main.resultat_requete_avancee', type=plan.type_transaction, id=plan.id))
+        except ValueError:
+            flash(f"Erreur : Le résultat de la requête '{nom_fonction}' n'est pas valide.", "error")
+            return redirect(url_for('main.filtre_requete_avancee'))
         except Exception as e:
             flash(f"Erreur lors de l'exécution de la requête : {e}", "error")
             return redirect(url_for('main.filtre_requete_avancee'))
@@ -289,7 +739,13 @@ def guide_detail(category_slug, sub_item_slug):
     path_in_bucket = f"{category_slug}/{pdf_filename}"
     
     # (c) Obtenir l'URL publique et permanente du fichier depuis Supabase.
-    pdf_public_url = supabase.storage.from_(BUCKET_NAME).get_public_url(path_in_bucket)
+    # Sans stockage Supabase (mode SQLite local), on sert la copie livrée dans static/pdfs si elle existe.
+    if supabase_stockage is not None:
+        pdf_public_url = supabase_stockage.storage.from_(BUCKET_NAME).get_public_url(path_in_bucket)
+    elif os.path.isfile(os.path.join(current_app.static_folder, 'pdfs', pdf_filename)):
+        pdf_public_url = url_for('static', filename=f'pdfs/{pdf_filename}')
+    else:
+        abort(503, description="Le stockage de la documentation n'est pas configuré pour cette instance.")
     
     # (d) Passer cette URL à la template pour qu'elle puisse l'utiliser (par ex. dans un <iframe>).
     return render_template(
@@ -363,69 +819,284 @@ def write_users_data(data):
 
 @main.route('/api/query', methods=['POST'])
 @login_required
+@admission(classe_api_query)
 def api_query():
-    """Point d'accès principal pour les requêtes RPC filtrées."""
+    """
+    Point d'accès principal pour les requêtes RPC filtrées.
+    Si la charge utile contient un objet 'pagination' ({taille_page, ordre, curseur, avec_total}),
+    seule la page demandée est retournée : {lignes, taille_page, ordre, curseur_suivant, total}.
+    Sinon, l'ensemble du résultat est retourné sous forme de liste.
+    Avec 'format' = 'colonnes', le JSON est orienté colonnes : {colonnes: [...], lignes: [[...], ...]}.
+    Avec 'format' = 'arrow' ou 'parquet', les lignes sont renvoyées dans ce format colonnes typé ;
+    en mode paginé, le curseur suivant et le total passent alors par les en-têtes X-Curseur-Suivant / X-Total.
+    Les réponses JSON sont compressées (gzip/brotli) selon l'en-tête Accept-Encoding.
+    """
     try:
         charge_utile = request.get_json()
+        current_app.logger.debug(f"Données JSON reçues par /api/query: {charge_utile}")
+        type_transaction = charge_utile.get('type_transaction', 'ventes')
 
-        # ======================= LÍNEAS DE DEPURACIÓN =======================
-        # Imprimimos TODO el JSON que llega para no tener dudas.
-        print(f"DEBUG: Données JSON reçues par /api/query: {charge_utile}")
-        # ====================================================================
+        filtres = charge_utile.get('filtres', {})
+        format_reponse = (charge_utile.get('format') or 'json').lower()
 
-        type_transaction = charge_utile.get('type_transaction', 'ventes')
+        # Mode paginé : le client demande une seule page (curseur + taille de page).
+        pagination = charge_utile.get('pagination')
+        if isinstance(pagination, dict):
+            try:
+                taille_page = int(pagination.get('taille_page') or TAILLE_PAGE_DEFAUT)
+            except (ValueError, TypeError):
+                return jsonify({"erreur": "La taille de page doit être un entier."}), 400
+            taille_page = max(1, min(taille_page, TAILLE_PAGE_MAX))
+            ordre = 'asc' if pagination.get('ordre') == 'asc' else 'desc'
+            curseur = pagination.get('curseur')
+            avec_total = bool(pagination.get('avec_total', not curseur))
+            try:
+                page = recuperer_page_rpc(type_transaction, filtres, taille_page, ordre, curseur, avec_total)
+            except ValueError as e:
+                return jsonify({"erreur": str(e)}), 400
+            if format_reponse in FORMATS_COLONNES:
+                reponse = reponse_export([page['lignes']], format_reponse, en_piece_jointe=False)
+                if page['curseur_suivant']:
+                    reponse.headers['X-Curseur-Suivant'] = page['curseur_suivant']
+                if page['total'] is not None:
+                    reponse.headers['X-Total'] = str(page['total'])
+                return reponse
+            if format_reponse == 'colonnes':
+                page.update(en_colonnes(page['lignes']))
+            return reponse_json(page, request.headers.get('Accept-Encoding'))
 
-        # ======================= LÍNEAS DE DEPURACIÓN =======================
-        # Imprimimos el valor que se ha asignado a la variable.
-        print(f"DEBUG: La variable 'type_transaction' a été définie à : '{type_transaction}'")
-        # ====================================================================
+        # Formats colonnes : le résultat complet est lu par lots et encodé sans passer par pandas.
+        if format_reponse in FORMATS_COLONNES:
+            return reponse_export(iterer_lots_rpc(type_transaction, filtres), format_reponse, en_piece_jointe=False)
 
-        filtres = charge_utile.get('filtres', {})
-        df_resultats = recuperer_donnees_rpc(type_transaction, filtres)
-        return Response(df_resultats.to_json(orient="records", date_format="iso"), mimetype='application/json')
+        # Résultat complet en JSON : les lots de la RPC sont encodés directement dans la réponse en flux.
+        lots = amorcer_lots(iterer_lots_rpc(type_transaction, filtres))
+        flux = flux_json_colonnes(lots) if format_reponse == 'colonnes' else flux_json_lignes(lots)
+        return reponse_json(flux, request.headers.get('Accept-Encoding'))
     except Exception as e:
-        print(f"🔥 Erreur API /api/query: {e}")
+        current_app.logger.error(f"🔥 Erreur API /api/query: {e}")
+        return jsonify({"erreur": str(e)}), 503
+
+
+@main.route('/api/query/ventes-achats', methods=['POST'])
+@login_required
+@admission('page')
+def api_query_ventes_achats():
+    """
+    Une page de ventes et une page d'achats pour les mêmes filtres, en une seule requête.
+    Les deux RPC sont exécutées en parallèle : la durée est celle de la plus lente des deux.
+    Charge utile : {filtres, filtres_ventes?, filtres_achats?, format?,
+                    pagination: {taille_page, ordre, avec_total, curseurs: {ventes, achats}}}.
+    Les filtres propres à un type complètent les filtres communs ('fields' inconnus d'un type sont ignorés).
+    Réponse : {ventes: page, achats: page}, chaque page ayant le format du mode paginé de /api/query.
+    """
+    try:
+        charge_utile = request.get_json() or {}
+        filtres_communs = charge_utile.get('filtres', {})
+        format_reponse = (charge_utile.get('format') or 'json').lower()
+        pagination = charge_utile.get('pagination') or {}
+        try:
+            taille_page = int(pagination.get('taille_page') or TAILLE_PAGE_DEFAUT)
+        except (ValueError, TypeError):
+            return jsonify({"erreur": "La taille de page doit être un entier."}), 400
+        taille_page = max(1, min(taille_page, TAILLE_PAGE_MAX))
+        ordre = 'asc' if pagination.get('ordre') == 'asc' else 'desc'
+        curseurs = pagination.get('curseurs') or {}
+
+        appels = []
+        for type_transaction in TYPES_TRANSACTION:
+            filtres = {**filtres_communs, **charge_utile.get(f'filtres_{type_transaction}', {})}
+            curseur = curseurs.get(type_transaction)
+            avec_total = bool(pagination.get('avec_total', not curseur))
+            appels.append(lambda t=type_transaction, f=filtres, c=curseur, total=avec_total:
+                          recuperer_page_rpc(t, f, taille_page, ordre, c, total))
+        try:
+            pages = dict(zip(TYPES_TRANSACTION, executer_en_parallele(appels)))
+        except ValueError as e:
+            return jsonify({"erreur": str(e)}), 400
+
+        if format_reponse == 'colonnes':
+            for page in pages.values():
+                page.update(en_colonnes(page['lignes']))
+        return reponse_json(pages, request.headers.get('Accept-Encoding'))
+    except Exception as e:
+        current_app.logger.error(f"🔥 Erreur API /api/query/ventes-achats: {e}")
         return jsonify({"erreur": str(e)}), 503
 
 
 @main.route('/api/<type_transaction>/download', methods=['POST'])
 @login_required
+@admission('export')
 def api_telecharger_donnees(type_transaction):
-    """Génère un fichier (CSV/XLSX) des données réelles filtrées."""
+    """Génère un fichier (CSV/XLSX/Arrow/Parquet) des données réelles filtrées, envoyé en flux par lots."""
     if type_transaction not in ['ventes', 'achats']:
         abort(404)
     try:
         charge_utile = request.get_json()
         filtres = charge_utile.get('filtres', {})
         format_demande = charge_utile.get('format', 'csv').lower()
-        df_filtre = recuperer_donnees_rpc(type_transaction, filtres)
-        return generer_et_envoyer_fichier(df_filtre, format_demande)
+        return reponse_export(iterer_lots_rpc(type_transaction, filtres), format_demande)
     except Exception as e:
         return jsonify({"erreur": f"Erreur lors de la génération du fichier réel : {str(e)}"}), 500
 
+@main.route('/api/requete-avancee/page', methods=['POST'])
+@login_required
+@admission('agregat')
+def page_requete_avancee():
+    """
+    Retourne une page du résultat d'une requête avancée.
+    Corps : {nom_fonction, filtres, page, taille_page} ; filtres au format renvoyé par la page de résultats.
+    """
+    charge = request.get_json(silent=True) or {}
+    try:
+        plan, params = plan_depuis_charge(charge)
+        page = int(charge.get('page', 1))
+        taille_page = int(charge.get('taille_page', TAILLE_PAGE_AVANCEE))
+    except ErreurParametres as e:
+        return jsonify({"erreur": str(e), "details": e.erreurs}), 400
+    except (TypeError, ValueError):
+        return jsonify({"erreur": "Paramètres de pagination invalides."}), 400
+    if page < 1 or not 1 <= taille_page <= TAILLE_PAGE_MAX:
+        return jsonify({"erreur": f"La page doit être >= 1 et la taille de page comprise entre 1 et {TAILLE_PAGE_MAX}."}), 400
+    try:
+        return jsonify(recuperer_page_avancee(plan, params, page, taille_page))
+    except Exception as e:
+        current_app.logger.error(f"Erreur lors de la lecture d'une page de '{plan.nom_fonction}' : {e}")
+        return jsonify({"erreur": "Erreur lors de l'exécution de la requête."}), 500
+
 @main.route('/api/requete-avancee/download', methods=['POST'])
 @login_required
+@admission('export')
 def telecharger_requete_avancee():
-    """Gère le téléchargement des résultats d'une requête avancée."""
+    """
+    Gère le téléchargement des résultats d'une requête avancée.
+    Les lots déjà lus pour l'affichage sont repris du cache au lieu de relancer la RPC.
+    """
     try:
-        charge = request.get_json()
-        nom_fonction = charge.get("nom_fonction")
-        filtres = charge.get("filtres", {})
+        charge = request.get_json() or {}
         format_demande = charge.get("format", "csv")
+        try:
+            plan, params = plan_depuis_charge(charge)
+        except ErreurParametres as e:
+            return jsonify({"erreur": str(e), "details": e.erreurs}), 400
 
-        if not nom_fonction:
-            return jsonify({"erreur": "Le nom de la fonction est manquant."}), 400
+        return reponse_export(iterer_lots_rpc_avancee(plan, params), format_demande)
 
-        resultat = current_app.supabase.rpc(nom_fonction, filtres).execute()
+    except Exception as e:
+        return jsonify({"erreur": str(e)}), 500
 
-        if not isinstance(resultat.data, list):
-            return jsonify({"erreur": "Le résultat de la requête n'est pas valide."}), 500
+# =======================================================
+# Routes du mode démonstration (données locales, sans Supabase)
+# =======================================================
 
-        df_resultats = pd.DataFrame(resultat.data)
-        return generer_et_envoyer_fichier(df_resultats, format_demande)
+@main.route('/demo/<type_transaction>', methods=['GET', 'POST'])
+@login_required
+def demo_donnees(type_transaction):
+    """
+    Retourne les données de démonstration filtrées côté serveur.
+    Accepte le même corps que /api/query ({filtres, format}) ; sans corps, toutes les lignes sont renvoyées.
+    """
+    if type_transaction not in ['ventes', 'achats']:
+        abort(404)
+    charge_utile = request.get_json(silent=True) or {}
+    try:
+        _, params = preparer_appel_rpc(type_transaction, charge_utile.get('filtres', {}))
+        lots = current_app.demo.iterer_lots(type_transaction, params, TAILLE_LOT_EXPORT)
+    except ValueError as e:
+        return jsonify({"erreur": f"Filtres invalides : {e}"}), 400
+    except FileNotFoundError:
+        return jsonify({"erreur": "Fichier de démo non trouvé."}), 404
 
+    format_reponse = (charge_utile.get('format') or 'json').lower()
+    if format_reponse in FORMATS_COLONNES:
+        return reponse_export(lots, format_reponse, en_piece_jointe=False)
+    flux = flux_json_colonnes(lots) if format_reponse == 'colonnes' else flux_json_lignes(lots)
+    return reponse_json(flux, request.headers.get('Accept-Encoding'))
+
+
+@main.route('/demo/<type_transaction>/download', methods=['POST'])
+@login_required
+def demo_telecharger_donnees(type_transaction):
+    """Génère un fichier (CSV/XLSX/Arrow/Parquet) des données de démonstration filtrées."""
+    if type_transaction not in ['ventes', 'achats']:
+        abort(404)
+    try:
+        charge_utile = request.get_json() or {}
+        _, params = preparer_appel_rpc(type_transaction, charge_utile.get('filtres', {}))
+        format_demande = charge_utile.get('format', 'csv').lower()
+        return reponse_export(current_app.demo.iterer_lots(type_transaction, params, TAILLE_LOT_EXPORT),
+                              format_demande)
     except Exception as e:
-        return jsonify({"erreur": str(e)}), 500
+        return jsonify({"erreur": f"Erreur lors de la génération du fichier de démo : {str(e)}"}), 500
+
+# =======================================================
+# Routes API des exports asynchrones
+# =======================================================
+
+@main.route('/api/<type_transaction>/export', methods=['POST'])
+@login_required
+def creer_export_donnees(type_transaction):
+    """Met en file un export (CSV/XLSX) des données filtrées et retourne l'identifiant de la tâche."""
+    if type_transaction not in ['ventes', 'achats']:
+        abort(404)
+    charge_utile = request.get_json() or {}
+    filtres = charge_utile.get('filtres', {})
+    format_demande = charge_utile.get('format', 'csv').lower()
+
+    def fabrique_lots(tache):
+        def renseigner_total(total):
+            tache.lignes_totales = total
+        return iterer_lots_rpc(type_transaction, filtres, sur_total=renseigner_total)
+
+    try:
+        tache = current_app.exports.soumettre(current_app._get_current_object(), current_user.get_id(),
+                                              format_demande, fabrique_lots)
+    except AdmissionRefusee as e:
+        return reponse_refus(e)
+    return jsonify(tache.en_dict()), 202
+
+
+@main.route('/api/requete-avancee/export', methods=['POST'])
+@login_required
+def creer_export_requete_avancee():
+    """Met en file l'export des résultats d'une requête avancée."""
+    charge = request.get_json() or {}
+    format_demande = charge.get("format", "csv").lower()
+    try:
+        plan, params = plan_depuis_charge(charge)
+    except ErreurParametres as e:
+        return jsonify({"erreur": str(e), "details": e.erreurs}), 400
+
+    try:
+        tache = current_app.exports.soumettre(current_app._get_current_object(), current_user.get_id(),
+                                              format_demande, lambda tache: iterer_lots_rpc_avancee(plan, params))
+    except AdmissionRefusee as e:
+        return reponse_refus(e)
+    return jsonify(tache.en_dict()), 202
+
+
+@main.route('/api/exports/<id_tache>', methods=['GET'])
+@login_required
+def statut_export(id_tache):
+    """Retourne l'état d'une tâche d'export (statut, lignes traitées, pourcentage)."""
+    tache = current_app.exports.obtenir(id_tache, current_user.get_id())
+    if tache is None:
+        return jsonify({"erreur": "Tâche d'export introuvable ou expirée."}), 404
+    return jsonify(tache.en_dict())
+
+
+@main.route('/api/exports/<id_tache>/fichier', methods=['GET'])
+@login_required
+def telecharger_export(id_tache):
+    """Télécharge le fichier produit par une tâche d'export terminée."""
+    tache = current_app.exports.obtenir(id_tache, current_user.get_id())
+    if tache is None:
+        return jsonify({"erreur": "Tâche d'export introuvable ou expirée."}), 404
+    if tache.statut != TERMINEE:
+        return jsonify({"erreur": "L'export n'est pas encore terminé."}), 409
+    return send_file(tache.chemin_fichier, mimetype=tache.mimetype, as_attachment=True,
+                     download_name=tache.nom_fichier)
+
 
 # =======================================================
 # Gestionnaires d'Erreurs pour ce Blueprint
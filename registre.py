@@ -0,0 +1,319 @@
+# registre.py
+"""
+Ce fichier centralise le chargement des fichiers de configuration JSON de l'application :
+- data/guides.json (documentation) ;
+- static/data_demo/<type>_requetes_avancees.json (catalogue des requêtes avancées).
+
+Chaque requête avancée du catalogue est compilée en un PlanRequete : schéma typé de ses paramètres
+(champs_filtrables : type, obligatoire, longueur_max), fenêtre de dates par défaut (fenetre_defaut_mois),
+mise en cache (cache) et nombre maximal de lignes affichées (lignes_max). Les paramètres reçus d'un
+formulaire ou d'un appel API sont validés et convertis localement, avant tout appel RPC.
+
+Chaque fichier n'est lu et analysé qu'une seule fois, puis gardé en mémoire.
+Il n'est rechargé que si sa date de modification (mtime) change, ou après une invalidation explicite.
+Les objets retournés sont partagés : ils doivent être considérés en lecture seule.
+"""
+import json
+import os
+import threading
+from datetime import date
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+TYPES_TRANSACTION = ('ventes', 'achats')
+
+# Paramètres de période communs à toutes les requêtes avancées (bornes : [début, fin[).
+PARAMETRES_PERIODE = {'p_date_debut': 'Date de début', 'p_date_fin': 'Date de fin'}
+DATE_DEBUT_DEFAUT = date(1900, 1, 1)
+ANNEE_MIN, ANNEE_MAX = 1900, 2100
+LONGUEUR_TEXTE_DEFAUT = 100
+
+
+class FichierJson:
+    """Contenu d'un fichier JSON, relu uniquement quand le fichier a changé sur le disque."""
+
+    def __init__(self, chemin: str, indexeur=None):
+        self.chemin = chemin
+        # Fonction optionnelle qui construit un index à partir du contenu chargé.
+        self.indexeur = indexeur
+        self._mtime = None
+        self._contenu = None
+        self._index = None
+        self._verrou = threading.Lock()
+
+    def _charger_si_necessaire(self):
+        # Lève FileNotFoundError si le fichier n'existe pas, comme un open() classique.
+        mtime = os.stat(self.chemin).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with self._verrou:
+            if mtime == self._mtime:
+                return
+            with open(self.chemin, 'r', encoding='utf-8') as f:
+                contenu = json.load(f)
+            self._index = self.indexeur(contenu) if self.indexeur else None
+            self._contenu = contenu
+            self._mtime = mtime
+
+    def contenu(self):
+        self._charger_si_necessaire()
+        return self._contenu
+
+    def index(self):
+        self._charger_si_necessaire()
+        return self._index
+
+    def invalider(self):
+        with self._verrou:
+            self._mtime = None
+
+
+# =======================================================
+# Schémas des paramètres et plans des requêtes avancées
+# =======================================================
+
+class ErreurParametres(ValueError):
+    """Paramètres refusés par le schéma d'une requête ; 'erreurs' associe chaque paramètre à son message."""
+
+    def __init__(self, erreurs: dict):
+        self.erreurs = erreurs
+        super().__init__(' '.join(erreurs.values()))
+
+
+def _convertir_texte(valeur, champ: dict) -> str:
+    if isinstance(valeur, (dict, list, bool)) or valeur is None:
+        raise ValueError("texte attendu")
+    texte = str(valeur).strip()
+    longueur_max = champ.get('longueur_max', LONGUEUR_TEXTE_DEFAUT)
+    if len(texte) > longueur_max:
+        raise ValueError(f"{longueur_max} caractères au maximum")
+    return texte
+
+
+def _convertir_entier(valeur, champ: dict) -> int:
+    if isinstance(valeur, bool):
+        raise ValueError("nombre entier attendu")
+    try:
+        nombre = float(str(valeur).strip().replace(',', '.'))
+    except (TypeError, ValueError):
+        raise ValueError("nombre entier attendu")
+    if not nombre.is_integer():
+        raise ValueError("nombre entier attendu")
+    return int(nombre)
+
+
+def _convertir_decimal(valeur, champ: dict) -> float:
+    if isinstance(valeur, bool):
+        raise ValueError("nombre attendu")
+    try:
+        return float(str(valeur).strip().replace(',', '.'))
+    except (TypeError, ValueError):
+        raise ValueError("nombre attendu")
+
+
+def _convertir_date(valeur, champ: dict) -> str:
+    try:
+        jour = date.fromisoformat(str(valeur).strip()[:10])
+    except ValueError:
+        raise ValueError("date au format AAAA-MM-JJ attendue")
+    if not ANNEE_MIN <= jour.year <= ANNEE_MAX + 1:
+        raise ValueError(f"année comprise entre {ANNEE_MIN} et {ANNEE_MAX} attendue")
+    return jour.isoformat()
+
+
+# Types de paramètres déclarables dans champs_filtrables ("type"), avec leur fonction de conversion.
+TYPES_PARAMETRES = {
+    'texte': _convertir_texte,
+    'entier': _convertir_entier,
+    'decimal': _convertir_decimal,
+    'date': _convertir_date,
+}
+
+
+def _ajouter_mois(jour: date, mois: int) -> date:
+    """Premier jour du mois situé 'mois' mois après (ou avant, si négatif) celui de 'jour'."""
+    indice = jour.year * 12 + jour.month - 1 + mois
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def _lire_annee_mois(formulaire, cle_annee: str, cle_mois: str, mois_defaut: int, erreurs: dict):
+    """Lit un couple (année, mois) du formulaire ; (None, None) si l'année est vide."""
+    annee, mois = (formulaire.get(cle_annee) or '').strip(), (formulaire.get(cle_mois) or '').strip()
+    if not annee:
+        return None, None
+    try:
+        annee, mois = int(annee), int(mois or mois_defaut)
+    except ValueError:
+        erreurs[cle_annee] = "La période doit être composée d'années et de mois numériques."
+        return None, None
+    if not ANNEE_MIN <= annee <= ANNEE_MAX or not 1 <= mois <= 12:
+        erreurs[cle_annee] = f"La période doit être comprise entre {ANNEE_MIN} et {ANNEE_MAX} (mois de 1 à 12)."
+        return None, None
+    return annee, mois
+
+
+class PlanRequete:
+    """
+    Requête avancée du catalogue, compilée une fois au chargement du fichier JSON.
+    Lève ValueError à la construction si l'entrée du catalogue est incohérente.
+    """
+
+    def __init__(self, type_transaction: str, requete: dict):
+        self.type_transaction = type_transaction
+        self.id = requete['id']
+        self.nom_fonction = requete.get('nom_fonction')
+        if not self.nom_fonction:
+            raise ValueError(f"Requête avancée '{self.id}' : 'nom_fonction' est manquant.")
+        self.fenetre_defaut_mois = requete.get('fenetre_defaut_mois')
+        self.cacheable = bool(requete.get('cache', True))
+        self.lignes_max = requete.get('lignes_max')
+        for cle in ('fenetre_defaut_mois', 'lignes_max'):
+            valeur = getattr(self, cle)
+            if valeur is not None and (not isinstance(valeur, int) or valeur <= 0):
+                raise ValueError(f"Requête avancée '{self.id}' : '{cle}' doit être un entier positif.")
+        self.parametres = {}
+        for champ in requete.get('champs_filtrables', []):
+            type_champ = champ.get('type', 'texte')
+            if type_champ not in TYPES_PARAMETRES:
+                raise ValueError(f"Requête avancée '{self.id}' : type de paramètre inconnu '{type_champ}'.")
+            if champ['valeur'] in PARAMETRES_PERIODE:
+                raise ValueError(f"Requête avancée '{self.id}' : '{champ['valeur']}' est réservé à la période.")
+            self.parametres[champ['valeur']] = {**champ, 'type': type_champ}
+
+    def periode_formulaire(self, formulaire, erreurs: dict) -> dict:
+        """
+        Traduit la période du formulaire (start_year, start_month, end_year, end_month) en dates [début, fin[.
+        Une année sans mois couvre l'année entière. Les bornes absentes sont complétées par valider() :
+        fin par défaut, le mois en cours inclus ; début par défaut : 'fenetre_defaut_mois' mois avant la fin,
+        ou le 1er janvier 1900 si la requête ne déclare pas de fenêtre.
+        """
+        annee_debut, mois_debut = _lire_annee_mois(formulaire, 'start_year', 'start_month', 1, erreurs)
+        annee_fin, mois_fin = _lire_annee_mois(formulaire, 'end_year', 'end_month', 12, erreurs)
+        periode = {}
+        if annee_debut is not None:
+            periode['p_date_debut'] = date(annee_debut, mois_debut, 1).isoformat()
+        if annee_fin is not None:
+            periode['p_date_fin'] = _ajouter_mois(date(annee_fin, mois_fin, 1), 1).isoformat()
+        return periode
+
+    def valider(self, params: dict) -> dict:
+        """
+        Vérifie et convertit les paramètres d'un appel (nom du paramètre SQL -> valeur) selon le schéma :
+        paramètres inconnus refusés, valeurs vides ignorées, paramètres obligatoires exigés,
+        période complétée par les bornes par défaut. Retourne les paramètres prêts pour la RPC.
+        Lève ErreurParametres.
+        """
+        if not isinstance(params, dict):
+            raise ErreurParametres({'filtres': "Les filtres doivent être un objet JSON."})
+        erreurs = {}
+        resultat = {}
+        for nom, valeur in params.items():
+            if valeur is None or (isinstance(valeur, str) and not valeur.strip()):
+                continue
+            if nom in PARAMETRES_PERIODE:
+                champ, convertir = {'texte': PARAMETRES_PERIODE[nom]}, _convertir_date
+            elif nom in self.parametres:
+                champ = self.parametres[nom]
+                convertir = TYPES_PARAMETRES[champ['type']]
+            else:
+                erreurs[nom] = f"Paramètre inconnu pour la requête '{self.nom_fonction}' : '{nom}'."
+                continue
+            try:
+                resultat[nom] = convertir(valeur, champ)
+            except ValueError as e:
+                erreurs[nom] = f"{champ.get('texte', nom)} : {e}."
+        for nom, champ in self.parametres.items():
+            if champ.get('obligatoire') and nom not in resultat and nom not in erreurs:
+                erreurs[nom] = f"{champ.get('texte', nom)} : valeur obligatoire."
+        if erreurs:
+            raise ErreurParametres(erreurs)
+
+        if 'p_date_fin' not in resultat:
+            resultat['p_date_fin'] = _ajouter_mois(date.today(), 1).isoformat()
+        if 'p_date_debut' not in resultat:
+            debut = (_ajouter_mois(date.fromisoformat(resultat['p_date_fin']), -self.fenetre_defaut_mois)
+                     if self.fenetre_defaut_mois else DATE_DEBUT_DEFAUT)
+            resultat['p_date_debut'] = debut.isoformat()
+        if resultat['p_date_debut'] >= resultat['p_date_fin']:
+            raise ErreurParametres({'p_date_debut': "La date de début doit précéder la date de fin."})
+        return resultat
+
+    def depuis_formulaire(self, formulaire) -> dict:
+        """
+        Construit et valide les paramètres à partir du formulaire des filtres avancés
+        (période + listes 'field[]' / 'value[]'). Lève ErreurParametres.
+        """
+        erreurs = {}
+        params = self.periode_formulaire(formulaire, erreurs)
+        for nom, valeur in zip(formulaire.getlist('field[]'), formulaire.getlist('value[]')):
+            valeur = valeur.strip()
+            if not nom or not valeur:
+                continue
+            if nom in PARAMETRES_PERIODE:
+                erreurs[nom] = f"Paramètre inconnu pour la requête '{self.nom_fonction}' : '{nom}'."
+            elif params.get(nom, valeur) != valeur:
+                texte = self.parametres.get(nom, {}).get('texte', nom)
+                erreurs[nom] = f"{texte} : plusieurs valeurs différentes ont été saisies."
+            else:
+                params[nom] = valeur
+        if erreurs:
+            raise ErreurParametres(erreurs)
+        return self.valider(params)
+
+
+def _indexer_requetes(type_transaction: str):
+    def indexer(requetes: list) -> dict:
+        return {
+            'par_id': {requete["id"]: requete for requete in requetes},
+            'plans': {requete["nom_fonction"]: PlanRequete(type_transaction, requete)
+                      for requete in requetes if requete.get("type", "rpc") == "rpc"},
+        }
+    return indexer
+
+
+class RegistreConfiguration:
+    """Point d'accès unique aux fichiers de configuration JSON."""
+
+    def __init__(self, dossier_racine: str):
+        self._guides = FichierJson(os.path.join(dossier_racine, 'data', 'guides.json'))
+        self._requetes_avancees = {
+            type_transaction: FichierJson(
+                os.path.join(dossier_racine, 'static', 'data_demo', f'{type_transaction}_requetes_avancees.json'),
+                indexeur=_indexer_requetes(type_transaction),
+            )
+            for type_transaction in TYPES_TRANSACTION
+        }
+
+    def guides(self) -> dict:
+        return self._guides.contenu()
+
+    def requetes_avancees(self, type_transaction: str) -> list:
+        """Liste des requêtes avancées d'un type. Lève FileNotFoundError pour un type inconnu."""
+        return self._fichier_requetes(type_transaction).contenu()
+
+    def requete_avancee(self, type_transaction: str, id_requete: str):
+        """Retourne la requête avancée (type, id) ou None. Lève FileNotFoundError pour un type inconnu."""
+        return self._fichier_requetes(type_transaction).index()['par_id'].get(id_requete)
+
+    def plan_requete(self, nom_fonction: str):
+        """Retourne le PlanRequete de la RPC 'nom_fonction', tous catalogues confondus, ou None."""
+        for fichier in self._requetes_avancees.values():
+            plan = fichier.index()['plans'].get(nom_fonction)
+            if plan is not None:
+                return plan
+        return None
+
+    def invalider(self):
+        """Force le rechargement de tous les fichiers à la prochaine lecture."""
+        self._guides.invalider()
+        for fichier in self._requetes_avancees.values():
+            fichier.invalider()
+
+    def _fichier_requetes(self, type_transaction: str) -> FichierJson:
+        fichier = self._requetes_avancees.get(type_transaction)
+        if fichier is None:
+            raise FileNotFoundError(f"Aucun catalogue de requêtes avancées pour '{type_transaction}'.")
+        return fichier
+
+
+registre = RegistreConfiguration(basedir)
@@ -0,0 +1,300 @@
+# segments.py
+"""
+Ce fichier contient le cache des segments mensuels de l'historique des ventes / achats.
+Un segment est le résultat de la RPC de recherche pour un mois donné et un jeu de filtres donné,
+stocké sur le disque local dans un fichier Parquet compressé (zstd) :
+
+    <SEGMENTS_DOSSIER>/<type>/<erp>/<AAAA-MM>/<signature des filtres>.parquet
+
+Les mois clos ne changent plus : leurs segments sont gardés indéfiniment. Les SEGMENTS_MOIS_OUVERTS
+derniers mois (le mois en cours par défaut) sont relus dès que leur segment a plus de
+SEGMENTS_TTL_MOIS_OUVERT secondes. Une correction rétroactive se traite par une invalidation
+(/admin/api/segments), par type, ERP et/ou mois.
+
+Les segments sont utilisés par la lecture partitionnée des recherches (iterer_recherche, main_routes.py),
+pour les pages comme pour les flux et les exports : une tranche de période dont tous les mois sont en segments
+valides est lue localement, triée et positionnée comme le ferait la RPC (valeurs vides en dernier), sans appel RPC.
+Une tranche lue en entier depuis son début (au plus LIGNES_MAX_PERIODE lignes) est enregistrée.
+Le dossier est plafonné à SEGMENTS_TAILLE_MAX octets : au-delà, les segments les moins récemment lus
+sont supprimés.
+pyarrow est nécessaire ; sans lui, le cache des segments est désactivé.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import date
+
+# pyarrow est optionnel (comme pour les exports Arrow / Parquet).
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+journal = logging.getLogger(__name__)
+
+PARAMETRES_PERIODE = ('p_date_debut', 'p_date_fin')
+# Dossier des segments dont les filtres ne précisent pas d'ERP.
+ERP_TOUS = 'tous'
+# Une période plus longue (ex : l'historique ancien regroupé en une seule tranche) n'est pas découpée en segments.
+MOIS_MAX_PERIODE = 24
+# Une tranche plus volumineuse n'est pas gardée en mémoire pour être enregistrée.
+LIGNES_MAX_PERIODE = 100000
+# Intervalle minimal (en secondes) entre deux mesures de la taille du dossier.
+INTERVALLE_CONTROLE_TAILLE = 60
+
+
+def mois_de_la_periode(date_debut: str, date_fin: str):
+    """
+    Liste des mois (AAAA-MM) couverts par [date_debut, date_fin[, ou None si la période
+    ne commence pas et ne finit pas sur un premier du mois.
+    """
+    debut, fin = date.fromisoformat(date_debut), date.fromisoformat(date_fin)
+    if debut.day != 1 or fin.day != 1 or debut >= fin:
+        return None
+    mois = []
+    indice, indice_fin = debut.year * 12 + debut.month - 1, fin.year * 12 + fin.month - 1
+    while indice < indice_fin:
+        mois.append(f'{indice // 12:04d}-{indice % 12 + 1:02d}')
+        indice += 1
+    return mois
+
+
+def ordonner(lignes: list, tri: list) -> list:
+    """
+    Trie les lignes selon 'tri' ([(colonne, descendant), ...]) comme la RPC : les valeurs vides en dernier
+    dans les deux sens. Les tris successifs (stables) partent de la colonne la moins significative.
+    """
+    for colonne, descendant in reversed(tri):
+        vides = [ligne for ligne in lignes if ligne.get(colonne) is None]
+        lignes = sorted((ligne for ligne in lignes if ligne.get(colonne) is not None),
+                        key=lambda ligne: ligne[colonne], reverse=descendant) + vides
+    return lignes
+
+
+def _comparer(valeur, reference, descendant: bool) -> int:
+    """Position de 'valeur' par rapport à 'reference' dans l'ordre du tri (-1, 0, 1), valeurs vides en dernier."""
+    if valeur is None or reference is None:
+        return (valeur is None) - (reference is None)
+    if valeur == reference:
+        return 0
+    return 1 if (valeur > reference) != descendant else -1
+
+
+def lignes_apres(lignes: list, colonnes: tuple, position: list, descendant: bool) -> list:
+    """
+    Lignes (déjà ordonnées) situées après 'position' ([date, document, lignes lues]) : mêmes règles que le
+    paramètre 'apres' et le décalage de SourceDonnees.appeler_rpc.
+    """
+    if not position:
+        return lignes
+    colonne_date, colonne_document = colonnes
+    suivantes = []
+    for ligne in lignes:
+        ecart = _comparer(ligne.get(colonne_date), position[0], descendant)
+        if ecart > 0 or (ecart == 0 and _comparer(ligne.get(colonne_document), position[1], descendant) >= 0):
+            suivantes.append(ligne)
+    return suivantes[position[2]:]
+
+
+class SegmentsMensuels:
+    """Segments mensuels du résultat des RPC de recherche, en fichiers Parquet sur le disque local."""
+
+    def __init__(self, dossier: str, mois_ouverts: int = 1, ttl_mois_ouvert: int = 300, taille_max: int = 0):
+        self.dossier = dossier
+        self.mois_ouverts = mois_ouverts
+        self.ttl_mois_ouvert = ttl_mois_ouvert
+        # Budget du dossier en octets (0 = sans limite) et taille estimée depuis la dernière mesure.
+        self.taille_max = taille_max
+        self._verrou = threading.Lock()
+        self._octets = None
+        self._dernier_controle = 0.0
+        self._evinces = 0
+        os.makedirs(dossier, exist_ok=True)
+
+    # --- Clés et chemins ---
+
+    @staticmethod
+    def signature(nom_rpc: str, params: dict) -> str:
+        """Signature des filtres (hors période) : deux lectures aux mêmes filtres partagent leurs segments."""
+        filtres = {cle: valeur for cle, valeur in params.items() if cle not in PARAMETRES_PERIODE}
+        canonique = json.dumps([nom_rpc, filtres], sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonique.encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def dossier_erp(params: dict) -> str:
+        erp = str(params.get('p_erp') or '')
+        if erp.startswith('egal:'):
+            erp = erp[len('egal:'):]
+        return re.sub(r'[^A-Za-z0-9_-]', '_', erp) or ERP_TOUS
+
+    def chemin(self, type_transaction: str, nom_rpc: str, params: dict, mois: str) -> str:
+        return os.path.join(self.dossier, type_transaction, self.dossier_erp(params), mois,
+                            f'{self.signature(nom_rpc, params)}.parquet')
+
+    def est_clos(self, mois: str) -> bool:
+        """Un mois est clos s'il précède les 'mois_ouverts' derniers mois (mois en cours compris)."""
+        aujourdhui = date.today()
+        indice = aujourdhui.year * 12 + aujourdhui.month - 1 - (self.mois_ouverts - 1)
+        return mois < f'{indice // 12:04d}-{indice % 12 + 1:02d}'
+
+    def _valide(self, chemin: str, mois: str) -> bool:
+        try:
+            age = time.time() - os.stat(chemin).st_mtime
+        except FileNotFoundError:
+            return False
+        return self.est_clos(mois) or age <= self.ttl_mois_ouvert
+
+    # --- Lecture / écriture ---
+
+    def lire(self, type_transaction: str, nom_rpc: str, params: dict):
+        """
+        Retourne les lignes de la RPC sur la période de 'params' (dans l'ordre des mois, non triées)
+        si tous ses mois sont en segments valides, sinon None. Une période qui n'est pas alignée sur
+        des mois entiers, ou trop longue, n'utilise pas les segments.
+        """
+        mois = mois_de_la_periode(params['p_date_debut'], params['p_date_fin'])
+        if not mois or len(mois) > MOIS_MAX_PERIODE:
+            return None
+        chemins = [(self.chemin(type_transaction, nom_rpc, params, m), m) for m in mois]
+        if not all(self._valide(chemin, m) for chemin, m in chemins):
+            return None
+        try:
+            lignes = []
+            for chemin, _ in chemins:
+                lignes.extend(pq.read_table(chemin).to_pylist())
+                # Date du dernier accès (l'heure de modification, qui date le segment, est conservée) : éviction LRU.
+                os.utime(chemin, (time.time(), os.stat(chemin).st_mtime))
+            return lignes
+        except Exception as e:
+            journal.warning("Segment illisible (%s) : la période est relue depuis la source.", e)
+            return None
+
+    def enregistrer(self, type_transaction: str, nom_rpc: str, params: dict, colonne_date: str, lignes: list):
+        """
+        Enregistre le résultat complet de la RPC sur la période de 'params' : les lignes sont réparties
+        par mois (selon 'colonne_date') et chaque mois est écrit dans son segment.
+        """
+        mois = mois_de_la_periode(params['p_date_debut'], params['p_date_fin'])
+        if not mois or len(mois) > MOIS_MAX_PERIODE:
+            return
+        par_mois = {m: [] for m in mois}
+        for ligne in lignes:
+            m = str(ligne.get(colonne_date) or '')[:7]
+            if m in par_mois:
+                par_mois[m].append(ligne)
+        ecrits = sum(self._ecrire(self.chemin(type_transaction, nom_rpc, params, m), lignes_mois)
+                     for m, lignes_mois in par_mois.items())
+        self._controler_taille(ecrits)
+
+    def _ecrire(self, chemin: str, lignes: list) -> int:
+        """Écrit un segment et retourne sa taille en octets (0 s'il n'a pas pu être enregistré)."""
+        # Écriture dans un fichier temporaire puis renommage : un lecteur ne voit jamais un segment à moitié écrit.
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        descripteur, temporaire = tempfile.mkstemp(suffix='.parquet', dir=os.path.dirname(chemin))
+        os.close(descripteur)
+        try:
+            table = pa.Table.from_pylist(lignes) if lignes else pa.table({})
+            pq.write_table(table, temporaire, compression='zstd')
+            os.replace(temporaire, chemin)
+            return os.path.getsize(chemin)
+        except Exception as e:
+            # Colonne de types mélangés, disque plein... : le segment n'est simplement pas gardé.
+            journal.warning("Segment non enregistré (%s) : %s", chemin, e)
+            if os.path.exists(temporaire):
+                os.remove(temporaire)
+            return 0
+
+    def _controler_taille(self, ecrits: int):
+        """
+        Tient le dossier sous 'taille_max' octets. La taille est mesurée au plus toutes les
+        INTERVALLE_CONTROLE_TAILLE secondes (d'autres processus peuvent écrire dans le dossier) et estimée
+        entre deux mesures ; au-delà du budget, les segments les moins récemment lus sont supprimés
+        jusqu'à revenir à 90 % du budget.
+        """
+        if self.taille_max <= 0:
+            return
+        with self._verrou:
+            if self._octets is not None:
+                self._octets += ecrits
+            maintenant = time.monotonic()
+            if (self._octets is not None and self._octets <= self.taille_max
+                    and maintenant - self._dernier_controle < INTERVALLE_CONTROLE_TAILLE):
+                return
+            self._dernier_controle = maintenant
+            fichiers = []
+            for chemin in glob.glob(os.path.join(self.dossier, '*', '*', '*', '*.parquet')):
+                try:
+                    etat = os.stat(chemin)
+                except FileNotFoundError:
+                    continue
+                fichiers.append((etat.st_atime, etat.st_size, chemin))
+            total = sum(taille for _, taille, _ in fichiers)
+            if total > self.taille_max:
+                for _, taille, chemin in sorted(fichiers):
+                    if total <= self.taille_max * 0.9:
+                        break
+                    try:
+                        os.remove(chemin)
+                        self._evinces += 1
+                    except FileNotFoundError:
+                        pass
+                    total -= taille
+            self._octets = total
+
+    # --- Administration ---
+
+    def invalider(self, type_transaction: str = None, erp: str = None, mois: str = None, depuis: str = None) -> int:
+        """
+        Supprime les segments correspondant aux critères (tous par défaut) : type, ERP, mois précis (AAAA-MM)
+        ou tous les mois à partir de 'depuis' (AAAA-MM). Retourne le nombre de segments supprimés.
+        """
+        motif = os.path.join(self.dossier, type_transaction or '*', self.dossier_erp({'p_erp': erp}) if erp else '*',
+                             mois or '*', '*.parquet')
+        supprimes = 0
+        for chemin in glob.glob(motif):
+            mois_segment = os.path.basename(os.path.dirname(chemin))
+            if depuis and mois_segment < depuis:
+                continue
+            try:
+                os.remove(chemin)
+                supprimes += 1
+            except FileNotFoundError:
+                pass
+        return supprimes
+
+    def stats(self) -> dict:
+        par_type = {}
+        for chemin in glob.glob(os.path.join(self.dossier, '*', '*', '*', '*.parquet')):
+            type_transaction = os.path.relpath(chemin, self.dossier).split(os.sep)[0]
+            entree = par_type.setdefault(type_transaction, {"segments": 0, "octets": 0})
+            entree["segments"] += 1
+            entree["octets"] += os.path.getsize(chemin)
+        return {
+            "actif": True,
+            "dossier": self.dossier,
+            "mois_ouverts": self.mois_ouverts,
+            "ttl_mois_ouvert": self.ttl_mois_ouvert,
+            "taille_max": self.taille_max,
+            "octets": sum(entree["octets"] for entree in par_type.values()),
+            "evinces": self._evinces,
+            "types": par_type,
+        }
+
+
+def creer_segments(config):
+    """Construit le cache des segments, ou None s'il est désactivé (SEGMENTS_DOSSIER vide) ou sans pyarrow."""
+    dossier = config.get('SEGMENTS_DOSSIER')
+    if not dossier:
+        return None
+    if pa is None:
+        journal.warning("pyarrow n'est pas installé : le cache des segments mensuels est désactivé.")
+        return None
+    return SegmentsMensuels(dossier, config.get('SEGMENTS_MOIS_OUVERTS'), config.get('SEGMENTS_TTL_MOIS_OUVERT'),
+                            config.get('SEGMENTS_TAILLE_MAX', 0))
@@ -0,0 +1,139 @@
+# serialisation.py
+"""
+Ce fichier regroupe la sérialisation JSON des résultats de requêtes et la compression des réponses.
+Les lignes renvoyées par la RPC sont encodées directement, lot par lot, sans passer par un DataFrame :
+- orientation 'lignes'   : [{"colonne": valeur, ...}, ...] (format historique de /api/query) ;
+- orientation 'colonnes' : {"colonnes": [...], "lignes": [[...], ...]} (les noms de colonnes
+  ne sont plus répétés à chaque ligne).
+orjson est utilisé s'il est installé (encodeur beaucoup plus rapide), sinon le module json standard.
+La réponse est compressée (brotli si disponible, sinon gzip) selon l'en-tête Accept-Encoding.
+"""
+import json
+import zlib
+
+from flask import Response, stream_with_context
+
+from instrumentation import mesurer, mesurer_flux
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# En dessous de cette taille, compresser coûte plus que cela ne rapporte.
+TAILLE_MIN_COMPRESSION = 1024
+
+
+def encoder_json(objet) -> bytes:
+    """Encode un objet en JSON compact (UTF-8)."""
+    if orjson is not None:
+        return orjson.dumps(objet, default=str)
+    return json.dumps(objet, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def flux_json_lignes(lots):
+    """Générateur d'un tableau JSON d'objets, encodé un lot à la fois."""
+    yield b'['
+    premier = True
+    for lot in lots:
+        if not lot:
+            continue
+        contenu = encoder_json(lot)[1:-1]  # On retire les crochets du lot
+        yield contenu if premier else b',' + contenu
+        premier = False
+    yield b']'
+
+
+def flux_json_colonnes(lots):
+    """Générateur d'un objet JSON {colonnes, lignes} où chaque ligne est un tableau de valeurs."""
+    colonnes = None
+    premier = True
+    for lot in lots:
+        if not lot:
+            continue
+        if colonnes is None:
+            colonnes = list(lot[0].keys())
+            yield b'{"colonnes":' + encoder_json(colonnes) + b',"lignes":['
+        contenu = encoder_json([[ligne.get(colonne) for colonne in colonnes] for ligne in lot])[1:-1]
+        yield contenu if premier else b',' + contenu
+        premier = False
+    if colonnes is None:
+        yield b'{"colonnes":[],"lignes":['
+    yield b']}'
+
+
+def en_colonnes(lignes: list) -> dict:
+    """Version non streamée de l'orientation 'colonnes', pour une page de résultats."""
+    colonnes = list(lignes[0].keys()) if lignes else []
+    return {"colonnes": colonnes, "lignes": [[ligne.get(colonne) for colonne in colonnes] for ligne in lignes]}
+
+
+def choisir_encodage(accept_encoding: str):
+    """Choisit la compression à appliquer d'après Accept-Encoding ('br', 'gzip' ou None)."""
+    acceptes = {}
+    for partie in (accept_encoding or '').split(','):
+        morceaux = partie.strip().split(';')
+        nom = morceaux[0].strip().lower()
+        qualite = 1.0
+        for parametre in morceaux[1:]:
+            cle, _, valeur = parametre.strip().partition('=')
+            if cle == 'q':
+                try:
+                    qualite = float(valeur)
+                except ValueError:
+                    qualite = 0.0
+        if nom:
+            acceptes[nom] = qualite
+    if brotli is not None and acceptes.get('br', 0) > 0:
+        return 'br'
+    if acceptes.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def compresser_flux(generateur, encodage: str):
+    """Compresse un générateur d'octets au fil de l'eau."""
+    if encodage == 'br':
+        compresseur = brotli.Compressor(quality=4)
+        for bloc in generateur:
+            sortie = compresseur.process(bloc)
+            if sortie:
+                yield sortie
+        yield compresseur.finish()
+    else:
+        compresseur = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 : en-tête gzip
+        for bloc in generateur:
+            sortie = compresseur.compress(bloc)
+            if sortie:
+                yield sortie
+        yield compresseur.flush()
+
+
+def reponse_json(contenu, accept_encoding: str = None, statut: int = 200) -> Response:
+    """
+    Construit une réponse JSON compressée selon Accept-Encoding.
+    'contenu' est soit un objet à encoder, soit un générateur d'octets JSON (réponse en flux).
+    """
+    en_flux = not isinstance(contenu, (dict, list))
+    if en_flux:
+        donnees = mesurer_flux(contenu, 'serialisation')
+    else:
+        with mesurer('serialisation'):
+            donnees = encoder_json(contenu)
+    encodage = choisir_encodage(accept_encoding)
+    if not en_flux and len(donnees) < TAILLE_MIN_COMPRESSION:
+        encodage = None
+
+    en_tetes = {"Vary": "Accept-Encoding"}
+    if encodage:
+        en_tetes["Content-Encoding"] = encodage
+        donnees = mesurer_flux(compresser_flux(donnees if en_flux else [donnees], encodage), 'compression')
+        en_flux = True
+
+    corps = stream_with_context(donnees) if en_flux else donnees
+    return Response(corps, status=statut, mimetype='application/json', headers=en_tetes)
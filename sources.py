@@ -0,0 +1,544 @@
+# sources.py
+"""
+Ce fichier définit les sources de données de l'application.
+Toutes les lectures passent par une interface commune (SourceDonnees), ce qui permet de
+remplacer Supabase par une base SQLite locale (développement, benchmarks, tests de charge) :
+- les RPC de recherche (rechercher_ventes / rechercher_achats) ;
+- les RPC d'agrégation des requêtes avancées (top_clients_ca, ca_par_periode, ...) ;
+- la table des comptes utilisateurs (schéma auth_users, table users).
+
+La source est choisie par la variable SOURCE_DONNEES ('supabase' par défaut, ou 'sqlite').
+Une base SQLite locale s'initialise avec :
+    python sources.py <chemin.sqlite3> [--lignes N]
+(données de static/data_demo, ou N lignes synthétiques par type de transaction).
+"""
+import argparse
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+
+from demo import COLONNES_PARAMETRES, COLONNES_TRI, PARAMETRE_QUANTITE, PREFIXE_EGALITE, generer_lignes_synthetiques
+from registre import TYPES_TRANSACTION
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+TABLE_UTILISATEURS = "users"
+# Révision d'un compte en SQLite : horodatage UTC ISO 8601 (à la milliseconde) pris par la base.
+REVISION_SQLITE = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+
+
+class SourceDonnees:
+    """
+    Interface commune des sources de données.
+
+    appeler_rpc(nom_rpc, params, tri, apres, limite, decalage, compter) exécute une RPC et retourne
+    {"data": [...], "count": total ou None} :
+    - tri      : liste de (colonne, descendant), les valeurs NULL sont toujours placées en dernier ;
+    - apres    : position de pagination ((colonne_1, valeur_1), (colonne_2, valeur_2)) ; seules les lignes
+                 strictement après valeur_1 sur colonne_1 (dans le sens du premier tri), ou égales sur
+                 colonne_1 et au même niveau ou après valeur_2 sur colonne_2, sont retournées. Comme les NULL
+                 sont triés en dernier, une valeur NULL est après toutes les autres : une position NULL ne
+                 laisse passer que les lignes NULL sur cette colonne ;
+    - limite / decalage : nombre maximal de lignes et nombre de lignes à sauter ;
+    - compter  : calcule le nombre total de lignes correspondant aux filtres.
+    """
+
+    def appeler_rpc(self, nom_rpc: str, params: dict, tri=None, apres=None, limite=None, decalage=0,
+                    compter=False) -> dict:
+        raise NotImplementedError
+
+    # --- Table des utilisateurs ---
+
+    def trouver_utilisateur(self, colonne: str, valeur):
+        """Retourne l'utilisateur dont 'colonne' vaut 'valeur', ou None."""
+        raise NotImplementedError
+
+    def lister_utilisateurs(self, colonnes: str = "*", **egalites) -> list:
+        """Liste les utilisateurs (administrateurs d'abord, puis par e-mail), filtrés par égalités."""
+        raise NotImplementedError
+
+    def enregistrer_utilisateur(self, donnees: dict):
+        """Insère l'utilisateur, ou met à jour les colonnes fournies s'il existe déjà (upsert sur l'e-mail)."""
+        raise NotImplementedError
+
+    def modifier_utilisateur(self, email: str, champs: dict):
+        raise NotImplementedError
+
+    def supprimer_utilisateur(self, email: str):
+        raise NotImplementedError
+
+    def lister_utilisateurs_modifies(self, depuis: str) -> list:
+        """
+        Liste les utilisateurs dont la colonne 'updated_at' est postérieure à la révision 'depuis'.
+        'updated_at' est attribuée par la base à chaque écriture : les données écrites n'en contiennent pas.
+        """
+        raise NotImplementedError
+
+    def synchroniser_utilisateurs(self, a_enregistrer: list, a_supprimer: list):
+        """
+        Applique en bloc une synchronisation de la table des comptes : upsert de tous les comptes
+        de 'a_enregistrer' (dictionnaires complets), puis suppression des e-mails de 'a_supprimer'.
+        """
+        raise NotImplementedError
+
+
+# =======================================================
+# Source Supabase (PostgREST)
+# =======================================================
+
+def _valeur_postgrest(valeur) -> str:
+    """Protège une valeur pour l'utiliser dans un filtre 'or' de PostgREST."""
+    texte = str(valeur).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{texte}"'
+
+
+class SourceSupabase(SourceDonnees):
+    """
+    Source de données Supabase. 'client_rpc' (schéma public) exécute les RPC,
+    'client_utilisateurs' (schéma auth_users) accède à la table des comptes.
+    """
+
+    def __init__(self, client_rpc=None, client_utilisateurs=None):
+        self.client_rpc = client_rpc
+        self.client_utilisateurs = client_utilisateurs
+
+    def appeler_rpc(self, nom_rpc, params, tri=None, apres=None, limite=None, decalage=0, compter=False):
+        if self.client_rpc is None:
+            raise ConnectionError("La connexion à Supabase n'est pas configurée.")
+        requete = self.client_rpc.rpc(nom_rpc, params, count='exact' if compter else None)
+        for colonne, descendant in tri or []:
+            requete = requete.order(f'"{colonne}"', desc=descendant, nullsfirst=False)
+        if apres:
+            (colonne_1, valeur_1), (colonne_2, valeur_2) = apres
+            descendant = bool(tri and tri[0][1])
+            operateur = 'lt' if descendant else 'gt'
+            operateur_inclusif = 'lte' if descendant else 'gte'
+            # Les NULL étant triés en dernier, ils sont « après » toute valeur : branche 'is.null' explicite.
+            if valeur_2 is None:
+                suite = f'"{colonne_2}".is.null'
+            else:
+                suite = f'or("{colonne_2}".{operateur_inclusif}.{_valeur_postgrest(valeur_2)},"{colonne_2}".is.null)'
+            if valeur_1 is None:
+                requete = requete.or_(f'and("{colonne_1}".is.null,{suite})')
+            else:
+                valeur_1 = _valeur_postgrest(valeur_1)
+                requete = requete.or_(
+                    f'"{colonne_1}".{operateur}.{valeur_1},"{colonne_1}".is.null,'
+                    f'and("{colonne_1}".eq.{valeur_1},{suite})'
+                )
+        if decalage:
+            requete = requete.offset(decalage)
+        if limite is not None:
+            requete = requete.limit(limite)
+        reponse = requete.execute()
+        return {"data": reponse.data, "count": reponse.count}
+
+    def _table(self):
+        if self.client_utilisateurs is None:
+            raise ConnectionError("La connexion à Supabase n'est pas configurée.")
+        return self.client_utilisateurs.table(TABLE_UTILISATEURS)
+
+    def trouver_utilisateur(self, colonne, valeur):
+        response = self._table().select("*").eq(colonne, valeur).execute()
+        return response.data[0] if response.data else None
+
+    def lister_utilisateurs(self, colonnes="*", **egalites):
+        requete = self._table().select(colonnes)
+        for colonne, valeur in egalites.items():
+            requete = requete.eq(colonne, valeur)
+        if colonnes == "*":
+            requete = requete.order("role", desc=True).order("email")
+        return requete.execute().data or []
+
+    def enregistrer_utilisateur(self, donnees):
+        self._table().upsert(donnees).execute()
+
+    def modifier_utilisateur(self, email, champs):
+        self._table().update(champs).eq("email", email).execute()
+
+    def supprimer_utilisateur(self, email):
+        self._table().delete().eq("email", email).execute()
+
+    def lister_utilisateurs_modifies(self, depuis):
+        return self._table().select("*").gt("updated_at", depuis).order("updated_at").execute().data or []
+
+    def synchroniser_utilisateurs(self, a_enregistrer, a_supprimer):
+        # Deux requêtes au total, quel que soit le nombre de comptes. PostgREST insère un lot avec
+        # l'union des colonnes de ses lignes : une colonne absente d'une ligne y deviendrait NULL,
+        # on la complète donc avec la valeur par défaut de la table.
+        # L'upsert passe en premier : un échec de la suppression ne fait perdre aucune modification.
+        if a_enregistrer:
+            colonnes = set().union(*a_enregistrer)
+            lot = [{colonne: ligne.get(colonne, VALEURS_DEFAUT_UTILISATEUR.get(colonne)) for colonne in colonnes}
+                   for ligne in a_enregistrer]
+            self._table().upsert(lot).execute()
+        if a_supprimer:
+            self._table().delete().in_("email", list(a_supprimer)).execute()
+
+
+# =======================================================
+# Source SQLite locale (équivalent SQL des RPC Supabase)
+# =======================================================
+
+# Colonnes des tables de transactions (mêmes noms que les colonnes renvoyées par les RPC).
+COLONNES_TRANSACTIONS = {
+    'ventes': {
+        'code article': 'TEXT', 'Désignation': 'TEXT', 'Qté fact': 'REAL', 'Prix Unitaire': 'REAL',
+        'Tot HT': 'REAL', 'Code client': 'TEXT', 'Raison sociale': 'TEXT', 'Date BL': 'TEXT',
+        'N° BL': 'TEXT', 'N° Cde': 'TEXT', 'Famille article': 'TEXT', 'ERP': 'TEXT',
+    },
+    'achats': {
+        'Code fournisseur': 'TEXT', 'Raison sociale': 'TEXT', 'Reference achat': 'TEXT',
+        'Bon de commande': 'TEXT', 'date achat': 'TEXT', 'Qté fact': 'REAL', 'Total HT': 'REAL',
+        'Total TTC': 'REAL', 'code article': 'TEXT', 'Désignation': 'TEXT', 'Famille article': 'TEXT',
+        'ERP': 'TEXT',
+    },
+}
+
+# RPC de recherche -> table interrogée.
+RPC_RECHERCHE = {'rechercher_ventes': 'ventes', 'rechercher_achats': 'achats'}
+
+# RPC d'agrégation des requêtes avancées. 'filtres' : paramètre -> (colonne, mode), le mode étant
+# 'egal' (égalité insensible à la casse) ou 'contient'.
+RPC_AGREGATION = {
+    'top_clients_ca': {
+        'table': 'ventes',
+        'selection': '"Code client", "Raison sociale", SUM("Tot HT") AS "CA HT"',
+        'groupe': '"Code client", "Raison sociale"',
+        'ordre': '"CA HT" DESC',
+        'limite': 20,
+        'filtres': {},
+    },
+    'ca_par_client_et_famille': {
+        'table': 'ventes',
+        'selection': '"Code client", "Raison sociale", "Famille article", SUM("Tot HT") AS "CA HT"',
+        'groupe': '"Code client", "Raison sociale", "Famille article"',
+        'ordre': '"Code client", "CA HT" DESC',
+        'filtres': {'p_code_client': ('Code client', 'egal')},
+    },
+    'ca_par_periode': {
+        'table': 'ventes',
+        'selection': 'substr("Date BL", 1, 7) AS "Mois", SUM("Tot HT") AS "CA HT"',
+        'groupe': '"Mois"',
+        'ordre': '"Mois"',
+        'filtres': {'p_code_client': ('Code client', 'egal'), 'p_code_famille': ('Famille article', 'egal')},
+    },
+    'top_articles_par_client': {
+        'table': 'ventes',
+        'selection': '"Code client", "Raison sociale", "code article", "Désignation",'
+                     ' SUM("Qté fact") AS "Quantité", SUM("Tot HT") AS "CA HT"',
+        'groupe': '"Code client", "Raison sociale", "code article", "Désignation"',
+        'ordre': '"Code client", "Quantité" DESC',
+        'filtres': {'p_code_client': ('Code client', 'egal'), 'p_code_famille': ('Famille article', 'egal')},
+    },
+    'top_fournisseurs_total': {
+        'table': 'achats',
+        'selection': '"Code fournisseur", "Raison sociale", SUM("Total HT") AS "Montant HT"',
+        'groupe': '"Code fournisseur", "Raison sociale"',
+        'ordre': '"Montant HT" DESC',
+        'limite': 20,
+        'filtres': {'code_article': ('code article', 'egal')},
+    },
+    'evolution_achats_mensuels': {
+        'table': 'achats',
+        'selection': 'substr("date achat", 1, 7) AS "Mois", SUM("Total HT") AS "Montant HT"',
+        'groupe': '"Mois"',
+        'ordre': '"Mois"',
+        'filtres': {'p_code_fournisseur': ('Code fournisseur', 'egal')},
+    },
+    'articles_plus_achetes': {
+        'table': 'achats',
+        'selection': '"code article", "Désignation", SUM("Qté fact") AS "Quantité", SUM("Total HT") AS "Montant HT"',
+        'groupe': '"code article", "Désignation"',
+        'ordre': '"Quantité" DESC',
+        'limite': 20,
+        'filtres': {'raison_sociale': ('Raison sociale', 'contient')},
+    },
+    'top_articles_par_client_achats': {
+        'table': 'achats',
+        'selection': '"Code fournisseur", "Raison sociale", "code article", "Désignation",'
+                     ' SUM("Qté fact") AS "Quantité", SUM("Total HT") AS "Montant HT"',
+        'groupe': '"Code fournisseur", "Raison sociale", "code article", "Désignation"',
+        'ordre': '"Code fournisseur", "Quantité" DESC',
+        'filtres': {'p_code_fournisseur': ('Code fournisseur', 'egal'), 'p_code_famille': ('Famille article', 'egal')},
+    },
+}
+
+COLONNES_UTILISATEURS_BOOLEENNES = ('actif', 'confirmed', 'is_protected')
+# Valeurs par défaut des colonnes de la table des comptes (les autres colonnes sont NULL par défaut).
+VALEURS_DEFAUT_UTILISATEUR = {'role': 'user', 'actif': True, 'confirmed': False, 'is_protected': False}
+
+
+def _identifiant(nom: str) -> str:
+    """Protège un nom de colonne pour l'insérer dans une requête SQL."""
+    return '"' + nom.replace('"', '""') + '"'
+
+
+def _motif_like(valeur) -> str:
+    texte = str(valeur).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{texte}%'
+
+
+def sql_agregation(nom_rpc: str, definition: dict, params: dict, colonne_date: str) -> tuple:
+    """
+    Traduit une RPC d'agrégation (définition au format de RPC_AGREGATION) en requête SQL.
+    Retourne (requête, valeurs des paramètres).
+    """
+    table = definition['table']
+    conditions, valeurs = SourceSQLite._conditions_dates(colonne_date, params)
+    for parametre, valeur in params.items():
+        if parametre in ('p_date_debut', 'p_date_fin'):
+            continue
+        if parametre not in definition['filtres']:
+            raise ValueError(f"Paramètre inconnu pour la RPC '{nom_rpc}' : '{parametre}'.")
+        colonne, mode = definition['filtres'][parametre]
+        if mode == 'egal':
+            conditions.append(f'lower({_identifiant(colonne)}) = lower(?)')
+            valeurs.append(str(valeur))
+        else:
+            conditions.append(f"{_identifiant(colonne)} LIKE ? ESCAPE '\\'")
+            valeurs.append(_motif_like(valeur))
+    sql = (f'SELECT {definition["selection"]} FROM {table} WHERE {" AND ".join(conditions) or "1"}'
+           f' GROUP BY {definition["groupe"]} ORDER BY {definition["ordre"]}')
+    if definition.get('limite'):
+        sql += f' LIMIT {int(definition["limite"])}'
+    return sql, valeurs
+
+
+class SourceSQLite(SourceDonnees):
+    """
+    Source de données locale : une base SQLite contenant les tables ventes, achats et users.
+    Les RPC sont traduites en requêtes SQL équivalentes (mêmes paramètres, mêmes colonnes renvoyées).
+    Comme LIKE en SQLite, la recherche 'contient' n'ignore la casse que pour les caractères ASCII.
+    """
+
+    def __init__(self, chemin: str):
+        self.chemin = chemin
+        self.initialiser()
+
+    @contextmanager
+    def _connexion(self):
+        # Une connexion par opération : simple et sûr entre threads.
+        connexion = sqlite3.connect(self.chemin, timeout=5)
+        connexion.row_factory = sqlite3.Row
+        try:
+            with connexion:
+                yield connexion
+        finally:
+            connexion.close()
+
+    def initialiser(self):
+        """Crée les tables et les index s'ils n'existent pas encore."""
+        with self._connexion() as connexion:
+            connexion.execute("PRAGMA journal_mode=WAL")
+            for type_transaction, colonnes in COLONNES_TRANSACTIONS.items():
+                definition = ', '.join(f'{_identifiant(nom)} {type_sql}' for nom, type_sql in colonnes.items())
+                connexion.execute(f'CREATE TABLE IF NOT EXISTS {type_transaction} ({definition})')
+                colonne_date, colonne_document, colonne_departage = COLONNES_TRI[type_transaction]
+                connexion.execute(
+                    f'CREATE INDEX IF NOT EXISTS idx_{type_transaction}_curseur ON {type_transaction} '
+                    f'({_identifiant(colonne_date)}, {_identifiant(colonne_document)}, {_identifiant(colonne_departage)})'
+                )
+            connexion.execute('CREATE INDEX IF NOT EXISTS idx_ventes_client ON ventes ("Code client")')
+            connexion.execute('CREATE INDEX IF NOT EXISTS idx_achats_fournisseur ON achats ("Code fournisseur")')
+            connexion.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLE_UTILISATEURS} ("
+                " email TEXT PRIMARY KEY, nom TEXT, password_hash TEXT, role TEXT NOT NULL DEFAULT 'user',"
+                " actif INTEGER NOT NULL DEFAULT 1, confirmed INTEGER NOT NULL DEFAULT 0,"
+                " is_protected INTEGER NOT NULL DEFAULT 0, microsoft_id TEXT, recovery_code TEXT, updated_at TEXT)"
+            )
+            # Bases créées avant l'ajout de la révision des comptes
+            colonnes = {ligne['name'] for ligne in connexion.execute(f'PRAGMA table_info({TABLE_UTILISATEURS})')}
+            if 'updated_at' not in colonnes:
+                connexion.execute(f'ALTER TABLE {TABLE_UTILISATEURS} ADD COLUMN updated_at TEXT')
+            # La révision est attribuée par la base (horloge unique), jamais par l'application.
+            # Le déclencheur de modification ne se relance pas lui-même (recursive_triggers désactivé par défaut).
+            for evenement in ('INSERT', 'UPDATE'):
+                connexion.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS {TABLE_UTILISATEURS}_revision_{evenement.lower()}'
+                    f' AFTER {evenement} ON {TABLE_UTILISATEURS} BEGIN'
+                    f" UPDATE {TABLE_UTILISATEURS} SET updated_at = {REVISION_SQLITE} WHERE email = NEW.email; END"
+                )
+
+    def charger_transactions(self, type_transaction: str, lignes, vider: bool = False) -> int:
+        """Insère des lignes (dictionnaires) dans la table du type de transaction. Retourne le nombre inséré."""
+        colonnes = list(COLONNES_TRANSACTIONS[type_transaction])
+        marques = ', '.join('?' for _ in colonnes)
+        requete = (f'INSERT INTO {type_transaction} ({", ".join(_identifiant(c) for c in colonnes)})'
+                   f' VALUES ({marques})')
+        with self._connexion() as connexion:
+            if vider:
+                connexion.execute(f'DELETE FROM {type_transaction}')
+            curseur = connexion.executemany(requete, ([ligne.get(c) for c in colonnes] for ligne in lignes))
+            return curseur.rowcount
+
+    # --- Traduction des RPC en SQL ---
+
+    def _sql_recherche(self, type_transaction: str, params: dict) -> tuple:
+        colonne_date = COLONNES_TRI[type_transaction][0]
+        colonnes_parametres = COLONNES_PARAMETRES[type_transaction]
+        conditions, valeurs = self._conditions_dates(colonne_date, params)
+        for parametre, valeur in params.items():
+            if parametre in ('p_date_debut', 'p_date_fin'):
+                continue
+            colonne = colonnes_parametres.get(parametre)
+            if colonne is None:
+                raise ValueError(f"Paramètre inconnu pour la RPC de recherche : '{parametre}'.")
+            if parametre == PARAMETRE_QUANTITE:
+                conditions.append(f'{_identifiant(colonne)} = ?')
+                valeurs.append(float(valeur))
+            elif isinstance(valeur, str) and valeur.startswith(PREFIXE_EGALITE):
+                conditions.append(f'lower({_identifiant(colonne)}) = lower(?)')
+                valeurs.append(valeur[len(PREFIXE_EGALITE):])
+            else:
+                conditions.append(f"{_identifiant(colonne)} LIKE ? ESCAPE '\\'")
+                valeurs.append(_motif_like(valeur))
+        return f'SELECT * FROM {type_transaction} WHERE {" AND ".join(conditions) or "1"}', valeurs
+
+    def _sql_agregation(self, nom_rpc: str, params: dict) -> tuple:
+        definition = RPC_AGREGATION[nom_rpc]
+        return sql_agregation(nom_rpc, definition, params, COLONNES_TRI[definition['table']][0])
+
+    @staticmethod
+    def _conditions_dates(colonne_date: str, params: dict) -> tuple:
+        conditions, valeurs = [], []
+        if params.get('p_date_debut'):
+            conditions.append(f'{_identifiant(colonne_date)} >= ?')
+            valeurs.append(params['p_date_debut'])
+        if params.get('p_date_fin'):
+            conditions.append(f'{_identifiant(colonne_date)} < ?')
+            valeurs.append(params['p_date_fin'])
+        return conditions, valeurs
+
+    def _sql_rpc(self, nom_rpc: str, params: dict) -> tuple:
+        if nom_rpc in RPC_RECHERCHE:
+            return self._sql_recherche(RPC_RECHERCHE[nom_rpc], params)
+        if nom_rpc in RPC_AGREGATION:
+            return self._sql_agregation(nom_rpc, params)
+        raise ValueError(f"RPC inconnue : '{nom_rpc}'.")
+
+    def appeler_rpc(self, nom_rpc, params, tri=None, apres=None, limite=None, decalage=0, compter=False):
+        sql, valeurs = self._sql_rpc(nom_rpc, params)
+        requete = f'SELECT * FROM ({sql}) AS resultat'
+        if apres:
+            (colonne_1, valeur_1), (colonne_2, valeur_2) = apres
+            descendant = bool(tri and tri[0][1])
+            operateur = '<' if descendant else '>'
+            colonne_1, colonne_2 = _identifiant(colonne_1), _identifiant(colonne_2)
+            # Les NULL étant triés en dernier (NULLS LAST), ils sont « après » toute valeur.
+            if valeur_2 is None:
+                suite, valeurs_suite = f'{colonne_2} IS NULL', []
+            else:
+                suite, valeurs_suite = f'({colonne_2} {operateur}= ? OR {colonne_2} IS NULL)', [valeur_2]
+            if valeur_1 is None:
+                requete += f' WHERE ({colonne_1} IS NULL AND {suite})'
+                valeurs = valeurs + valeurs_suite
+            else:
+                requete += f' WHERE ({colonne_1} {operateur} ? OR {colonne_1} IS NULL OR ({colonne_1} = ? AND {suite}))'
+                valeurs = valeurs + [valeur_1, valeur_1] + valeurs_suite
+
+        with self._connexion() as connexion:
+            total = None
+            if compter:
+                total = connexion.execute(f'SELECT COUNT(*) FROM ({requete})', valeurs).fetchone()[0]
+            if tri:
+                requete += ' ORDER BY ' + ', '.join(
+                    f'{_identifiant(colonne)} {"DESC" if descendant else "ASC"} NULLS LAST'
+                    for colonne, descendant in tri
+                )
+            requete += ' LIMIT ? OFFSET ?'
+            lignes = connexion.execute(requete, valeurs + [-1 if limite is None else limite, decalage or 0]).fetchall()
+        return {"data": [dict(ligne) for ligne in lignes], "count": total}
+
+    # --- Table des utilisateurs ---
+
+    @staticmethod
+    def _utilisateur(ligne):
+        utilisateur = dict(ligne)
+        for colonne in COLONNES_UTILISATEURS_BOOLEENNES:
+            if colonne in utilisateur and utilisateur[colonne] is not None:
+                utilisateur[colonne] = bool(utilisateur[colonne])
+        return utilisateur
+
+    def trouver_utilisateur(self, colonne, valeur):
+        with self._connexion() as connexion:
+            ligne = connexion.execute(
+                f'SELECT * FROM {TABLE_UTILISATEURS} WHERE {_identifiant(colonne)} = ?', (valeur,)
+            ).fetchone()
+        return self._utilisateur(ligne) if ligne else None
+
+    def lister_utilisateurs(self, colonnes="*", **egalites):
+        selection = '*' if colonnes == '*' else ', '.join(_identifiant(c.strip()) for c in colonnes.split(','))
+        conditions = ' AND '.join(f'{_identifiant(colonne)} = ?' for colonne in egalites) or '1'
+        with self._connexion() as connexion:
+            lignes = connexion.execute(
+                f'SELECT {selection} FROM {TABLE_UTILISATEURS} WHERE {conditions} ORDER BY role DESC, email',
+                list(egalites.values()),
+            ).fetchall()
+        return [self._utilisateur(ligne) for ligne in lignes]
+
+    @staticmethod
+    def _sql_upsert_utilisateur(colonnes: list) -> str:
+        mises_a_jour = ', '.join(f'{_identifiant(c)} = excluded.{_identifiant(c)}' for c in colonnes if c != 'email')
+        return (f'INSERT INTO {TABLE_UTILISATEURS} ({", ".join(_identifiant(c) for c in colonnes)})'
+                f' VALUES ({", ".join("?" for _ in colonnes)})'
+                f' ON CONFLICT(email) DO ' + (f'UPDATE SET {mises_a_jour}' if mises_a_jour else 'NOTHING'))
+
+    def enregistrer_utilisateur(self, donnees):
+        with self._connexion() as connexion:
+            connexion.execute(self._sql_upsert_utilisateur(list(donnees)), list(donnees.values()))
+
+    def modifier_utilisateur(self, email, champs):
+        if not champs:
+            return
+        affectations = ', '.join(f'{_identifiant(c)} = ?' for c in champs)
+        with self._connexion() as connexion:
+            connexion.execute(f'UPDATE {TABLE_UTILISATEURS} SET {affectations} WHERE email = ?',
+                              list(champs.values()) + [email])
+
+    def supprimer_utilisateur(self, email):
+        with self._connexion() as connexion:
+            connexion.execute(f'DELETE FROM {TABLE_UTILISATEURS} WHERE email = ?', (email,))
+
+    def lister_utilisateurs_modifies(self, depuis):
+        with self._connexion() as connexion:
+            lignes = connexion.execute(
+                f'SELECT * FROM {TABLE_UTILISATEURS} WHERE updated_at > ? ORDER BY updated_at', (depuis,)
+            ).fetchall()
+        return [self._utilisateur(ligne) for ligne in lignes]
+
+    def synchroniser_utilisateurs(self, a_enregistrer, a_supprimer):
+        # Une seule transaction : la synchronisation est appliquée entièrement ou pas du tout.
+        with self._connexion() as connexion:
+            for donnees in a_enregistrer:
+                connexion.execute(self._sql_upsert_utilisateur(list(donnees)), list(donnees.values()))
+            connexion.executemany(f'DELETE FROM {TABLE_UTILISATEURS} WHERE email = ?',
+                                  [(email,) for email in a_supprimer])
+
+
+def creer_source_donnees(nom_source: str, client_rpc=None, client_utilisateurs=None, chemin_sqlite: str = None):
+    """Construit la source de données choisie par la configuration ('supabase' ou 'sqlite')."""
+    if (nom_source or 'supabase').lower() == 'sqlite':
+        return SourceSQLite(chemin_sqlite)
+    return SourceSupabase(client_rpc, client_utilisateurs)
+
+
+if __name__ == '__main__':
+    # Initialisation d'une base SQLite locale à partir des données de démonstration ou de données synthétiques.
+    analyseur = argparse.ArgumentParser(description="Initialise une base SQLite locale pour SOURCE_DONNEES=sqlite.")
+    analyseur.add_argument('chemin', help="Chemin du fichier SQLite à créer ou compléter.")
+    analyseur.add_argument('--lignes', type=int, default=0,
+                           help="Nombre de lignes synthétiques par type (0 = données de static/data_demo).")
+    arguments = analyseur.parse_args()
+
+    source = SourceSQLite(arguments.chemin)
+    for type_transaction in TYPES_TRANSACTION:
+        if arguments.lignes:
+            lignes = generer_lignes_synthetiques(type_transaction, arguments.lignes)
+        else:
+            with open(os.path.join(basedir, 'static', 'data_demo', f'data_{type_transaction}.json'),
+                      encoding='utf-8') as f:
+                lignes = json.load(f)
+        nb = source.charger_transactions(type_transaction, lignes, vider=True)
+        print(f"{type_transaction} : {nb} ligne(s) chargée(s) dans {arguments.chemin}")
@@ -23,6 +23,144 @@ function afficherNotification(message, type = 'info', duree = 5000) {
     if (duree > 0) setTimeout(fermerNotif, duree);
 }
 
+// ===================================================================
+// ==== APPELS AUX ROUTES SOUMISES AU CONTRÔLE D'ADMISSION        ====
+// ===================================================================
+// Le serveur répond 429 (avec Retry-After) quand il est saturé : on réessaie après le délai indiqué,
+// au plus 'tentatives' fois, avant de rendre la réponse 429 à l'appelant.
+async function fetchAvecAdmission(url, options, tentatives = 2) {
+    for (let essai = 0; ; essai++) {
+        const reponse = await fetch(url, options);
+        if (reponse.status !== 429 || essai >= tentatives) return reponse;
+        const delai = Math.min(parseInt(reponse.headers.get('Retry-After'), 10) || 2, 30);
+        await new Promise(resolve => setTimeout(resolve, delai * 1000));
+    }
+}
+
+// ===================================================================
+// ==== MAGASIN DE RÉSULTATS (WEB WORKER) ET TABLE VIRTUELLE      ====
+// ===================================================================
+// Interface du Web Worker static/js/worker-resultats.js : chaque demande renvoie une promesse.
+class MagasinResultats {
+    constructor(urlWorker) {
+        this.worker = new Worker(urlWorker);
+        this.demandes = new Map();
+        this.prochainId = 0;
+        this.worker.onmessage = ({ data }) => {
+            const demande = this.demandes.get(data.id);
+            if (!demande) return;
+            this.demandes.delete(data.id);
+            if (data.erreur !== undefined) demande.reject(new Error(data.erreur));
+            else demande.resolve(data.resultat);
+        };
+        // Script introuvable ou erreur non rattrapée : les demandes en attente échouent.
+        this.worker.onerror = (evenement) => {
+            this.demandes.forEach(({ reject }) => reject(new Error(evenement.message || 'Erreur du worker de résultats.')));
+            this.demandes.clear();
+        };
+    }
+
+    demander(action, args = {}) {
+        const id = ++this.prochainId;
+        return new Promise((resolve, reject) => {
+            this.demandes.set(id, { resolve, reject });
+            this.worker.postMessage({ id, action, ...args });
+        });
+    }
+
+    terminer() {
+        this.worker.terminate();
+        this.demandes.clear();
+    }
+}
+
+// Table dont seules les lignes visibles (plus une marge) existent dans le DOM : deux lignes d'espacement
+// donnent au conteneur la hauteur du résultat complet. Les lignes sont lues à la demande par 'lireLignes'
+// et les éléments <tr> sont réutilisés d'un défilement à l'autre.
+class TableVirtuelle {
+    constructor(conteneur, corps, { nbColonnes, lireLignes, remplirLigne, marge = 10 }) {
+        this.conteneur = conteneur;
+        this.corps = corps;
+        this.nbColonnes = nbColonnes;
+        this.lireLignes = lireLignes;
+        this.remplirLigne = remplirLigne;
+        this.marge = marge;
+        this.total = 0;
+        this.hauteurLigne = 0;
+        this.generation = 0;
+        this.planifie = false;
+
+        this.espaceurHaut = this.creerEspaceur();
+        this.espaceurBas = this.creerEspaceur();
+        this.corps.replaceChildren(this.espaceurHaut, this.espaceurBas);
+
+        this.surDefilement = () => {
+            if (this.planifie) return;
+            this.planifie = true;
+            requestAnimationFrame(() => { this.planifie = false; this.rafraichir(); });
+        };
+        this.conteneur.addEventListener('scroll', this.surDefilement, { passive: true });
+        window.addEventListener('resize', this.surDefilement);
+    }
+
+    creerEspaceur() {
+        const tr = document.createElement('tr');
+        tr.className = 'espaceur-virtuel';
+        const td = document.createElement('td');
+        td.colSpan = this.nbColonnes;
+        tr.appendChild(td);
+        return tr;
+    }
+
+    lignesAffichees() {
+        return Array.from(this.corps.children).filter(tr => tr !== this.espaceurHaut && tr !== this.espaceurBas);
+    }
+
+    // À appeler quand la vue change (chargement, filtre, tri) : revient en haut du résultat.
+    definirTotal(total) {
+        this.total = total;
+        this.conteneur.scrollTop = 0;
+        return this.rafraichir();
+    }
+
+    async rafraichir() {
+        const generation = ++this.generation;
+        // Tant qu'aucune ligne n'a été mesurée, on suppose une hauteur pour ne lire qu'une première fenêtre.
+        const hauteur = this.hauteurLigne || 40;
+        const premiere = Math.max(0, Math.floor(this.conteneur.scrollTop / hauteur) - this.marge);
+        // Au premier affichage le conteneur est encore vide : on couvre au moins la hauteur de la fenêtre.
+        const hauteurVue = Math.max(this.conteneur.clientHeight, window.innerHeight);
+        const nbVisibles = Math.ceil(hauteurVue / hauteur) + 2 * this.marge;
+        const derniere = Math.min(this.total, premiere + nbVisibles);
+
+        const lignes = derniere > premiere ? await this.lireLignes(premiere, derniere) : [];
+        // Une réponse dépassée par un défilement plus récent est ignorée.
+        if (generation !== this.generation) return;
+
+        const existantes = this.lignesAffichees();
+        while (existantes.length < lignes.length) {
+            const tr = document.createElement('tr');
+            this.corps.insertBefore(tr, this.espaceurBas);
+            existantes.push(tr);
+        }
+        existantes.splice(lignes.length).forEach(tr => tr.remove());
+        lignes.forEach((ligne, i) => this.remplirLigne(existantes[i], ligne));
+
+        if (!this.hauteurLigne && existantes.length) {
+            this.hauteurLigne = existantes[0].getBoundingClientRect().height || hauteur;
+            if (this.hauteurLigne !== hauteur) return this.rafraichir();
+        }
+        this.espaceurHaut.firstChild.style.height = `${premiere * this.hauteurLigne}px`;
+        this.espaceurBas.firstChild.style.height = `${(this.total - derniere) * this.hauteurLigne}px`;
+    }
+
+    detruire() {
+        this.generation++;
+        this.conteneur.removeEventListener('scroll', this.surDefilement);
+        window.removeEventListener('resize', this.surDefilement);
+    }
+}
+
 // ===================================================================
 // ==== CODE PRINCIPAL AU CHARGEMENT DU DOM                       ====
 // ===================================================================
@@ -627,7 +765,77 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
         // Variables d'état
-        let dataResults = [], filteredData = [], currentPage = 1, pageSize = 15, totalPages = 1, usingDemo = false;
+        let filteredData = [], currentPage = 1, pageSize = 15, totalPages = 1, usingDemo = false;
+
+        // État de la pagination côté serveur (mode réel) : le serveur ne renvoie qu'une page à la fois.
+        // curseursPages[n - 1] contient le curseur permettant de charger la page n.
+        let paginationServeur = false, totalResultats = 0, curseursPages = [null], requeteServeur = null;
+
+        // Mode démonstration : le résultat complet est gardé par un Web Worker (MagasinResultats)
+        // et affiché dans une table virtuelle, triable et filtrable.
+        let magasin = null, tableVirtuelle = null, triCourant = { colonne: null, ordre: 'asc' }, statsColonnes = {};
+
+        const enTeteTableau = document.querySelector('#tableau-en-tete');
+        const corpsTableau = resultsTableBody;
+        const champFiltre = document.getElementById('filtre-resultats');
+
+        // Colonnes affichées pour chaque type de transaction ('format' : date, nombre ou euros ; texte par défaut).
+        const COLONNES_RESULTATS = {
+            achats: [
+                { cle: 'Raison sociale', titre: 'Raison Sociale' },
+                { cle: 'Reference achat', titre: 'Réf. Achat' },
+                { cle: 'Bon de commande', titre: 'Bon de Commande' },
+                { cle: 'date achat', titre: 'Date Achat', format: 'date' },
+                { cle: 'code article', titre: 'Code Article' },
+                { cle: 'Qté fact', titre: 'Qté Fact.', format: 'nombre' },
+                { cle: 'Total HT', titre: 'Total HT', format: 'euros' },
+                { cle: 'Total TTC', titre: 'Total TTC', format: 'euros' },
+                { cle: 'ERP', titre: 'ERP' }
+            ],
+            ventes: [
+                { cle: 'code article', titre: 'Code Article' },
+                { cle: 'Désignation', titre: 'Désignation' },
+                { cle: 'Code client', titre: 'Code Client' },
+                { cle: 'Raison sociale', titre: 'Raison Sociale' },
+                { cle: 'Date BL', titre: 'Date BL', format: 'date' },
+                { cle: 'Qté fact', titre: 'Qté Fact.', format: 'nombre' },
+                { cle: 'Prix Unitaire', titre: 'Prix U.', format: 'euros' },
+                { cle: 'Tot HT', titre: 'Total HT', format: 'euros' },
+                { cle: 'ERP', titre: 'ERP' }
+            ]
+        };
+
+        function colonnesAffichees() {
+            const typeSelectionne = localStorage.getItem('typeTransactionSelection') || 'ventes';
+            return COLONNES_RESULTATS[typeSelectionne] || COLONNES_RESULTATS.ventes;
+        }
+
+        function formaterCellule(valeur, format) {
+            switch (format) {
+                case 'date': return new Date(valeur).toLocaleDateString('fr-FR');
+                case 'nombre': return String(valeur || 0);
+                case 'euros': return `${Number(valeur || 0).toFixed(2)} €`;
+                default: return valeur || 'N/A';
+            }
+        }
+
+        function formaterStats(stats) {
+            if (!stats) return '';
+            const nombre = valeur => valeur.toLocaleString('fr-FR', { maximumFractionDigits: 2 });
+            if (stats.somme === undefined) return `${stats.distinctes} valeur(s) distincte(s)`;
+            return `Min : ${nombre(stats.min)} · Max : ${nombre(stats.max)} · Somme : ${nombre(stats.somme)} · Moyenne : ${nombre(stats.moyenne)}`;
+        }
+
+        // Remplit une ligne du tableau (les cellules existantes sont réutilisées).
+        function remplirLigne(tr, item) {
+            const colonnes = colonnesAffichees();
+            while (tr.cells.length < colonnes.length) tr.insertCell();
+            colonnes.forEach((col, i) => {
+                const td = tr.cells[i];
+                td.className = col.format === 'nombre' || col.format === 'euros' ? 'text-right' : '';
+                td.textContent = formaterCellule(item[col.cle], col.format);
+            });
+        }
 
         function showDemoBanner() {
             if (document.querySelector('.demo-banner')) return;
@@ -638,68 +846,13 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
 
-        // main.js -> dans la PARTIE 2
-
-        function appliquerFiltresPourDemo(donneesBrutes, filtres) {
-            console.log("Filtrage côté client pour le mode DÉMO avec les filtres :", filtres);
-            let resultat = [...donneesBrutes];
-            const typeSelectionne = localStorage.getItem('typeTransactionSelection') || 'ventes';
-
-            // On utilise les mêmes noms de colonnes que dans la base de données
-            const champDate = (typeSelectionne === 'achats') ? 'date achat' : 'Date BL';
-
-            // Logique de filtrage par date (utilise maintenant le bon nom de champ)
-            const syVal = parseInt(filtres.start_year, 10) || 1900;
-            const smVal = parseInt(filtres.start_month, 10) || 1;
-            const eyVal = parseInt(filtres.end_year, 10) || new Date().getFullYear();
-            const emVal = parseInt(filtres.end_month, 10) || 12;
-            const dateDebut = new Date(syVal, smVal - 1, 1);
-
-            // Logique de date de fin corrigée pour inclure tout le mois de fin
-            const dateFin = (emVal === 12) ? new Date(eyVal + 1, 0, 1) : new Date(eyVal, emVal, 1);
-
-            resultat = resultat.filter(item => {
-                if (!item[champDate]) return false;
-                const d = new Date(item[champDate]);
-                return d >= dateDebut && d < dateFin;
-            });
-
-            // Logique de filtrage par champs (cette partie est déjà correcte)
-            const mode = filtres.match_mode || 'all';
-            const filtresValides = (filtres.fields || []).filter(f => f.field && f.value);
-            if (filtresValides.length > 0) {
-                if (mode === 'all') {
-                    filtresValides.forEach(f => {
-                        const val = f.value.toLowerCase();
-                        resultat = resultat.filter(item => {
-                            const cell = String(item[f.field] ?? '').toLowerCase();
-                            if (f.operator === 'contains') return cell.includes(val);
-                            if (f.operator === 'equals') return cell === val;
-                            return cell.startsWith(val);
-                        });
-                    });
-                } else { // 'any'
-                    resultat = resultat.filter(item => filtresValides.some(f => {
-                        const val = f.value.toLowerCase();
-                        const cell = String(item[f.field] ?? '').toLowerCase();
-                        if (f.operator === 'contains') return cell.includes(val);
-                        if (f.operator === 'equals') return cell === val;
-                        return cell.startsWith(val);
-                    }));
-                }
-            }
-
-            console.log(`Filtrage démo terminé. ${resultat.length} résultats trouvés.`);
-            return resultat;
-        }
-
         // main.js
 
         function updateResultCount () {
             const qteResultats = document.getElementById('result-count');
             if (!qteResultats) return; // Sécurité
             
-            const totalResults = filteredData.length;
+            const totalResults = paginationServeur || magasin ? totalResultats : filteredData.length;
 
             if (totalResults > 0) {
             qteResultats.innerHTML = `<h3>${totalResults} résultat${totalResults > 1 ? 's' : ''}</h3>`;
@@ -709,102 +862,185 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
 
-        function renderTable() {
-            const enTeteTableau = document.querySelector('#tableau-en-tete');
-            const corpsTableau = document.querySelector('#tableau-corps');
+        function renderEnTete() {
+            if (!enTeteTableau) return; // Sécurité
+            enTeteTableau.replaceChildren(...colonnesAffichees().map(col => {
+                const th = document.createElement('th');
+                th.textContent = col.titre;
+                if (col.format === 'nombre' || col.format === 'euros') th.className = 'text-right';
+                if (magasin) {
+                    // Mode démonstration : un clic sur l'en-tête trie le résultat (dans le worker).
+                    th.classList.add('triable');
+                    if (triCourant.colonne === col.cle) th.dataset.tri = triCourant.ordre;
+                    th.title = formaterStats(statsColonnes[col.cle]);
+                    th.addEventListener('click', () => trierPar(col.cle));
+                }
+                return th;
+            }));
+        }
 
-            // On vide le contenu précédent
+        function renderTable() {
             if (!enTeteTableau || !corpsTableau) return; // Sécurité
-            enTeteTableau.innerHTML = '';
-            corpsTableau.innerHTML = '';
-
-            const typeSelectionne = localStorage.getItem('typeTransactionSelection') || 'ventes';
-            const start = (currentPage - 1) * pageSize;
-            const donneesPage = filteredData.slice(start, start + pageSize);
-
-            // --- DÉBOGAGE UTILE ---
-            if (donneesPage.length > 0) {
-                console.log("Structure du premier objet à afficher:", donneesPage[0]);
-            }
-            // ----------------------
+            // En mode démonstration, la table virtuelle gère elle-même l'affichage.
+            if (magasin) return;
+            renderEnTete();
 
-            if (donneesPage.length === 0) {
+            // En pagination serveur, filteredData contient uniquement la page courante.
+            if (filteredData.length === 0) {
                 corpsTableau.innerHTML = `<tr><td colspan="10" class="text-center">Aucun résultat à afficher.</td></tr>`;
                 return;
             }
 
-            if (typeSelectionne === 'achats') {
-                // --- VUE ACHATS (CORRIGÉE) ---
-                enTeteTableau.innerHTML = `
-            <th>Raison Sociale</th>
-            <th>Réf. Achat</th>
-            <th>Bon de Commande</th>
-            <th>Date Achat</th>
-            <th>Code Article</th>
-            <th class="text-right">Qté Fact.</th>
-            <th class="text-right">Total HT</th>
-            <th class="text-right">Total TTC</th>
-            <th>ERP</th>
-        `;
-
-                donneesPage.forEach(item => {
-                    const tr = document.createElement('tr');
-                    tr.innerHTML = `
-                <td>${item['Raison sociale'] || 'N/A'}</td>
-                <td>${item['Reference achat'] || 'N/A'}</td>
-                <td>${item['Bon de commande'] || 'N/A'}</td>
-                <td>${new Date(item['date achat']).toLocaleDateString('fr-FR')}</td>
-                <td>${item['code article'] || 'N/A'}</td>
-                <td class="text-right">${item['Qté fact'] || 0}</td>
-                <td class="text-right">${(item['Total HT'] || 0).toFixed(2)} €</td>
-                <td class="text-right">${(item['Total TTC'] || 0).toFixed(2)} €</td>
-                <td>${item['ERP'] || 'N/A'}</td>
-            `;
-                    corpsTableau.appendChild(tr);
-                });
-
-            } else { // 'ventes'
-                // --- VUE VENTES (CORRIGÉE) ---
-                enTeteTableau.innerHTML = `
-            <th>Code Article</th>
-            <th>Désignation</th>
-            <th>Code Client</th>
-            <th>Raison Sociale</th>
-            <th>Date BL</th>
-            <th class="text-right">Qté Fact.</th>
-            <th class="text-right">Prix U.</th>
-            <th class="text-right">Total HT</th>
-            <th>ERP</th>
-        `;
-
-                donneesPage.forEach(item => {
-                    const tr = document.createElement('tr');
-                    tr.innerHTML = `
-                <td>${item['code article'] || 'N/A'}</td>
-                <td>${item['Désignation'] || 'N/A'}</td>
-                <td>${item['Code client'] || 'N/A'}</td>
-                <td>${item['Raison sociale'] || 'N/A'}</td>
-                <td>${new Date(item['Date BL']).toLocaleDateString('fr-FR')}</td>
-                <td class="text-right">${item['Qté fact'] || 0}</td>
-                <td class="text-right">${(item['Prix Unitaire'] || 0).toFixed(2)} €</td>
-                <td class="text-right">${(item['Tot HT'] || 0).toFixed(2)} €</td>
-                <td>${item['ERP'] || 'N/A'}</td>
-            `;
-                    corpsTableau.appendChild(tr);
-                });
-            }
+            // Les lignes de la page précédente sont réutilisées : seul leur contenu change.
+            corpsTableau.querySelectorAll('tr:not(.ligne-resultat)').forEach(tr => tr.remove());
+            const existantes = Array.from(corpsTableau.rows);
+            filteredData.forEach((item, i) => {
+                let tr = existantes[i];
+                if (!tr) {
+                    tr = corpsTableau.insertRow();
+                    tr.className = 'ligne-resultat';
+                }
+                remplirLigne(tr, item);
+            });
+            existantes.slice(filteredData.length).forEach(tr => tr.remove());
         }
 
         function updatePagination() {
-            totalPages = Math.max(1, Math.ceil(filteredData.length / pageSize));
+            const barrePagination = document.querySelector('.pagination');
+            if (barrePagination) barrePagination.hidden = Boolean(magasin); // La table virtuelle défile sans pages.
+            if (paginationServeur) {
+                // Si le total n'est pas connu, on se fie à la présence d'un curseur pour la page suivante.
+                totalPages = totalResultats
+                    ? Math.max(1, Math.ceil(totalResultats / pageSize))
+                    : currentPage + (curseursPages[currentPage] ? 1 : 0);
+            } else {
+                totalPages = Math.max(1, Math.ceil(filteredData.length / pageSize));
+            }
             currentPage = Math.min(currentPage, totalPages);
             pageNumSpan.textContent = `${currentPage} / ${totalPages}`;
             btnPrev.disabled = currentPage === 1;
             btnNext.disabled = currentPage >= totalPages;
         }
 
+        // --- Mode démonstration : magasin de résultats dans un Web Worker + table virtuelle ---
+
+        // Affiche la vue courante du magasin (après chargement, filtre ou tri).
+        async function rafraichirVue(total, avecStats = true) {
+            totalResultats = total;
+            updateResultCount();
+            await tableVirtuelle.definirTotal(total);
+            if (avecStats) {
+                statsColonnes = await magasin.demander('stats', { colonnes: colonnesAffichees().map(col => col.cle) });
+                renderEnTete();
+            }
+        }
+
+        async function trierPar(colonne) {
+            triCourant = {
+                colonne,
+                ordre: triCourant.colonne === colonne && triCourant.ordre === 'asc' ? 'desc' : 'asc'
+            };
+            const { total } = await magasin.demander('trier', triCourant);
+            renderEnTete();
+            await rafraichirVue(total, false);
+        }
+
+        // Charge le résultat complet dans le worker (le thread principal ne reçoit que les lignes visibles).
+        async function chargerDansMagasin(url, options) {
+            if (magasin) magasin.terminer();
+            if (tableVirtuelle) tableVirtuelle.detruire();
+            magasin = new MagasinResultats(window.WORKER_RESULTATS_URL);
+            triCourant = { colonne: null, ordre: 'asc' };
+            statsColonnes = {};
+            try {
+                // Le worker résout les URL relatives par rapport à son propre script : on lui passe une URL absolue.
+                const { total } = await magasin.demander('charger', { url: new URL(url, window.location.origin).href, options });
+                const conteneur = corpsTableau.closest('.conteneur-defilement');
+                conteneur.classList.add('defilement-virtuel');
+                tableVirtuelle = new TableVirtuelle(conteneur, corpsTableau, {
+                    nbColonnes: colonnesAffichees().length,
+                    lireLignes: (debut, fin) => magasin.demander('lignes', { debut, fin }),
+                    remplirLigne
+                });
+                if (champFiltre) champFiltre.hidden = false;
+                renderEnTete();
+                return total;
+            } catch (err) {
+                magasin.terminer();
+                magasin = null;
+                throw err;
+            }
+        }
+
+        if (champFiltre) {
+            let delaiFiltre = null;
+            champFiltre.addEventListener('input', () => {
+                clearTimeout(delaiFiltre);
+                delaiFiltre = setTimeout(async () => {
+                    if (!magasin) return;
+                    const { total } = await magasin.demander('filtrer', {
+                        texte: champFiltre.value,
+                        colonnes: colonnesAffichees().map(col => col.cle)
+                    });
+                    await rafraichirVue(total);
+                }, 250);
+            });
+        }
 
 
+
+        // Charge une seule page depuis /api/query en mode paginé (curseur keyset).
+        async function chargerPageServeur(numeroPage) {
+            const res = await fetchAvecAdmission('/api/query', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    ...requeteServeur,
+                    pagination: {
+                        taille_page: pageSize,
+                        ordre: 'desc',
+                        curseur: curseursPages[numeroPage - 1],
+                        avec_total: numeroPage === 1
+                    }
+                })
+            });
+
+            if (res.status === 429) {
+                // Serveur saturé : ce n'est pas une indisponibilité de l'API, on ne bascule pas en démo.
+                const erreur = new Error((await res.json()).erreur);
+                erreur.saturation = true;
+                throw erreur;
+            }
+            if (!res.ok) {
+                throw new Error(`API réelle non disponible (${res.status})`);
+            }
+
+            const page = await res.json();
+            filteredData = page.lignes || [];
+            if (page.total !== null && page.total !== undefined) {
+                totalResultats = page.total;
+            }
+            curseursPages[numeroPage] = page.curseur_suivant;
+            currentPage = numeroPage;
+        }
+
+        async function changerPage(numeroPage) {
+            if (!paginationServeur) {
+                currentPage = numeroPage;
+            } else {
+                try {
+                    await chargerPageServeur(numeroPage);
+                } catch (err) {
+                    console.error('❌ Erreur lors du chargement de la page :', err);
+                    afficherNotification(`Erreur lors du chargement de la page : ${err.message}`, 'error');
+                    return;
+                }
+            }
+            renderTable();
+            updatePagination();
+            updateResultCount();
+        }
+
         async function chargerEtAfficherDonnees() {
             console.log('▶️ Lancement du chargement et de l\'affichage des données...');
 
@@ -843,40 +1079,47 @@ document.addEventListener('DOMContentLoaded', () => {
             try {
                 console.log("Essai de l'API réelle (/api/query) avec les filtres enrichis :", filtresEnrichis);
 
-                const res = await fetch('/api/query', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        type_transaction: typeSelectionne,
-                        filtres: filtresEnrichis // On envoie l'objet enrichi
-                    })
-                });
-
-                if (!res.ok) {
-                    throw new Error(`API réelle non disponible (${res.status})`);
-                }
+                requeteServeur = {
+                    type_transaction: typeSelectionne,
+                    filtres: filtresEnrichis // On envoie l'objet enrichi
+                };
+                curseursPages = [null];
+                totalResultats = 0;
+                paginationServeur = true;
+                await chargerPageServeur(1);
 
-                filteredData = await res.json();
                 usingDemo = false;
-                console.log(`✅ Données réelles (déjà filtrées par le serveur) chargées : ${filteredData.length} lignes.`);
+                console.log(`✅ Première page des données réelles chargée : ${filteredData.length} ligne(s) sur ${totalResultats}.`);
 
             } catch (err) {
+                if (err.saturation) {
+                    afficherNotification(err.message, 'error');
+                    filteredData = [];
+                    currentPage = 1;
+                    updatePagination();
+                    renderTable();
+                    updateResultCount();
+                    return;
+                }
                 // --- ÉTAPE 3: En cas d'échec, basculer en mode démonstration ---
                 console.warn(`${err.message}. Basculement sur les données de démonstration.`);
+                paginationServeur = false;
                 usingDemo = true;
                 showDemoBanner();
 
                 try {
-                    const resDemo = await fetch(`/demo/${typeSelectionne}`);
-                    if (!resDemo.ok) {
-                        throw new Error(`Fichier de démo non trouvé`);
-                    }
-
-                    const demoDataBrutes = await resDemo.json();
-                    console.log(`✅ Données de démo chargées (${demoDataBrutes.length} lignes brutes).`);
-
-                    // On utilise la fonction de filtrage JS avec les mêmes filtres enrichis
-                    filteredData = appliquerFiltresPourDemo(demoDataBrutes, filtresEnrichis);
+                    // Les données de démo sont filtrées côté serveur, avec la même logique que l'API réelle.
+                    // Le résultat complet est téléchargé et gardé par le worker, hors du thread principal.
+                    const total = await chargerDansMagasin(`/demo/${typeSelectionne}`, {
+                        method: 'POST',
+                        credentials: 'same-origin',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({ filtres: filtresEnrichis })
+                    });
+                    console.log(`✅ Données de démo chargées (${total} lignes filtrées).`);
+                    updatePagination();
+                    await rafraichirVue(total);
+                    return;
 
                 } catch (demoErr) {
                     console.error('❌ ERREUR CRITIQUE en mode démo :', demoErr.message);
@@ -891,8 +1134,48 @@ document.addEventListener('DOMContentLoaded', () => {
             updateResultCount();
         }
 
-        btnPrev.addEventListener('click', () => { if (currentPage > 1) { currentPage--; renderTable(); updatePagination(); updateResultCount();} });
-        btnNext.addEventListener('click', () => { if (currentPage < totalPages) { currentPage++; renderTable(); updatePagination(); updateResultCount();} });
+        btnPrev.addEventListener('click', () => { if (currentPage > 1) changerPage(currentPage - 1); });
+        btnNext.addEventListener('click', () => { if (currentPage < totalPages) changerPage(currentPage + 1); });
+
+        // Export asynchrone : on crée une tâche côté serveur, on suit sa progression,
+        // puis on télécharge le fichier produit (évite le délai maximal d'une requête).
+        async function exporterViaTache(typeSelectionne, format, filtres) {
+            const reponse = await fetch(`/api/${typeSelectionne}/export`, {
+                method: 'POST',
+                credentials: 'same-origin',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ format, filtres })
+            });
+            if (!reponse.ok) {
+                // 429 : trop d'exports en cours (le message du serveur indique quoi faire).
+                const erreur = await reponse.json().catch(() => ({}));
+                throw new Error(erreur.erreur || `Impossible de lancer l'export (${reponse.status})`);
+            }
+            let tache = await reponse.json();
+
+            while (tache.statut === 'en_attente' || tache.statut === 'en_cours') {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const reponseStatut = await fetch(`/api/exports/${tache.id}`, { credentials: 'same-origin' });
+                if (!reponseStatut.ok) {
+                    throw new Error(`Suivi de l'export impossible (${reponseStatut.status})`);
+                }
+                tache = await reponseStatut.json();
+                btnDownload.textContent = tache.pourcentage !== null
+                    ? `Génération... ${tache.pourcentage} %`
+                    : `Génération... ${tache.lignes_traitees} lignes`;
+            }
+
+            if (tache.statut !== 'terminee') {
+                throw new Error(tache.erreur || "L'export a échoué.");
+            }
+
+            // Le navigateur télécharge directement le fichier (en-tête Content-Disposition).
+            const lien = document.createElement('a');
+            lien.href = `/api/exports/${tache.id}/fichier`;
+            document.body.appendChild(lien);
+            lien.click();
+            document.body.removeChild(lien);
+        }
 
         btnDownload.addEventListener('click', async () => {
             const texteOriginal = btnDownload.textContent;
@@ -902,13 +1185,19 @@ document.addEventListener('DOMContentLoaded', () => {
                 const format = document.querySelector('input[name="download_format"]:checked').value;
                 const filtres = JSON.parse(localStorage.getItem(storageKeyForFilters) || '{}');
                 const typeSelectionne = localStorage.getItem('typeTransactionSelection') || 'ventes';
+
+                if (!usingDemo && pageType === 'resultats-simples') {
+                    await exporterViaTache(typeSelectionne, format, filtres);
+                    return;
+                }
+
                 const downloadUrl = usingDemo
                     ? `/demo/${typeSelectionne}/download`
                     : `/api/${typeSelectionne}/download`;
 
                 console.log(`▶️ Appel de la route de téléchargement : ${downloadUrl}`);
 
-                const reponse = await fetch(downloadUrl, {
+                const reponse = await fetchAvecAdmission(downloadUrl, {
                     method: 'POST',
                     credentials: 'same-origin',
                     headers: { 'Content-Type': 'application/json' },
@@ -971,18 +1260,39 @@ document.addEventListener('DOMContentLoaded', () => {
         const btnRegenererModal = document.getElementById('btn-modal-regenerer');
         let listeUtilisateurs = [];
 
-        // --- Fonctions API (inchangées) ---
+        let revisionComptes = null; // Révision de la dernière liste reçue (synchronisation incrémentale)
+
+        // --- Fonctions API ---
         async function chargerComptes() {
             try {
                 const reponse = await fetch('/admin/api/comptes');
                 if (!reponse.ok) throw new Error(`Erreur réseau: ${reponse.status}`);
                 listeUtilisateurs = await reponse.json();
+                revisionComptes = reponse.headers.get('X-Revision');
                 redessinerTableau();
             } catch (erreur) {
                 corpsTableau.innerHTML = `<tr><td colspan="5">Erreur lors du chargement des données.</td></tr>`;
                 console.error(erreur);
             }
         }
+        // Ne récupère que les comptes modifiés depuis la dernière révision, et ne redessine que leurs lignes.
+        async function rafraichirComptes() {
+            if (revisionComptes === null) return chargerComptes();
+            try {
+                const reponse = await fetch(`/admin/api/comptes?since=${encodeURIComponent(revisionComptes)}`);
+                if (!reponse.ok) throw new Error(`Erreur réseau: ${reponse.status}`);
+                const delta = await reponse.json();
+                const emailsExistants = new Set(delta.emails);
+                listeUtilisateurs
+                    .filter(u => !emailsExistants.has(u.email))
+                    .forEach(u => corpsTableau.querySelector(`tr[data-email-utilisateur="${CSS.escape(u.email)}"]`)?.remove());
+                listeUtilisateurs = listeUtilisateurs.filter(u => emailsExistants.has(u.email));
+                delta.modifies.forEach(remplacerUtilisateur);
+                revisionComptes = delta.revision;
+            } catch (erreur) {
+                console.error(erreur);
+            }
+        }
         async function sauvegarderComptes(utilisateurs) {
             try {
                 const reponse = await fetch('/admin/api/comptes', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(utilisateurs) });
@@ -994,19 +1304,48 @@ document.addEventListener('DOMContentLoaded', () => {
                 return null;
             }
         }
+        // Modification ou suppression d'un seul compte (PATCH / DELETE /admin/api/comptes/<email>).
+        async function envoyerModificationCompte(email, methode, champs) {
+            try {
+                const options = { method: methode };
+                if (champs) {
+                    options.headers = { 'Content-Type': 'application/json' };
+                    options.body = JSON.stringify(champs);
+                }
+                const reponse = await fetch(`/admin/api/comptes/${encodeURIComponent(email)}`, options);
+                const resultat = await reponse.json();
+                if (!reponse.ok) throw new Error(resultat.erreur || `Erreur serveur ${reponse.status}`);
+                return resultat;
+            } catch (erreur) {
+                afficherNotification(erreur.message, 'error');
+                return null;
+            }
+        }
 
         // --- Fonctions UI ---
         function redessinerTableau() {
             corpsTableau.innerHTML = '';
-            listeUtilisateurs.forEach(utilisateur => {
-                const tr = document.createElement('tr');
-                tr.dataset.emailUtilisateur = utilisateur.email;
-                const roleClasse = utilisateur.role === 'admin' ? 'role-admin' : 'role-user';
-                const roleTexte = utilisateur.role === 'admin' ? 'Admin' : 'Utilisateur';
-                const estActifCoche = utilisateur.actif ? 'checked' : '';
-                const etatBadgeClasse = utilisateur.actif ? 'badge-succes' : 'badge-erreur';
-                const etatTexte = utilisateur.actif ? 'Actif' : 'Inactif';
-                tr.innerHTML = `
+            listeUtilisateurs.forEach(utilisateur => corpsTableau.appendChild(creerLigneUtilisateur(utilisateur)));
+        }
+
+        // Remplace (ou ajoute) un compte dans la liste locale et redessine uniquement sa ligne.
+        function remplacerUtilisateur(utilisateur) {
+            const ligne = creerLigneUtilisateur(utilisateur);
+            const index = listeUtilisateurs.findIndex(u => u.email === utilisateur.email);
+            const ancienneLigne = corpsTableau.querySelector(`tr[data-email-utilisateur="${CSS.escape(utilisateur.email)}"]`);
+            if (index >= 0) listeUtilisateurs[index] = utilisateur; else listeUtilisateurs.push(utilisateur);
+            if (ancienneLigne) ancienneLigne.replaceWith(ligne); else corpsTableau.appendChild(ligne);
+        }
+
+        function creerLigneUtilisateur(utilisateur) {
+            const tr = document.createElement('tr');
+            tr.dataset.emailUtilisateur = utilisateur.email;
+            const roleClasse = utilisateur.role === 'admin' ? 'role-admin' : 'role-user';
+            const roleTexte = utilisateur.role === 'admin' ? 'Admin' : 'Utilisateur';
+            const estActifCoche = utilisateur.actif ? 'checked' : '';
+            const etatBadgeClasse = utilisateur.actif ? 'badge-succes' : 'badge-erreur';
+            const etatTexte = utilisateur.actif ? 'Actif' : 'Inactif';
+            tr.innerHTML = `
         <td>${utilisateur.email}</td>
         <td class="cellule-etat">
             <span class="${etatBadgeClasse}">${etatTexte}</span>
@@ -1019,8 +1358,7 @@ document.addEventListener('DOMContentLoaded', () => {
         <td><span class="role-badge ${roleClasse}">${roleTexte}</span></td>
         <td><button class="btn-supprimer" title="Supprimer le compte"><i class="fas fa-trash-alt"></i></button></td>
     `;
-                corpsTableau.appendChild(tr);
-            });
+            return tr;
         }
 
 
@@ -1154,9 +1492,9 @@ document.addEventListener('DOMContentLoaded', () => {
                     texteAnnuler: 'x'
                 });
                 if (confirmation) {
-                    listeUtilisateurs = listeUtilisateurs.filter(u => u.email !== emailUtilisateur);
-                    const resultat = await sauvegarderComptes(listeUtilisateurs);
+                    const resultat = await envoyerModificationCompte(emailUtilisateur, 'DELETE');
                     if (resultat && resultat.succes) {
+                        listeUtilisateurs = listeUtilisateurs.filter(u => u.email !== emailUtilisateur);
                         tr.remove();
                         afficherNotification(`Le compte ${emailUtilisateur} a été supprimé.`, 'success');
                     }
@@ -1178,16 +1516,12 @@ document.addEventListener('DOMContentLoaded', () => {
                 interrupteur.checked = true;
                 return;
             }
-            utilisateurCible.actif = interrupteur.checked;
-            const resultat = await sauvegarderComptes(listeUtilisateurs);
+            const resultat = await envoyerModificationCompte(emailUtilisateur, 'PATCH', { actif: interrupteur.checked });
             if (resultat && resultat.succes) {
                 afficherNotification(`Le statut de ${emailUtilisateur} a été mis à jour.`, "success");
-                const badge = tr.querySelector('.cellule-etat span');
-                badge.textContent = utilisateurCible.actif ? 'Actif' : 'Inactif';
-                badge.className = utilisateurCible.actif ? 'badge-succes' : 'badge-erreur';
+                remplacerUtilisateur(resultat.utilisateur);
             } else {
-                interrupteur.checked = !utilisateurCible.actif;
-                utilisateurCible.actif = !utilisateurCible.actif;
+                interrupteur.checked = utilisateurCible.actif;
             }
         });
 
@@ -1209,8 +1543,7 @@ document.addEventListener('DOMContentLoaded', () => {
             const resultat = await sauvegarderComptes(listePourEnvoi);
 
             if (resultat && resultat.succes && resultat.nouvel_utilisateur) {
-                listeUtilisateurs.push(resultat.nouvel_utilisateur);
-                redessinerTableau();
+                remplacerUtilisateur(resultat.nouvel_utilisateur);
                 afficherNotification(resultat.message, "success");
                 formAjouterCompte.reset(); // Ceci va vider le champ email
                 champEmail.focus(); // On peut garder cette ligne si on veut que le curseur retourne au champ
@@ -1219,6 +1552,10 @@ document.addEventListener('DOMContentLoaded', () => {
 
         // --- Appel initial ---
         chargerComptes();
+        // Au retour sur l'onglet, on ne récupère que les comptes modifiés entre-temps.
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'visible') rafraichirComptes();
+        });
     }
 
 
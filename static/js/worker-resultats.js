@@ -0,0 +1,125 @@
+// worker-resultats.js
+// Magasin des résultats chargés en entier dans le navigateur (mode démonstration), exécuté dans un Web Worker :
+// le téléchargement, le décodage JSON, le filtrage, le tri et les statistiques des colonnes se font hors
+// du thread principal, qui ne demande que les lignes visibles (voir MagasinResultats et TableVirtuelle dans main.js).
+//
+// Protocole : le thread principal envoie { id, action, ...arguments } et reçoit { id, resultat } ou { id, erreur }.
+
+let lignes = [];        // Toutes les lignes reçues
+let vue = [];           // Indices des lignes affichées (après filtre et tri)
+let texteFiltre = '';
+let colonnesFiltre = [];
+let tri = null;         // { colonne, ordre: 'asc' | 'desc' }
+
+const collateur = new Intl.Collator('fr', { numeric: true, sensitivity: 'base' });
+
+function comparer(a, b) {
+    // Les valeurs vides sont toujours placées en fin de liste.
+    const videA = a === null || a === undefined || a === '';
+    const videB = b === null || b === undefined || b === '';
+    if (videA || videB) return videA === videB ? 0 : (videA ? 1 : -1);
+    if (typeof a === 'number' && typeof b === 'number') return a - b;
+    return collateur.compare(String(a), String(b));
+}
+
+function appliquerTri() {
+    if (!tri) return;
+    const { colonne, ordre } = tri;
+    const sens = ordre === 'desc' ? -1 : 1;
+    vue.sort((i, j) => {
+        const a = lignes[i][colonne], b = lignes[j][colonne];
+        const videA = a === null || a === undefined || a === '';
+        const videB = b === null || b === undefined || b === '';
+        // Le sens du tri ne s'applique pas aux valeurs vides ; à égalité, l'ordre d'origine est conservé.
+        if (videA || videB) return comparer(a, b) || i - j;
+        return sens * comparer(a, b) || i - j;
+    });
+}
+
+function appliquerFiltre() {
+    const texte = texteFiltre.trim().toLowerCase();
+    vue = [];
+    for (let i = 0; i < lignes.length; i++) {
+        if (!texte || colonnesFiltre.some(col => {
+            const valeur = lignes[i][col];
+            return valeur !== null && valeur !== undefined && String(valeur).toLowerCase().includes(texte);
+        })) {
+            vue.push(i);
+        }
+    }
+    appliquerTri();
+}
+
+const actions = {
+    // Télécharge et décode le résultat complet (la requête est préparée par le thread principal).
+    async charger({ url, options }) {
+        const reponse = await fetch(url, options);
+        if (!reponse.ok) throw new Error(`Chargement impossible (${reponse.status})`);
+        const donnees = await reponse.json();
+        lignes = Array.isArray(donnees) ? donnees : [];
+        texteFiltre = '';
+        tri = null;
+        vue = lignes.map((_, i) => i);
+        return { total: vue.length };
+    },
+
+    // Lignes [debut, fin[ de la vue courante.
+    lignes({ debut, fin }) {
+        return vue.slice(debut, fin).map(i => lignes[i]);
+    },
+
+    // Ne garde que les lignes dont une des colonnes contient le texte (insensible à la casse).
+    filtrer({ texte, colonnes }) {
+        texteFiltre = texte || '';
+        colonnesFiltre = colonnes || [];
+        appliquerFiltre();
+        return { total: vue.length };
+    },
+
+    trier({ colonne, ordre }) {
+        tri = colonne ? { colonne, ordre } : null;
+        if (tri) {
+            appliquerTri();
+        } else {
+            vue.sort((i, j) => i - j);
+        }
+        return { total: vue.length };
+    },
+
+    // Statistiques des colonnes sur la vue courante : min / max / somme / moyenne des colonnes numériques,
+    // nombre de valeurs distinctes des autres.
+    stats({ colonnes }) {
+        const resultat = {};
+        colonnes.forEach(col => {
+            let nb = 0, somme = 0, min = Infinity, max = -Infinity, numerique = true;
+            const distinctes = new Set();
+            for (const i of vue) {
+                const valeur = lignes[i][col];
+                if (valeur === null || valeur === undefined || valeur === '') continue;
+                nb++;
+                if (typeof valeur === 'number') {
+                    somme += valeur;
+                    if (valeur < min) min = valeur;
+                    if (valeur > max) max = valeur;
+                } else {
+                    numerique = false;
+                }
+                distinctes.add(valeur);
+            }
+            resultat[col] = numerique && nb
+                ? { nb, min, max, somme, moyenne: somme / nb }
+                : { nb, distinctes: distinctes.size };
+        });
+        return resultat;
+    }
+};
+
+self.onmessage = async ({ data }) => {
+    const { id, action, ...args } = data;
+    try {
+        const resultat = await actions[action](args);
+        self.postMessage({ id, resultat });
+    } catch (err) {
+        self.postMessage({ id, erreur: err.message });
+    }
+};
@@ -0,0 +1,149 @@
+# taches_export.py
+"""
+Ce fichier gère les exports asynchrones (tâches d'export).
+Un gros export XLSX peut dépasser le délai maximal d'une requête serverless : au lieu de
+le générer pendant la requête, on crée une tâche exécutée par un pool de threads.
+Le client interroge ensuite l'état de la tâche (lignes traitées, pourcentage) puis
+télécharge le fichier produit, conservé sur le disque local jusqu'à son expiration.
+
+Les tâches sont gardées en mémoire : elles ne sont visibles que par l'instance qui les a créées.
+Le nombre de tâches en attente ou en cours est limité par utilisateur (EXPORTS_PAR_UTILISATEUR) et au total
+(EXPORTS_FILE_MAX) : au-delà, la création est refusée (AdmissionRefusee, réponse 429 avec Retry-After).
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from admission import AdmissionRefusee
+from export import MIMETYPES_EXPORT, ecrire_fichier, normaliser_format
+
+EN_ATTENTE = 'en_attente'
+EN_COURS = 'en_cours'
+TERMINEE = 'terminee'
+ERREUR = 'erreur'
+
+
+class TacheExport:
+    """État d'une tâche d'export."""
+
+    def __init__(self, proprietaire: str, format_demande: str):
+        self.id = uuid.uuid4().hex
+        self.proprietaire = proprietaire
+        self.format = format_demande
+        self.statut = EN_ATTENTE
+        self.lignes_traitees = 0
+        self.lignes_totales = None  # Inconnu tant que la source ne l'a pas indiqué
+        self.erreur = None
+        self.chemin_fichier = None
+        self.nom_fichier = f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format_demande}"
+        self.cree_le = time.time()
+        self.termine_le = None
+
+    @property
+    def mimetype(self) -> str:
+        return MIMETYPES_EXPORT[self.format]
+
+    @property
+    def pourcentage(self):
+        if self.statut == TERMINEE:
+            return 100
+        if not self.lignes_totales:
+            return None
+        return min(99, int(self.lignes_traitees * 100 / self.lignes_totales))
+
+    def en_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "statut": self.statut,
+            "format": self.format,
+            "lignes_traitees": self.lignes_traitees,
+            "lignes_totales": self.lignes_totales,
+            "pourcentage": self.pourcentage,
+            "erreur": self.erreur,
+        }
+
+
+class GestionnaireExports:
+    """Crée les tâches d'export, les exécute dans un pool de threads et nettoie les fichiers expirés."""
+
+    def __init__(self, dossier: str, nb_workers: int, duree_conservation: int, par_utilisateur: int = 0,
+                 file_max: int = 0, retry_after: int = 30):
+        self.dossier = dossier
+        self.duree_conservation = duree_conservation
+        # Tâches en attente ou en cours autorisées par utilisateur et au total (0 = sans limite).
+        self.par_utilisateur = par_utilisateur
+        self.file_max = file_max
+        self.retry_after = retry_after
+        self._executeur = ThreadPoolExecutor(max_workers=nb_workers, thread_name_prefix='export')
+        self._taches = {}
+        self._verrou = threading.Lock()
+        os.makedirs(dossier, exist_ok=True)
+
+    def soumettre(self, app, proprietaire: str, format_demande: str, fabrique_lots) -> TacheExport:
+        """
+        Crée et met en file une tâche d'export.
+        'fabrique_lots(tache)' est appelée dans le thread de travail, à l'intérieur d'un contexte
+        d'application, et doit retourner un itérable de lots de lignes. Elle peut renseigner
+        'tache.lignes_totales' dès qu'elle connaît le nombre total de lignes.
+        Lève AdmissionRefusee si l'utilisateur, ou l'ensemble des utilisateurs, a déjà trop de tâches actives.
+        """
+        self.nettoyer()
+        format_demande = normaliser_format(format_demande)
+        tache = TacheExport(proprietaire, format_demande)
+        with self._verrou:
+            actives = [t for t in self._taches.values() if t.statut in (EN_ATTENTE, EN_COURS)]
+            if self.par_utilisateur and sum(t.proprietaire == proprietaire for t in actives) >= self.par_utilisateur:
+                raise AdmissionRefusee("Trop d'exports en cours pour votre compte : attendez la fin des précédents.",
+                                       'exports_utilisateur', self.retry_after)
+            if self.file_max and len(actives) >= self.file_max:
+                raise AdmissionRefusee("Trop d'exports en attente : réessayez dans quelques instants.",
+                                       'exports_file_pleine', self.retry_after)
+            self._taches[tache.id] = tache
+        self._executeur.submit(self._executer, app, tache, fabrique_lots)
+        return tache
+
+    def obtenir(self, id_tache: str, proprietaire: str):
+        """Retourne la tâche si elle existe et appartient à 'proprietaire', sinon None."""
+        self.nettoyer()
+        with self._verrou:
+            tache = self._taches.get(id_tache)
+        if tache is None or tache.proprietaire != proprietaire:
+            return None
+        return tache
+
+    def nettoyer(self):
+        """Supprime les tâches terminées depuis plus longtemps que la durée de conservation."""
+        limite = time.time() - self.duree_conservation
+        with self._verrou:
+            expirees = [t for t in self._taches.values() if t.termine_le and t.termine_le < limite]
+            for tache in expirees:
+                del self._taches[tache.id]
+        for tache in expirees:
+            if tache.chemin_fichier and os.path.exists(tache.chemin_fichier):
+                os.remove(tache.chemin_fichier)
+
+    def _executer(self, app, tache: TacheExport, fabrique_lots):
+        tache.statut = EN_COURS
+        chemin = os.path.join(self.dossier, f"{tache.id}.{tache.format}")
+        try:
+            with app.app_context():
+                ecrire_fichier(self._compter(tache, fabrique_lots(tache)), tache.format, chemin)
+            tache.chemin_fichier = chemin
+            tache.statut = TERMINEE
+        except Exception as e:
+            app.logger.error(f"Échec de la tâche d'export {tache.id} : {e}", exc_info=True)
+            tache.erreur = str(e)
+            tache.statut = ERREUR
+            if os.path.exists(chemin):
+                os.remove(chemin)
+        finally:
+            tache.termine_le = time.time()
+
+    @staticmethod
+    def _compter(tache: TacheExport, lots):
+        for lot in lots:
+            yield lot
+            tache.lignes_traitees += len(lot)
@@ -8,8 +8,11 @@ from itsdangerous import URLSafeTimedSerializer
 import secrets
 import string
 import random
-from supabase import create_client, Client  # On importe le client Supabase
-from supabase.lib.client_options import ClientOptions
+from supabase import Client  # On importe le client Supabase
+from clients_http import pool_http
+from cache import BackendMemoire, CacheResultats
+from config import BaseConfig
+from registre import registre
 
 # ======================================================================
 # == GESTION DE LA BASE DE DONNÉES (MAINTENANT AVEC SUPABASE)         ==
@@ -20,85 +23,130 @@ from supabase.lib.client_options import ClientOptions
 url = os.environ.get("SUPABASE_URL")
 key = os.environ.get("SUPABASE_KEY")
 
-# Options supplémentaires pour le client, en spécifiant le schéma à utiliser
-options = ClientOptions(schema="auth_users")
-# On crée le client en lui passant les options pour qu'il sache dans quel schéma travailler
-supabase: Client = create_client(url, key, options)
+# On crée le client en lui indiquant le schéma dans lequel travailler ("auth_users").
+# Les clients sont des vues sur le pool HTTP partagé (clients_http.py) : un client pour la table
+# des comptes, un autre pour le stockage des PDF (un client ne doit servir qu'à un seul service).
+# Avec une source SQLite locale, Supabase n'est plus indispensable (seul le stockage des PDF l'utilise).
+if BaseConfig.SOURCE_DONNEES.lower() == 'sqlite' and not (url and key):
+    supabase = supabase_stockage = None
+else:
+    supabase: Client = pool_http.supabase(url, key, schema="auth_users")
+    supabase_stockage: Client = pool_http.supabase(url, key)
 
 # Maintenant que le schéma par défaut est configuré, on a seulement besoin du nom de la table
 TABLE_NAME = "users"
 
+def source_utilisateurs():
+    """Source de données de l'application courante : toutes les opérations sur la table des comptes
+    passent par elle, afin de lire les comptes dans la même base que la configuration de l'app."""
+    return current_app.source_donnees
+
+# Cache des fiches utilisateurs pour le user_loader de Flask-Login (une requête Supabase de moins
+# par requête authentifiée). Le TTL est court car chaque instance serverless a son propre cache :
+# une modification faite sur une autre instance n'y est visible qu'après expiration.
+CACHE_UTILISATEURS_TTL = int(os.environ.get("CACHE_UTILISATEURS_TTL", 30))  # en secondes
+cache_utilisateurs = CacheResultats(BackendMemoire(4 * 1024 * 1024), CACHE_UTILISATEURS_TTL)
+
 # --- FONCTIONS DE BASE DE DONNÉES REFACTORISÉES ---
 
 def find_user_by_email(email):
-    """Cherche un utilisateur par son email dans la base de données Supabase."""
-    # .select() demande les colonnes, et .eq() signifie "equals" (égal à)
-    # .execute() envoie la requête. Les données sont dans l'attribut .data
-    response = supabase.table(TABLE_NAME).select("*").eq("email", email).execute()
-    
-    # Si la liste de données n'est pas vide, on retourne le premier (et unique) utilisateur
-    if response.data:
-        return response.data[0]  # Retourne le dictionnaire de l'utilisateur
-    return None
+    """Cherche un utilisateur par son email dans la base de données."""
+    # Retourne le dictionnaire de l'utilisateur, ou None s'il n'existe pas
+    return source_utilisateurs().trouver_utilisateur("email", email)
+
+def find_user_by_email_cached(email):
+    """Comme find_user_by_email, mais en passant par le cache des utilisateurs (TTL court)."""
+    return cache_utilisateurs.obtenir(TABLE_NAME, {"email": email}, lambda: find_user_by_email(email))
+
+def invalidate_user_cache(email):
+    """Retire un utilisateur du cache. À appeler après toute modification de son compte."""
+    if email:
+        cache_utilisateurs.invalider(TABLE_NAME, {"email": email})
 
 def update_user(user_data):
-    """Met à jour un utilisateur existant ou en crée un nouveau dans Supabase avec upsert."""
-    # La fonction 'upsert' de Supabase est parfaite pour ça.
+    """Met à jour un utilisateur existant ou en crée un nouveau avec upsert."""
+    # La fonction 'upsert' est parfaite pour ça.
     # Elle insère si la clé primaire (email) n'existe pas, ou met à jour si elle existe.
     # Pas besoin de vérifier d'abord si l'utilisateur existe.
     
-    # On s'assure que les booléens sont bien True/False et non 1/0
-    if 'is_protected' in user_data:
-        user_data['is_protected'] = bool(user_data['is_protected'])
-    if 'actif' in user_data:
-        user_data['actif'] = bool(user_data['actif'])
-    if 'confirmed' in user_data:
-        user_data['confirmed'] = bool(user_data['confirmed'])
+    normaliser_booleens(user_data)
+    sans_revision(user_data)
+    source_utilisateurs().enregistrer_utilisateur(user_data)
+    invalidate_user_cache(user_data.get('email'))
+
+def normaliser_booleens(user_data):
+    """On s'assure que les booléens sont bien True/False et non 1/0."""
+    for colonne in ('is_protected', 'actif', 'confirmed'):
+        if colonne in user_data:
+            user_data[colonne] = bool(user_data[colonne])
+    return user_data
+
+def sans_revision(user_data):
+    """
+    Retire 'updated_at' (révision du compte) des données à écrire : c'est la base qui l'attribue
+    à chaque insertion ou modification, avec sa propre horloge (voir le README et SourceSQLite).
+    Une horloge unique garde les révisions ordonnées quel que soit l'instance qui écrit,
+    ce dont dépendent l'ETag et la synchronisation incrémentale (?since=) de la gestion des comptes.
+    """
+    user_data.pop('updated_at', None)
+    return user_data
 
-    supabase.table(TABLE_NAME).upsert(user_data).execute()
+def sync_users(users_to_save, emails_to_delete):
+    """
+    Applique en bloc les ajouts/modifications et les suppressions de comptes :
+    un seul upsert groupé et une seule suppression groupée, au lieu d'un appel par compte.
+    """
+    users_to_save = [sans_revision(normaliser_booleens(user_data)) for user_data in users_to_save]
+    source_utilisateurs().synchroniser_utilisateurs(users_to_save, list(emails_to_delete))
+    for email in [u.get('email') for u in users_to_save] + list(emails_to_delete):
+        invalidate_user_cache(email)
 
 def get_whitelist():
-    """Récupère la liste de tous les emails de Supabase pour l'utiliser comme whitelist."""
+    """Récupère la liste de tous les emails pour l'utiliser comme whitelist."""
     # On sélectionne uniquement la colonne 'email'
-    response = supabase.table(TABLE_NAME).select("email").execute()
-    if response.data:
-        return [user['email'] for user in response.data]
-    return []
+    return [user['email'] for user in source_utilisateurs().lister_utilisateurs("email")]
 
 def delete_user(email):
-    """Supprime un utilisateur de Supabase par son email."""
-    supabase.table(TABLE_NAME).delete().eq("email", email).execute()
+    """Supprime un utilisateur par son email."""
+    source_utilisateurs().supprimer_utilisateur(email)
+    invalidate_user_cache(email)
 
 def get_all_users():
-    """Récupère tous les utilisateurs de la base de données Supabase."""
-    response = supabase.table(TABLE_NAME).select("*").order("role", desc=True).order("email").execute()
-    return response.data
+    """Récupère tous les utilisateurs de la base de données (administrateurs d'abord)."""
+    return source_utilisateurs().lister_utilisateurs()
+
+def patch_user(email, fields):
+    """Modifie seulement les colonnes 'fields' d'un utilisateur (la base met à jour sa révision)."""
+    source_utilisateurs().modifier_utilisateur(email, sans_revision(normaliser_booleens(dict(fields))))
+    invalidate_user_cache(email)
+
+def get_users_revisions():
+    """Récupère seulement l'e-mail et la révision ('updated_at') de chaque utilisateur (lecture légère)."""
+    return source_utilisateurs().lister_utilisateurs("email,updated_at")
+
+def get_users_changed_since(revision):
+    """Récupère les utilisateurs modifiés après la révision donnée."""
+    return source_utilisateurs().lister_utilisateurs_modifies(revision)
 
 def get_protected_admins():
-    """Récupère les e-mails des administrateurs protégés depuis Supabase."""
-    response = supabase.table(TABLE_NAME).select("email").eq("is_protected", True).execute()
-    if response.data:
-        return [admin['email'] for admin in response.data]
-    return []
+    """Récupère les e-mails des administrateurs protégés."""
+    return [admin['email'] for admin in source_utilisateurs().lister_utilisateurs("email", is_protected=True)]
 
 def find_user_by_microsoft_id(microsoft_id: str):
-    """Cherche un utilisateur dans Supabase en utilisant sa colonne microsoft_id."""
+    """Cherche un utilisateur en utilisant sa colonne microsoft_id."""
     if not microsoft_id:
         return None
-    
-    response = supabase.table(TABLE_NAME).select("*").eq("microsoft_id", microsoft_id).execute()
-    
-    if response.data:
-        return response.data[0]
-    return None
+
+    return source_utilisateurs().trouver_utilisateur("microsoft_id", microsoft_id)
 
 def update_user_microsoft_id(user_email: str, microsoft_id: str):
     """Met à jour le champ microsoft_id pour un utilisateur identifié par son e-mail."""
     if not user_email or not microsoft_id:
         return
 
-    # .update() spécifie les données à changer, et .eq() spécifie la clause WHERE
-    supabase.table(TABLE_NAME).update({"microsoft_id": microsoft_id}).eq("email", user_email).execute()
+    # On ne modifie que la colonne microsoft_id de l'utilisateur identifié par son e-mail
+    source_utilisateurs().modifier_utilisateur(user_email, sans_revision({"microsoft_id": microsoft_id}))
+    invalidate_user_cache(user_email)
 
 
 # ======================================================================
@@ -126,5 +174,5 @@ def get_serializer(app=None):
 
 
 def load_guides_data():
-    with open('data/guides.json', 'r', encoding='utf-8') as f:
-        return json.load(f)
\ No newline at end of file
+    """Retourne le contenu de data/guides.json, gardé en mémoire tant que le fichier ne change pas."""
+    return registre.guides()
\ No newline at end of file